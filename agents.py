@@ -1,88 +1,265 @@
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
-from groq import Groq
 import json
 import io
+import time
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout
+from profiling import ColumnProfiler
+from cleaning import clean_column
+from compaction import prune_categories
+from sandbox import exec_generated, get_sandbox
+from cache import default_completion_cache, dataset_fingerprint, ResultCache
+from router import default_intent_router, VISUALIZATION, TEXT
+from semantic_cache import SemanticQuestionCache
+from dataset_profile import get_profile
+from figures import optimize_figure, serialize_figure
+from llm import LLMPool, LLMError, get_llm_pool, estimate_tokens
+from memory import ConversationMemory
+from result_summary import summarize_result
+from tracing import span, traced, current_span, get_tracer
+from sql_backend import QUERY_BACKEND, get_sql_backend, clean_sql
+from rollups import get_rollups
+
+CHART_TIMEOUT_SECONDS = 20  # Per-chart budget for building and validating a dashboard figure
+
+def _run_generated(code, df, outputs, report=None):
+    """
+    Runs LLM-generated code against `df` and returns the first non-None variable
+    named in `outputs`, answering from the dataset's rollups when the code only
+    aggregates a precomputed grouping. Uses the process-pool sandbox when it is enabled.
+    Figures come back downsampled and serialized once; `report` (a dict)
+    receives the size figures and the JSON payload as "figure_json", and
+    "truncated" when the sandbox cut a large frame/series to its first rows.
+    """
+    report = {} if report is None else report
+    # Aggregates over a precomputed grouping are read from the dataset's rollups
+    rollups = get_rollups(df)
+    match = rollups.rewrite(code) if rollups is not None else None
+    if match is not None:
+        rollup_code, rollup_frame = match
+        try:
+            with span("rollup.answer", groups=len(rollup_frame)):
+                return _run_generated(rollup_code, rollup_frame, outputs, report)
+        except Exception as e:
+            print(f"Rollup answer failed, using the full frame: {e}")
+    sandbox = get_sandbox()
+    with span("exec.generated", sandbox=sandbox is not None, code_chars=len(code), rows=len(df)) as s:
+        if sandbox is not None:
+            value = sandbox.run(code, df, outputs, report)
+            if "serialize_seconds" in report:
+                # Serialized inside the worker: recorded from the worker's own timing
+                get_tracer().record("figure.serialize", report["serialize_seconds"], where="sandbox",
+                                    payload_bytes=report["payload_bytes"], repaired=report["repaired"])
+        else:
+            value = _run_local(code, df, outputs, report)
+        s.set(result_type=type(value).__name__, payload_bytes=report.get("payload_bytes"),
+              points_before=report.get("points_before"), points_after=report.get("points_after"))
+        # A filtered categorical column still lists every category of the dataset
+        return prune_categories(value)
+
+def _run_local(code, df, outputs, report):
+    # A shallow copy: code that writes to its `df` copies the written columns instead of changing the session's frame
+    local_vars = exec_generated(code, {'df': df.copy(deep=False), 'pd': pd, 'px': px, 'go': go})
+    for name in outputs:
+        value = local_vars.get(name)
+        if value is not None:
+            if isinstance(value, go.Figure):
+                with span("figure.optimize"):
+                    value, figure_report = optimize_figure(value)
+                with span("figure.serialize", where="local") as s:
+                    value, payload, figure_report["repaired"] = serialize_figure(value)
+                    figure_report["payload_bytes"] = len(payload)
+                    s.set(payload_bytes=len(payload), repaired=figure_report["repaired"])
+                report.update(figure_report, figure_json=payload)
+            return value
+    return None
 
 # --- Base Client ---
 class GroqClient:
-    def __init__(self, api_key):
-        self.client = Groq(api_key=api_key)
+    def __init__(self, api_key, client=None, cache=None, use_cache=True):
+        # `client` can be any object exposing `chat.completions.create` (e.g. a local fake) and
+        # gets its own pool; otherwise the process-wide pooled AsyncGroq client for `api_key` is shared
+        self.pool = LLMPool(client) if client is not None else get_llm_pool(api_key)
         self.model = "moonshotai/kimi-k2-instruct-0905"
+        self.temperature = 0.1  # Low temperature for deterministic code generation
+        self.use_cache = use_cache
+        self.cache = cache if cache is not None else (default_completion_cache() if use_cache else None)
+        self.last_stream_stats = {}
+        self.last_completion_key = None  # Cache key of the last `get_completion` call, if cached
+        self.prompt_stats = {"calls": 0, "cached_calls": 0, "prompt_tokens": 0}  # Since the last reset
 
-    def get_completion(self, prompt, system_message="You are a helpful assistant."):
-        try:
-            chat_completion = self.client.chat.completions.create(
-                messages=[
-                    {"role": "system", "content": system_message},
-                    {"role": "user", "content": prompt},
-                ],
+    def reset_prompt_stats(self):
+        self.prompt_stats = {"calls": 0, "cached_calls": 0, "prompt_tokens": 0}
+
+    def get_completion(self, prompt, system_message="You are a helpful assistant.", use_cache=None):
+        """
+        Returns the completion text for `prompt`. Successful completions are
+        cached; pass `use_cache=False` to bypass the cache for a single call.
+        Raises an `LLMError` subclass if the provider call fails after retries.
+        """
+        use_cache = self.use_cache if use_cache is None else use_cache
+        with span("llm.completion", model=self.model, system=system_message,
+                  prompt_tokens=estimate_tokens(system_message) + estimate_tokens(prompt)) as s:
+            key = None
+            if use_cache and self.cache is not None:
+                key = self.cache.make_key(self.model, system_message, prompt, temperature=self.temperature)
+            self.last_completion_key = key
+            if key is not None:
+                cached = self.cache.get(key)
+                if cached is not None:
+                    self.prompt_stats["cached_calls"] += 1
+                    s.set(cached=True, completion_tokens=estimate_tokens(cached))
+                    return cached
+
+            content = self.pool.complete(
+                messages=self._messages(prompt, system_message),
                 model=self.model,
-                temperature=0.1, # Low temperature for deterministic code generation
+                temperature=self.temperature,
             )
-            return chat_completion.choices[0].message.content
+            s.set(cached=False, completion_tokens=estimate_tokens(content or ""))
+
+            if key is not None and content:
+                self.cache.put(key, content)
+            return content
+
+    def forget_completion(self, key):
+        """Evicts a cached completion (a `last_completion_key`) whose generated code failed to run."""
+        if key is not None and self.cache is not None:
+            self.cache.delete(key)
+
+    def stream_completion(self, prompt, system_message="You are a helpful assistant.", use_cache=None):
+        """
+        Yields the completion for `prompt` chunk by chunk as tokens arrive.
+        Cached completions are yielded in one piece. Time-to-first-token and
+        total time end up in `self.last_stream_stats`. Raises an `LLMError` subclass on failure.
+        """
+        start = time.perf_counter()
+        use_cache = self.use_cache if use_cache is None else use_cache
+        # A generator can't hold a span open across yields, so the stream is recorded once it ends
+        trace_attrs = {"model": self.model, "system": system_message,
+                       "prompt_tokens": estimate_tokens(system_message) + estimate_tokens(prompt)}
+        key = None
+        if use_cache and self.cache is not None:
+            key = self.cache.make_key(self.model, system_message, prompt, temperature=self.temperature)
+            cached = self.cache.get(key)
+            if cached is not None:
+                self.prompt_stats["cached_calls"] += 1
+                elapsed = time.perf_counter() - start
+                self.last_stream_stats = {"ttft": elapsed, "seconds": elapsed, "cached": True}
+                get_tracer().record("llm.stream", elapsed, cached=True,
+                                    completion_tokens=estimate_tokens(cached), **trace_attrs)
+                yield cached
+                return
+
+        parts = []
+        ttft = None
+        error = None
+        try:
+            for delta in self.pool.stream(
+                messages=self._messages(prompt, system_message),
+                model=self.model,
+                temperature=self.temperature,
+            ):
+                if ttft is None:
+                    ttft = time.perf_counter() - start
+                parts.append(delta)
+                yield delta
         except Exception as e:
-            return f"Error: {e}"
+            error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            self.last_stream_stats = {"ttft": ttft, "seconds": time.perf_counter() - start, "cached": False}
+            get_tracer().record("llm.stream", self.last_stream_stats["seconds"], error=error, cached=False, ttft=ttft,
+                                completion_tokens=estimate_tokens("".join(parts)), **trace_attrs)
+
+        content = "".join(parts)
+        if key is not None and content:
+            self.cache.put(key, content)
+
+    def _messages(self, prompt, system_message):
+        # Only prompts that are actually sent to the provider are counted
+        self.prompt_stats["calls"] += 1
+        self.prompt_stats["prompt_tokens"] += estimate_tokens(system_message) + estimate_tokens(prompt)
+        return [
+            {"role": "system", "content": system_message},
+            {"role": "user", "content": prompt},
+        ]
 
 # --- Agent 1: The Data Janitor ---
 class DataJanitor:
+    # Bump whenever the cleaning rules change so cached cleaned datasets are not reused
+    VERSION = "6"
+
     def __init__(self):
-        pass
+        self.profiler = ColumnProfiler()
+        self.last_report = []  # Per-column profile + timings from the most recent clean_data call
+
+    def _clean_column(self, series: pd.Series, profile: dict):
+        """Converts or fills a single column according to its profile. Returns (series, report)."""
+        start = time.perf_counter()
+        series, report = clean_column(series, profile)
+        report["clean_seconds"] = time.perf_counter() - start
+        return series, report
 
+    @traced("clean.data")
     def clean_data(self, df: pd.DataFrame) -> pd.DataFrame:
         """
         Autonomously cleans the data:
         1. Fills missing values (numeric with mean, categorical with mode).
         2. Drops duplicates.
         3. Converts object columns to datetime if they look like dates.
+
+        Column types are decided from a bounded sample first, so full-length
+        conversions only run where they apply. Per-column timings end up in `self.last_report`.
         """
-        df_clean = df.copy()
-
-        # Drop duplicates
-        df_clean = df_clean.drop_duplicates()
-
-        # Handle missing values
-        for col in df_clean.columns:
-            if df_clean[col].dtype == 'object':
-                # Try to convert to datetime
-                try:
-                    df_clean[col] = pd.to_datetime(df_clean[col])
-                except (ValueError, TypeError):
-                    # If not datetime, fill NA with mode
-                    if df_clean[col].isnull().any():
-                        mode_val = df_clean[col].mode()[0]
-                        df_clean[col] = df_clean[col].fillna(mode_val)
-            else:
-                # Numeric, fill with mean
-                if df_clean[col].isnull().any():
-                    mean_val = df_clean[col].mean()
-                    df_clean[col] = df_clean[col].fillna(mean_val)
-        
+        current_span().set(rows=len(df), columns=df.shape[1])
+        # Drop duplicates (returns a new frame, so no up-front copy is needed)
+        with span("clean.dedupe") as dedupe_span:
+            df_clean = df.drop_duplicates()
+            dedupe_span.set(rows_removed=len(df) - len(df_clean))
+
+        with span("clean.profile"):
+            profiles = self.profiler.profile(df_clean)
+        columns = [df_clean.iloc[:, i] for i in range(df_clean.shape[1])]
+
+        # Sequential on purpose: the per-column work is GIL-bound, threads gain nothing
+        with span("clean.columns"):
+            cleaned = [self._clean_column(s, p) for s, p in zip(columns, profiles)]
+
+        self.last_report = []
+        for i, (series, report) in enumerate(cleaned):
+            if report["action"] != "none":
+                df_clean.isetitem(i, series)
+            self.last_report.append(report)
+        current_span().set(actions={str(r["column"]): r["action"] for r in self.last_report if r["action"] != "none"})
+
         return df_clean
 
 # --- Agent 2: The Viz Architect ---
 class VizArchitect(GroqClient):
-    def __init__(self, api_key):
-        super().__init__(api_key)
+    def __init__(self, api_key, chart_timeout: float = CHART_TIMEOUT_SECONDS, **client_kwargs):
+        super().__init__(api_key, **client_kwargs)
+        self.chart_timeout = chart_timeout
+        self.last_chart_timings = []  # Per-chart status and wall-clock seconds from the last dashboard
 
+    @traced("dashboard.generate")
     def generate_charts(self, df: pd.DataFrame):
         """
         Analyzes the dataframe and generates Plotly code for 4 distinct visualizations.
         Returns a list of JSON objects with title, description, and the figure object.
+        Charts are built concurrently; per-chart timings end up in `self.last_chart_timings`.
         """
-        # Prepare metadata for the LLM
-        columns = df.columns.tolist()
-        dtypes = df.dtypes.astype(str).to_dict()
-        head = df.head(3).to_string()
+        self.reset_prompt_stats()
+        current_span().set(rows=len(df), columns=df.shape[1])
+        # Dataset metadata for the LLM, built once per dataset
+        profile_block = get_profile(df).to_prompt()
         
         prompt = f"""
         You are an expert Data Visualization Architect.
         Analyze the following dataset metadata:
-        Columns: {columns}
-        Data Types: {dtypes}
-        Sample Data:
-        {head}
+        {profile_block}
 
         Your Task:
         Generate 4 DISTINCT and meaningful Plotly visualizations to create a comprehensive dashboard.
@@ -113,7 +290,13 @@ class VizArchitect(GroqClient):
         }}
         """
 
-        response = self.get_completion(prompt, system_message="You are a JSON-speaking Data Visualization expert.")
+        try:
+            response = self.get_completion(prompt, system_message="You are a JSON-speaking Data Visualization expert.")
+            completion_key = self.last_completion_key
+        except LLMError as e:
+            print(f"Dashboard generation failed: {e}")
+            current_span().fail(e)
+            return []
         
         # Clean response if it contains markdown code blocks
         if "```json" in response:
@@ -121,140 +304,234 @@ class VizArchitect(GroqClient):
         elif "```" in response:
             response = response.split("```")[1].split("```")[0]
             
-        results = []
         try:
             data = json.loads(response)
             charts = data.get('charts', [])
-            
-            base_vars = {'df': df, 'px': px, 'go': go}
-            
-            for i, chart in enumerate(charts):
-                try:
-                    # Create a fresh context for each chart to avoid variable pollution
-                    local_vars = base_vars.copy()
-                    
-                    # Execute the code
-                    exec(chart['code'], {}, local_vars)
-                    
-                    # Figure name is likely fig1, fig2, etc. or just fig if the LLM messed up. 
-                    fig_name = f"fig{i+1}"
-                    fig = local_vars.get(fig_name)
-                    
-                    # Fallback: if figN not found, check if 'fig' was used
-                    if not fig:
-                         fig = local_vars.get('fig')
-
-                    if fig:
-                        # Validate that the figure is JSON-serializable
-                        try:
-                            # Test serialization before adding to results
-                            import plotly.io as pio
-                            pio.to_json(fig, validate=False)
-                            
-                            results.append({
-                                "story": chart['story'],
-                                "description": chart['description'],
-                                "figure": fig
-                            })
-                        except (TypeError, ValueError) as json_err:
-                            print(f"Chart {i+1} serialization failed: {json_err}")
-                            # Try multiple fix strategies
-                            fixed = False
-                            
-                            # Strategy 1: Convert to dict and back
-                            try:
-                                fig_dict = fig.to_dict()
-                                clean_fig = go.Figure(fig_dict)
-                                pio.to_json(clean_fig, validate=False)
-                                results.append({
-                                    "story": chart['story'],
-                                    "description": chart['description'],
-                                    "figure": clean_fig
-                                })
-                                fixed = True
-                                print(f"Chart {i+1} fixed with strategy 1")
-                            except Exception:
-                                pass
-                            
-                            # Strategy 2: Recreate with plotly express if strategy 1 failed
-                            if not fixed:
-                                try:
-                                    # Try to re-execute the code with fresh context
-                                    retry_vars = {'df': df, 'px': px, 'go': go, 'pd': pd}
-                                    exec(chart['code'], {}, retry_vars)
-                                    retry_fig = retry_vars.get(f"fig{i+1}") or retry_vars.get('fig')
-                                    
-                                    if retry_fig:
-                                        # Update layout to ensure JSON compatibility
-                                        retry_fig.update_layout(template="plotly_dark")
-                                        pio.to_json(retry_fig, validate=False)
-                                        results.append({
-                                            "story": chart['story'],
-                                            "description": chart['description'],
-                                            "figure": retry_fig
-                                        })
-                                        fixed = True
-                                        print(f"Chart {i+1} fixed with strategy 2")
-                                except Exception as e2:
-                                    print(f"Chart {i+1} strategy 2 failed: {e2}")
-                            
-                            # Strategy 3: Create a simple fallback chart
-                            if not fixed:
-                                try:
-                                    # Create a simple text-based figure as fallback
-                                    fallback_fig = go.Figure()
-                                    fallback_fig.add_annotation(
-                                        text=f"Chart rendering failed<br>{chart['story']}",
-                                        xref="paper", yref="paper",
-                                        x=0.5, y=0.5, showarrow=False,
-                                        font=dict(size=14, color="white")
-                                    )
-                                    fallback_fig.update_layout(
-                                        template="plotly_dark",
-                                        height=300,
-                                        showlegend=False
-                                    )
-                                    results.append({
-                                        "story": chart['story'],
-                                        "description": "Visualization could not be rendered. " + chart['description'],
-                                        "figure": fallback_fig
-                                    })
-                                    print(f"Chart {i+1} using fallback")
-                                except Exception as e3:
-                                    print(f"Chart {i+1} all strategies failed: {e3}")
-                                    continue
-                except Exception as e:
-                    print(f"Error generating chart {i+1}: {e}")
-                    continue
-            
-            return results
-
         except Exception as e:
             print(f"Error parsing JSON: {e}")
+            current_span().fail(f"Error parsing JSON: {e}")
+            self.forget_completion(completion_key)
             return []
 
+        results = self._build_charts(charts, df)
+        if any(t["status"] in ("error", "no_figure") for t in self.last_chart_timings):
+            # Don't replay a dashboard with broken charts for the whole cache TTL
+            self.forget_completion(completion_key)
+        return results
+
+    @traced("dashboard.refresh")
+    def refresh_charts(self, df: pd.DataFrame, results: list):
+        """
+        Rebuilds previously generated charts on new data (e.g. after rows were
+        appended) by re-running their code; the LLM is not called again.
+        """
+        charts = [
+            {"story": r["story"], "description": r["description"], "code": r["code"], "index": r["index"]}
+            for r in results if r.get("code")
+        ]
+        return self._build_charts(charts, df)
+
+    def _build_charts(self, charts: list, df: pd.DataFrame):
+        """Builds every chart concurrently; each one gets `chart_timeout` seconds."""
+        pool = ThreadPoolExecutor(max_workers=max(len(charts), 1))
+        # Each chart runs in a copy of this context so its spans nest under the dashboard span
+        futures = [pool.submit(contextvars.copy_context().run, self._build_chart, chart.get("index", i), chart, df)
+                   for i, chart in enumerate(charts)]
+        deadline = time.perf_counter() + self.chart_timeout
+
+        results = []
+        self.last_chart_timings = []
+        for i, (chart, future) in enumerate(zip(charts, futures)):
+            try:
+                result, status, seconds = future.result(timeout=max(deadline - time.perf_counter(), 0))
+            except FuturesTimeout:
+                print(f"Chart {i+1} exceeded {self.chart_timeout}s, using fallback")
+                result, status, seconds = self._fallback_chart(chart), "timeout", self.chart_timeout
+                result["index"] = chart.get("index", i)  # Lets a refresh retry the chart
+                # Not recorded here: the worker's own chart.build span is exported once it finishes
+
+            self.last_chart_timings.append({"chart": i + 1, "status": status, "seconds": seconds})
+            if result:
+                result["seconds"] = seconds
+                results.append(result)
+
+        # Hung charts keep their worker thread until they finish; don't block on them
+        pool.shutdown(wait=False, cancel_futures=True)
+        current_span().set(charts=len(results), statuses=[t["status"] for t in self.last_chart_timings])
+        return results
+
+    def _fallback_chart(self, chart):
+        """A simple text-based figure used when a chart can't be built or serialized."""
+        story = chart.get('story', '') if isinstance(chart, dict) else ''
+        description = chart.get('description', '') if isinstance(chart, dict) else ''
+        fallback_fig = go.Figure()
+        fallback_fig.add_annotation(
+            text=f"Chart rendering failed<br>{story}",
+            xref="paper", yref="paper",
+            x=0.5, y=0.5, showarrow=False,
+            font=dict(size=14, color="white")
+        )
+        fallback_fig.update_layout(
+            template="plotly_dark",
+            height=300,
+            showlegend=False
+        )
+        return {
+            "story": story,
+            "description": "Visualization could not be rendered. " + description,
+            "figure": fallback_fig,
+            "code": chart.get('code') if isinstance(chart, dict) else None
+        }
+
+    @traced("chart.build")
+    def _build_chart(self, i, chart, df):
+        """
+        Executes the code for one chart. The figure is serialized exactly once
+        (repaired through a dict round trip if needed); the payload itself is
+        not kept, since Streamlit renders the Figure object. Returns (result, status, seconds); the result is
+        None when the code draws no figure and the fallback chart when it fails.
+        """
+        start = time.perf_counter()
+        current_span().set(chart=i + 1)
+        try:
+            # Execute the code in a fresh namespace. Figure name is likely fig1, fig2, etc.
+            # or just fig if the LLM messed up.
+            report = {}
+            fig = _run_generated(chart['code'], df, [f"fig{i+1}", 'fig'], report)
+
+            if not fig:
+                current_span().fail("no figure produced")
+                return None, "no_figure", time.perf_counter() - start
+
+            if report.get("repaired"):
+                print(f"Chart {i+1} serialization repaired via dict round trip")
+            report.pop("figure_json", None)
+            result = {
+                "story": chart['story'],
+                "description": chart['description'],
+                "figure": fig,
+                "figure_report": report,
+                "code": chart['code'],
+                "index": i
+            }
+            return result, "repaired" if report.get("repaired") else "ok", time.perf_counter() - start
+        except Exception as e:
+            # Build or serialization failed even after the repair: show the text fallback instead
+            print(f"Error generating chart {i+1}: {e}")
+            current_span().fail(e)
+            result = self._fallback_chart(chart)
+            result["index"] = i  # Lets a refresh retry the chart
+            return result, "error", time.perf_counter() - start
+
 # --- Agent 3: Talking Rabbitt (The Analyst) ---
 class TalkingRabbit(GroqClient):
-    def __init__(self, api_key):
-        super().__init__(api_key)
+    def __init__(self, api_key, router=None, backend=QUERY_BACKEND, **client_kwargs):
+        super().__init__(api_key, **client_kwargs)
+        # Text answers come from SQL on the embedded engine when requested and installed, else pandas code
+        self.sql_backend = get_sql_backend() if backend == "sql" else None
+        if backend == "sql" and self.sql_backend is None:
+            print("SQL backend requested but duckdb is not installed, using pandas")
         self.conversation_history = []
+        self.memory = ConversationMemory(summarizer=self._summarize_conversation)
+        self.router = router if router is not None else default_intent_router()
+        # Both are cleared by the app whenever a new dataset is loaded
+        self.result_cache = ResultCache()
+        self.question_cache = SemanticQuestionCache()
 
-    def ask_question(self, df: pd.DataFrame, question: str, conversation_history=None):
+    @traced("chat.turn")
+    def ask_question(self, df: pd.DataFrame, question: str, conversation_history=None, stream=False):
         """
         Converts natural language question to analysis, with conversation memory.
         Can generate text answers OR visualizations based on the question.
+        With `stream=True`, "answer" may be an iterator of text chunks instead of a string.
+        Prompt token counts for the request accumulate in `self.prompt_stats`
+        (streamed answers are counted once they are consumed).
         """
         if conversation_history is None:
             conversation_history = self.conversation_history
-            
-        columns = df.columns.tolist()
-        dtypes = df.dtypes.astype(str).to_dict()
-        head = df.head(3).to_string()
+        self.last_stream_stats = {}
+        self.reset_prompt_stats()
+
+        # Precomputed at load time (or on first use) and shared by every prompt
+        profile = get_profile(df)
         
-        # Build conversation context
-        context = "\n".join([f"{msg['role']}: {msg['content']}" for msg in conversation_history[-5:]])  # Last 5 messages
+        # Recent turns verbatim, older ones folded into a rolling summary, within a token budget
+        context = self.memory.context(conversation_history)
+        self.prompt_stats["context_tokens"] = self.memory.last_tokens
+
+        # Near-duplicate of an earlier question on this dataset: reuse its validated code
+        match = self.question_cache.lookup(dataset_fingerprint(df), question, profile.column_names)
+        if match:
+            intent, code = match["type"], match["code"]
+        else:
+            # First, determine if user wants a visualization (locally when the router is confident)
+            with span("intent.route"):
+                intent = self.router.route(question, lambda: self._classify_intent_llm(question))
+            code = None
+        current_span().set(question_chars=len(question), intent=intent, reused_code=bool(match),
+                           context_tokens=self.memory.last_tokens)
+
+        try:
+            if intent == VISUALIZATION:
+                # Generate visualization
+                return self._generate_visualization(df, question, context, profile, stream, code)
+            else:
+                # Generate text answer
+                return self._generate_text_answer(df, question, context, profile, stream, code)
+        except LLMError as e:
+            # Code generation never reached the model: nothing to execute downstream
+            return {
+                "type": "text",
+                "answer": f"I couldn't reach the language model right now, please try again. ({e})",
+                "code": None,
+                "figure": None
+            }
+    
+    def _run_memoized(self, code, df, outputs, sql=False):
+        """
+        Runs generated code (or a SQL query), reusing the result if it already
+        ran on this dataset. Returns (value, truncated); a result is truncated
+        when it had more rows than the SQL backend fetches or the sandbox returns.
+        """
+        key = self.result_cache.make_key(dataset_fingerprint(df), code, ["sql"] if sql else outputs)
+        hit, entry = self.result_cache.get(key)
+        if hit:
+            return entry
+        report = {}
+        value = self.sql_backend.run(code, df, report) if sql else _run_generated(code, df, outputs, report)
+        entry = (value, bool(report.get("truncated")))
+        self.result_cache.put(key, entry)
+        return entry
+
+    def rows_appended(self, old_fingerprint, df):
+        """Same columns, new rows: keeps the learned question code, drops only the old dataset's results."""
+        self.result_cache.forget(old_fingerprint)
+        self.question_cache.rekey(old_fingerprint, dataset_fingerprint(df))
 
-        # First, determine if user wants a visualization
+    def _stream_answer(self, prompt, system_message):
+        """Streams a completion; a failure mid-stream ends the answer with a note instead of raising."""
+        try:
+            yield from self.stream_completion(prompt, system_message=system_message)
+        except LLMError as e:
+            yield f" (I lost the connection to the language model: {e})"
+
+    def _summarize_conversation(self, summary, lines, max_tokens):
+        """Folds older chat lines into the running conversation summary."""
+        older = "\n".join(lines)
+        prompt = f"""
+        Current summary of the conversation so far:
+        {summary or "(empty)"}
+
+        Older messages to fold in:
+        {older}
+
+        Task: Return an updated summary in at most {max_tokens * 3 // 4} words. Keep the questions asked,
+        the key numbers found and any columns, filters or charts the user referred to.
+        """
+        return self.get_completion(prompt, system_message="You are concise.")
+
+    def _classify_intent_llm(self, question):
+        """Asks the LLM whether the question wants a VISUALIZATION or a TEXT answer (None on failure)."""
         intent_prompt = f"""
         Analyze this user question and determine if they want a VISUALIZATION or just a TEXT answer.
         
@@ -265,17 +542,15 @@ class TalkingRabbit(GroqClient):
         Keywords for visualization: chart, plot, graph, visualize, show me, display, draw
         """
         
-        intent = self.get_completion(intent_prompt, system_message="You are a classification expert.").strip().upper()
-        
-        if "VISUALIZATION" in intent or "VIZ" in intent:
-            # Generate visualization
-            return self._generate_visualization(df, question, context, columns, dtypes, head)
-        else:
-            # Generate text answer
-            return self._generate_text_answer(df, question, context, columns, dtypes, head)
-    
-    def _generate_text_answer(self, df, question, context, columns, dtypes, head):
-        """Generate a text-based answer with Pandas code."""
+        try:
+            intent = self.get_completion(intent_prompt, system_message="You are a classification expert.").strip().upper()
+        except LLMError as e:
+            print(f"Intent classification failed: {e}")
+            return None
+        return VISUALIZATION if "VISUALIZATION" in intent or "VIZ" in intent else TEXT
+
+    def _generate_text_code(self, question, context, profile):
+        """Ask the LLM for Pandas code that answers the question."""
         prompt = f"""
         You are an expert Data Analyst named "Talking Rabbit".
         
@@ -285,16 +560,14 @@ class TalkingRabbit(GroqClient):
         Current User Question: "{question}"
 
         Dataset Metadata:
-        Columns: {columns}
-        Data Types: {dtypes}
-        Sample Data:
-        {head}
+        {profile.to_prompt()}
 
         Your Task:
         1. Write a Python Pandas query to answer the question.
            - Assume the dataframe is named `df`.
            - Store the result in a variable named `result`.
            - The query should be a single executable line or block.
+           - When grouping by a `category` column, pass `observed=True`.
         2. Consider the conversation history for context.
         
         Output Format:
@@ -305,12 +578,58 @@ class TalkingRabbit(GroqClient):
         code_response = self.get_completion(prompt, system_message="You are a Python Pandas coding expert. Output ONLY code.")
         
         # Clean code response
-        code_response = code_response.replace("```python", "").replace("```", "").strip()
+        return code_response.replace("```python", "").replace("```", "").strip()
+
+    def _generate_sql_code(self, question, context, profile):
+        """Ask the LLM for a DuckDB SQL query that answers the question."""
+        prompt = f"""
+        You are an expert Data Analyst named "Talking Rabbit".
+        
+        Conversation History:
+        {context}
+        
+        Current User Question: "{question}"
+
+        Dataset Metadata:
+        {profile.to_prompt()}
+
+        Your Task:
+        1. Write ONE DuckDB SQL SELECT query that answers the question.
+           - The table is named `df` and has the columns listed above.
+           - Quote column names with double quotes, e.g. "Sales".
+           - Aggregate in SQL; when listing rows, add a LIMIT.
+        2. Consider the conversation history for context.
+        
+        Output Format:
+        Return ONLY the SQL query. Do not wrap in markdown. Do not add comments.
+        Example: SELECT SUM("Sales") AS total_sales FROM df WHERE "Category" = 'A'
+        """
+
+        code_response = self.get_completion(prompt, system_message="You are a DuckDB SQL expert. Output ONLY SQL.")
+        return clean_sql(code_response)
+
+    def _generate_text_answer(self, df, question, context, profile, stream=False, code=None):
+        """
+        Generate a text-based answer with Pandas code, or with SQL when the SQL
+        backend is enabled (reusing `code` when given).
+        """
+        sql = self.sql_backend is not None
+        generate = self._generate_sql_code if sql else self._generate_text_code
+        code_key = None
+        if code is None:
+            code = generate(question, context, profile)
+            code_key = self.last_completion_key
+        code_response = code
+        language = "sql" if sql else "python"
 
         try:
-            local_vars = {'df': df, 'pd': pd}
-            exec(code_response, {}, local_vars)
-            result_val = local_vars.get('result')
+            try:
+                result_val, truncated = self._run_memoized(code_response, df, ['result'], sql=sql)
+            except Exception:
+                # Code that fails is not replayed from the completion cache
+                self.forget_completion(code_key)
+                raise
+            self.question_cache.add(dataset_fingerprint(df), question, TEXT, code_response, profile.column_names)
             
             # Synthesize answer
             synthesis_prompt = f"""
@@ -318,18 +637,21 @@ class TalkingRabbit(GroqClient):
             {context}
             
             User Question: "{question}"
-            Data Analysis Result: {result_val}
+            Data Analysis Result:
+            {summarize_result(result_val, truncated=truncated)}
             
             Task: Provide a natural language answer to the user's question based on the result.
             Keep it professional, concise, and friendly. Reference previous conversation if relevant.
             """
-            answer = self.get_completion(synthesis_prompt, system_message="You are a helpful Data Analyst.")
+            complete = self._stream_answer if stream else self.get_completion
+            answer = complete(synthesis_prompt, system_message="You are a helpful Data Analyst.")
             
             return {
                 "type": "text",
                 "answer": answer,
                 "code": code_response,
-                "figure": None
+                "figure": None,
+                "language": language
             }
             
         except Exception as e:
@@ -337,11 +659,12 @@ class TalkingRabbit(GroqClient):
                 "type": "text",
                 "answer": f"I couldn't analyze that. Error: {e}",
                 "code": code_response,
-                "figure": None
+                "figure": None,
+                "language": language
             }
     
-    def _generate_visualization(self, df, question, context, columns, dtypes, head):
-        """Generate a visualization based on the question."""
+    def _generate_visualization_code(self, question, context, profile):
+        """Ask the LLM for Plotly code that draws the requested chart."""
         prompt = f"""
         You are an expert Data Visualization specialist.
         
@@ -351,10 +674,7 @@ class TalkingRabbit(GroqClient):
         Current User Question: "{question}"
         
         Dataset Metadata:
-        Columns: {columns}
-        Data Types: {dtypes}
-        Sample Data:
-        {head}
+        {profile.to_prompt()}
 
         Your Task:
         Generate Python code using Plotly Express (`px`) to create the requested visualization.
@@ -371,22 +691,29 @@ class TalkingRabbit(GroqClient):
         code_response = self.get_completion(prompt, system_message="You are a Plotly visualization expert. Output ONLY code.")
         
         # Clean code response
-        code_response = code_response.replace("```python", "").replace("```", "").strip()
+        return code_response.replace("```python", "").replace("```", "").strip()
+
+    def _generate_visualization(self, df, question, context, profile, stream=False, code=None):
+        """Generate a visualization based on the question (reusing `code` when given)."""
+        code_key = None
+        if code is None:
+            code = self._generate_visualization_code(question, context, profile)
+            code_key = self.last_completion_key
+        code_response = code
 
         try:
-            local_vars = {'df': df, 'px': px, 'go': go, 'pd': pd}
-            exec(code_response, {}, local_vars)
-            fig = local_vars.get('fig')
+            report = {}
+            try:
+                fig = _run_generated(code_response, df, ['fig'], report)
+            except Exception:
+                # Code that fails is not replayed from the completion cache
+                self.forget_completion(code_key)
+                raise
             
             if fig:
-                # Validate JSON serialization
-                try:
-                    import plotly.io as pio
-                    pio.to_json(fig, validate=False)
-                except (TypeError, ValueError):
-                    # Try to clean the figure
-                    fig_dict = fig.to_dict()
-                    fig = go.Figure(fig_dict)
+                self.question_cache.add(dataset_fingerprint(df), question, VISUALIZATION, code_response, profile.column_names)
+                # Already serialized (and repaired if needed) by _run_generated
+                report.pop("figure_json", None)
                 
                 # Generate description
                 desc_prompt = f"""
@@ -395,15 +722,18 @@ class TalkingRabbit(GroqClient):
                 
                 Provide a brief 1-sentence description of what the chart shows.
                 """
-                description = self.get_completion(desc_prompt, system_message="You are concise.")
+                complete = self._stream_answer if stream else self.get_completion
+                description = complete(desc_prompt, system_message="You are concise.")
                 
                 return {
                     "type": "visualization",
                     "answer": description,
                     "code": code_response,
-                    "figure": fig
+                    "figure": fig,
+                    "figure_report": report
                 }
             else:
+                self.forget_completion(code_key)
                 return {
                     "type": "text",
                     "answer": "I couldn't generate the visualization. Please try rephrasing your request.",
@@ -1,21 +1,50 @@
 import streamlit as st
 import pandas as pd
 from agents import DataJanitor, VizArchitect, TalkingRabbit
-from utils import inject_custom_css, render_header
+from ingest import StreamingCSVLoader, StreamingExcelLoader, CSV_CHUNK_ROWS
+from cache import DatasetCache, dataset_fingerprint
+from compaction import compact_dataframe, format_bytes
+from dataset_profile import DatasetProfile, register_profile, get_profile
+from append import DatasetAppender, read_delta
+from rollups import build_rollups, get_rollups
+from utils import inject_custom_css, render_header, render_chat_message, stream_chat_message, render_figure, render_audio_queue, render_trace_panel
+from tts import default_tts_pipeline
+from tracing import span, traced, get_tracer
+from streamlit.errors import StreamlitAPIException
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 from streamlit_mic_recorder import speech_to_text
-from gtts import gTTS
-import io
+import base64
 import os
 
 # --- Configuration ---
 st.set_page_config(page_title="Talking Rabbit", layout="wide", page_icon="🐰")
+CHAT_PAGE_SIZE = 10  # Messages rendered per page of the chat sidebar
 
 # --- Initialize Agents ---
 # Ideally, use st.secrets. For this deliverable, we use the provided key or placeholder.
 API_KEY = "Use your own API key"
 
+@st.cache_resource
+def get_dataset_cache():
+    # One on-disk cache of cleaned datasets shared by every session in the process
+    return DatasetCache()
+
+def browser_session():
+    """Id of the browser session whose script run is current (None outside a run)."""
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx else None
+
+# Traces are tagged with the session that started them, so the debug panel only shows this user's
+get_tracer().session_of = browser_session
+
 if 'janitor' not in st.session_state:
     st.session_state.janitor = DataJanitor()
+if 'csv_loader' not in st.session_state:
+    st.session_state.csv_loader = StreamingCSVLoader(chunk_rows=CSV_CHUNK_ROWS)
+if 'excel_loader' not in st.session_state:
+    st.session_state.excel_loader = StreamingExcelLoader(chunk_rows=CSV_CHUNK_ROWS)
+if 'appender' not in st.session_state:
+    st.session_state.appender = DatasetAppender()
 if 'viz_architect' not in st.session_state:
     st.session_state.viz_architect = VizArchitect(api_key=API_KEY)
 if 'rabbit' not in st.session_state:
@@ -30,27 +59,140 @@ with st.sidebar:
     st.header("📂 Data Source")
     uploaded_file = st.file_uploader("Upload Excel or CSV", type=['csv', 'xlsx'])    
     if uploaded_file:
-        # Check if file is new or different
-        if 'last_uploaded_file' not in st.session_state or st.session_state.last_uploaded_file != uploaded_file.name:
-            try:
-                if uploaded_file.name.endswith('.csv'):
-                    df = pd.read_csv(uploaded_file)
-                else:
-                    df = pd.read_excel(uploaded_file)
-                
-                # Agent 1: Clean Data
-                with st.spinner("🧹 Data Janitor is cleaning your data..."):
-                    df_clean = st.session_state.janitor.clean_data(df)
+        # Hash each new upload once; the content hash decides whether to reload
+        upload_id = getattr(uploaded_file, 'file_id', None) or f"{uploaded_file.name}:{uploaded_file.size}"
+        sheet = None
+        if not uploaded_file.name.endswith('.csv'):
+            # Sheet names come from the workbook manifest; only the chosen sheet is ever parsed
+            if st.session_state.get('sheet_names_upload_id') != upload_id:
+                try:
+                    st.session_state.sheet_names = StreamingExcelLoader.sheet_names(uploaded_file)
+                except Exception as e:
+                    print(f"Workbook manifest could not be read: {e}")
+                    st.session_state.sheet_names = []
+                st.session_state.sheet_names_upload_id = upload_id
+            sheet_names = st.session_state.sheet_names
+            if len(sheet_names) > 1:
+                sheet = st.selectbox("Sheet", sheet_names, key=f"sheet_{upload_id}")
+            elif sheet_names:
+                sheet = sheet_names[0]
+            else:
+                st.error("Error loading file: no readable sheets found in this workbook.")
+        load_id = f"{upload_id}:{sheet}" if sheet is not None else upload_id
+        if (sheet is not None or uploaded_file.name.endswith('.csv')) and st.session_state.get('last_upload_id') != load_id:
+            dataset_cache = get_dataset_cache()
+            # Every sheet is cached under its own key, so switching back to a sheet is a cache hit
+            dataset_key = dataset_cache.make_key(uploaded_file.getbuffer(), DataJanitor.VERSION, variant=sheet)
+            st.session_state.last_upload_id = load_id
+
+            if st.session_state.get('dataset_key') != dataset_key:
+                try:
+                    df_clean, cache_metadata = dataset_cache.get_entry(dataset_key)
+                    profile = DatasetProfile.from_dict((cache_metadata or {}).get("profile"))
+                    raw_state = None
+                    if df_clean is None:
+                        if uploaded_file.name.endswith('.csv'):
+                            # Agent 1: Stream, clean and dedupe the CSV chunk by chunk
+                            with st.spinner("🧹 Data Janitor is streaming & cleaning your data..."):
+                                progress = st.progress(0.0)
+                                df_clean = st.session_state.csv_loader.load(
+                                    uploaded_file,
+                                    progress_callback=lambda frac, rows: progress.progress(frac, text=f"{rows:,} rows read"),
+                                )
+                                progress.empty()
+                        else:
+                            # Agent 1: Stream, clean and dedupe the selected sheet chunk by chunk
+                            with st.spinner(f"🧹 Data Janitor is streaming & cleaning sheet '{sheet}'..."):
+                                progress = st.progress(0.0)
+                                df_clean = st.session_state.excel_loader.load(
+                                    uploaded_file, sheet,
+                                    progress_callback=lambda frac, rows: progress.progress(frac, text=f"{rows:,} rows read"),
+                                )
+                                progress.empty()
+                        # Dedupe hashes and fill statistics of the raw rows, for appends
+                        raw_state = (st.session_state.csv_loader if uploaded_file.name.endswith('.csv')
+                                     else st.session_state.excel_loader).raw_state
+
+                        # Shrink dtypes before the frame is cached and held in session state
+                        df_clean, memory_report = compact_dataframe(df_clean)
+                        # Profile once here; every prompt reuses it, and it is cached with the frame
+                        profile = DatasetProfile.build(df_clean)
+                        dataset_cache.put(dataset_key, df_clean, metadata={"profile": profile.to_dict()})
+                    else:
+                        memory_report = {"before_bytes": None, "after_bytes": int(df_clean.memory_usage(deep=True).sum()), "changes": {}}
+
+                    register_profile(df_clean, profile or DatasetProfile.build(df_clean))
+                    if raw_state is not None:
+                        st.session_state.appender.set_state(df_clean, raw_state)
+                    # On a cache hit the raw state is rebuilt from the upload at the first append
+                    st.session_state.raw_source = (uploaded_file, sheet)
+                    # Common group-by aggregates are precomputed in the background
+                    build_rollups(df_clean)
                     st.session_state.df = df_clean
+                    st.session_state.dataset_key = dataset_key
+                    st.session_state.memory_report = memory_report
                     st.session_state.last_uploaded_file = uploaded_file.name
-                    
+
                     # Reset previous analysis
                     if 'viz_results' in st.session_state:
                         del st.session_state.viz_results
-                        
-                st.success("Data Cleaned & Ready!")
-            except Exception as e:
-                st.error(f"Error loading file: {e}")
+                    st.session_state.rabbit.result_cache.clear()
+                    st.session_state.rabbit.question_cache.clear()
+
+                    st.success("Data Cleaned & Ready!")
+                except Exception as e:
+                    # Allow a retry of the same upload on the next rerun
+                    st.session_state.last_upload_id = None
+                    st.error(f"Error loading file: {e}")
+
+    # --- Sidebar: Append Rows ---
+    if 'df' in st.session_state:
+        with st.expander("➕ Append rows", expanded=False):
+            append_round = st.session_state.get('append_round', 0)
+            new_files = st.file_uploader(
+                "Add files with the same columns (first sheet of a workbook)",
+                type=['csv', 'xlsx'], accept_multiple_files=True, key=f"append_files_{append_round}",
+            )
+            if new_files and st.button("Append to dataset"):
+                df = st.session_state.df
+                old_fingerprint = dataset_fingerprint(df)
+                appender = st.session_state.appender
+                added = 0
+                try:
+                    with st.spinner("🧹 Data Janitor is cleaning the new rows..."):
+                        if not appender.has_state(df):
+                            # The dataset came from the cache: read the upload once more for its raw rows' state
+                            source, source_sheet = st.session_state.raw_source
+                            if source.name.endswith('.csv'):
+                                loader = st.session_state.csv_loader
+                                loader.load(source)
+                            else:
+                                loader = st.session_state.excel_loader
+                                loader.load(source, source_sheet)
+                            appender.set_state(df, loader.raw_state)
+                        for new_file in new_files:
+                            combined, delta = appender.append(df, read_delta(new_file, new_file.name))
+                            # Only the new rows are profiled; the rest comes from the current profile
+                            register_profile(combined, get_profile(df).extend(df, delta, combined))
+                            added += len(combined) - len(df)
+                            df = combined
+
+                    memory_report = st.session_state.get('memory_report') or {"before_bytes": None, "changes": {}}
+                    st.session_state.memory_report = dict(memory_report, after_bytes=int(df.memory_usage(deep=True).sum()))
+                    st.session_state.df = df
+                    # No cached dataset holds the appended rows; reselecting the upload reloads it
+                    st.session_state.dataset_key = None
+                    build_rollups(df)
+
+                    st.session_state.rabbit.rows_appended(old_fingerprint, df)
+                    if st.session_state.get('viz_results'):
+                        st.session_state.viz_results = st.session_state.viz_architect.refresh_charts(
+                            df, st.session_state.viz_results
+                        )
+                    st.session_state.append_round = append_round + 1
+                    st.success(f"Appended {added:,} new rows.")
+                except Exception as e:
+                    st.error(f"Error appending rows: {e}")
 
 # --- Main Dashboard ---
 if 'df' in st.session_state:
@@ -60,6 +202,19 @@ if 'df' in st.session_state:
     st.markdown('<div class="glass-card">', unsafe_allow_html=True)
     st.subheader("📊 Data Overview (Cleaned)")
     st.dataframe(df.head(), use_container_width=True)
+    memory_report = st.session_state.get('memory_report')
+    if memory_report:
+        if memory_report['before_bytes']:
+            saved = 1 - memory_report['after_bytes'] / memory_report['before_bytes']
+            st.caption(f"💾 Memory: {format_bytes(memory_report['before_bytes'])} → {format_bytes(memory_report['after_bytes'])} ({saved:.0%} saved)")
+        else:
+            st.caption(f"💾 Memory: {format_bytes(memory_report['after_bytes'])} (loaded from cache)")
+        rollups = get_rollups(df)
+        if rollups is not None and rollups.frames:
+            st.caption(f"🧊 Rollups: {len(rollups.frames)} precomputed group-bys ({format_bytes(rollups.nbytes)})")
+        if memory_report['changes']:
+            with st.expander("Column dtype changes", expanded=False):
+                st.table(pd.DataFrame(memory_report['changes'].items(), columns=["Column", "Change"]))
     st.markdown('</div>', unsafe_allow_html=True)
 
     # 2. Visualization Agent
@@ -83,7 +238,7 @@ if 'df' in st.session_state:
                         try:
                             st.markdown(f"#### {results[i]['story']}")
                             st.caption(results[i]['description'])
-                            st.plotly_chart(results[i]['figure'], use_container_width=True)
+                            render_figure(results[i]['figure'], key=f"viz_{i}")
                         except Exception as e:
                             st.error(f"Could not render chart: {str(e)[:100]}")
                 
@@ -93,7 +248,7 @@ if 'df' in st.session_state:
                         try:
                             st.markdown(f"#### {results[i+1]['story']}")
                             st.caption(results[i+1]['description'])
-                            st.plotly_chart(results[i+1]['figure'], use_container_width=True)
+                            render_figure(results[i+1]['figure'], key=f"viz_{i+1}")
                         except Exception as e:
                             st.error(f"Could not render chart: {str(e)[:100]}")
         else:
@@ -126,6 +281,163 @@ else:
     st.info("Please upload a dataset to begin.")
 
 # --- Chat in Sidebar ---
+def rerun_chat():
+    """Reruns only the chat fragment; the fragment's first run is part of a full app run, which reruns whole."""
+    try:
+        st.rerun(scope="fragment")
+    except StreamlitAPIException:
+        st.rerun()
+
+
+@st.fragment
+@traced("render.chat")
+def chat_panel():
+    """Sidebar chat. Runs as a fragment, so chatting doesn't rerun the dashboard."""
+    st.markdown("### 🐰 Chat with Rabbitt")
+    st.markdown("---")
+    
+    # Only one page of messages is rendered per run; older pages load on demand
+    history = st.session_state.chat_history
+    pages = max((len(history) - 1) // CHAT_PAGE_SIZE + 1, 1)
+    st.session_state.chat_page = min(st.session_state.chat_page, pages - 1)
+    end = len(history) - st.session_state.chat_page * CHAT_PAGE_SIZE
+    start = max(end - CHAT_PAGE_SIZE, 0)
+
+    if pages > 1:
+        col_older, col_info, col_newer = st.columns([1, 2, 1])
+        with col_older:
+            st.button("⬆ Older", key="chat_older", use_container_width=True,
+                      disabled=st.session_state.chat_page >= pages - 1,
+                      on_click=lambda: st.session_state.update(chat_page=st.session_state.chat_page + 1))
+        with col_info:
+            st.caption(f"Messages {start + 1}–{end} of {len(history)}")
+        with col_newer:
+            st.button("Newer ⬇", key="chat_newer", use_container_width=True,
+                      disabled=st.session_state.chat_page == 0,
+                      on_click=lambda: st.session_state.update(chat_page=st.session_state.chat_page - 1))
+
+    # Chat messages
+    chat_container = st.container(height=500)
+    with chat_container:
+        if len(history) == 0:
+            st.info("👋 Hi! Ask me anything about your data. I can answer questions and create visualizations!")
+        else:
+            for idx in range(start, end):
+                # Global index keeps widget keys stable across pages; only the newest chart starts expanded
+                render_chat_message(history[idx], key_prefix=f"chat_{idx}", show_figure=idx == len(history) - 1)
+
+    prompt_stats = st.session_state.get('last_prompt_stats')
+    if prompt_stats:
+        st.caption(
+            f"🧮 Last answer: ~{prompt_stats['prompt_tokens']:,} prompt tokens over {prompt_stats['calls']} call(s), "
+            f"~{prompt_stats.get('context_tokens', 0):,} of them conversation memory"
+        )
+    tts_stats = st.session_state.get('last_tts_stats')
+    if tts_stats and tts_stats.get("first_audio_seconds") is not None:
+        st.caption(f"🔊 First audio queued {tts_stats['first_audio_seconds']:.2f}s after asking ({tts_stats['sentences']} sentences)")
+    
+    st.markdown("---")
+    
+    # Input with dynamic key to clear after sending
+    user_input = st.text_input(
+        "Message", 
+        key=f"chat_input_{st.session_state.input_key}", 
+        label_visibility="collapsed",
+        placeholder="Type your question..."
+    )
+    
+    col_voice, _ = st.columns([1, 4])
+    with col_voice:
+        voice_input = speech_to_text(
+            language='en',
+            start_prompt="🎤",
+            stop_prompt="🛑",
+            just_once=True,
+            use_container_width=True,
+            key=f"chat_voice_{st.session_state.input_key}"
+        )
+    
+    # Process
+    question = None
+    is_voice = False
+    
+    if voice_input and voice_input != st.session_state.last_input:
+        question = voice_input
+        is_voice = True
+        st.session_state.last_input = voice_input
+    elif user_input and user_input != st.session_state.last_input and user_input.strip():
+        question = user_input
+        is_voice = False
+        st.session_state.last_input = user_input
+    
+    if question:
+        df = st.session_state.df
+        
+        user_message = {
+            "role": "user",
+            "content": question,
+            "code": None,
+            "figure": None
+        }
+        st.session_state.chat_history.append(user_message)
+        st.session_state.chat_page = 0
+        with chat_container:
+            render_chat_message(user_message)
+        
+        # Voice answers are synthesized sentence by sentence while the text streams
+        tts_pipeline = default_tts_pipeline()
+        speech = tts_pipeline.start(lang='en') if is_voice and tts_pipeline.enabled else None
+        
+        with st.spinner("🐰 Thinking..."):
+            response = st.session_state.rabbit.ask_question(
+                df, question, st.session_state.chat_history, stream=True
+            )
+        
+        # Stream the answer into the chat as tokens arrive; each sentence's audio is queued as soon as it's ready
+        audio_area = st.container()
+        def play(audio, mime):
+            with audio_area:
+                render_audio_queue([(base64.b64encode(audio).decode(), mime)])
+        with chat_container:
+            answer_chunks = speech.tee(response["answer"], on_audio=play) if speech else response["answer"]
+            response["answer"] = stream_chat_message(answer_chunks)
+        st.session_state.last_ttft = st.session_state.rabbit.last_stream_stats.get("ttft")
+        st.session_state.last_prompt_stats = dict(st.session_state.rabbit.prompt_stats)
+        
+        st.session_state.chat_history.append({
+            "role": "assistant",
+            "content": response["answer"],
+            "code": response.get("code"),
+            "figure": response.get("figure"),
+            "language": response.get("language", "python")
+        })
+        
+        if speech:
+            # Most sentences already played while the text was streaming; only the tail is waited for
+            # and queued after the rerun, where the player picks it up behind the current sentence
+            with span("tts.wait", sentences=speech.stats["sentences"]):
+                st.session_state.pending_audio = [
+                    (base64.b64encode(audio).decode(), mime) for audio, mime in speech.chunks()
+                ]
+            st.session_state.last_tts_stats = dict(speech.stats)
+        
+        # Increment key to clear input; only the chat fragment reruns, not the dashboard
+        st.session_state.input_key += 1
+        rerun_chat()
+    
+    if 'pending_audio' in st.session_state:
+        render_audio_queue(st.session_state.pending_audio)
+        del st.session_state.pending_audio
+    
+    # Clear button
+    if st.button("🗑️ Clear Chat", use_container_width=True):
+        st.session_state.chat_history = []
+        st.session_state.chat_page = 0
+        st.session_state.pop('last_prompt_stats', None)
+        st.session_state.last_input = ""
+        st.session_state.input_key += 1
+        rerun_chat()
+
 if 'df' in st.session_state and st.session_state.get('chat_open', False):
     # Initialize
     if 'chat_history' not in st.session_state:
@@ -134,6 +446,8 @@ if 'df' in st.session_state and st.session_state.get('chat_open', False):
         st.session_state.last_input = ""
     if 'input_key' not in st.session_state:
         st.session_state.input_key = 0
+    if 'chat_page' not in st.session_state:
+        st.session_state.chat_page = 0  # 0 = most recent page
     
     # Wider sidebar
     st.markdown("""
@@ -149,111 +463,10 @@ if 'df' in st.session_state and st.session_state.get('chat_open', False):
     """, unsafe_allow_html=True)
     
     with st.sidebar:
-        st.markdown("### 🐰 Chat with Rabbitt")
-        st.markdown("---")
-        
-        # Chat messages
-        chat_container = st.container(height=500)
-        with chat_container:
-            if len(st.session_state.chat_history) == 0:
-                st.info("👋 Hi! Ask me anything about your data. I can answer questions and create visualizations!")
-            else:
-                for idx, message in enumerate(st.session_state.chat_history):
-                    from utils import render_chat_message
-                    render_chat_message(message, key_prefix=f"chat_{idx}")
-        
-        st.markdown("---")
-        
-        # Input with dynamic key to clear after sending
-        user_input = st.text_input(
-            "Message", 
-            key=f"chat_input_{st.session_state.input_key}", 
-            label_visibility="collapsed",
-            placeholder="Type your question..."
-        )
-        
-        col_voice, _ = st.columns([1, 4])
-        with col_voice:
-            voice_input = speech_to_text(
-                language='en',
-                start_prompt="🎤",
-                stop_prompt="🛑",
-                just_once=True,
-                use_container_width=True,
-                key=f"chat_voice_{st.session_state.input_key}"
-            )
-        
-        # Process
-        question = None
-        is_voice = False
-        
-        if voice_input and voice_input != st.session_state.last_input:
-            question = voice_input
-            is_voice = True
-            st.session_state.last_input = voice_input
-        elif user_input and user_input != st.session_state.last_input and user_input.strip():
-            question = user_input
-            is_voice = False
-            st.session_state.last_input = user_input
-        
-        if question:
-            df = st.session_state.df
-            
-            st.session_state.chat_history.append({
-                "role": "user",
-                "content": question,
-                "code": None,
-                "figure": None
-            })
-            
-            with st.spinner("🐰 Thinking..."):
-                response = st.session_state.rabbit.ask_question(
-                    df, question, st.session_state.chat_history
-                )
-            
-            st.session_state.chat_history.append({
-                "role": "assistant",
-                "content": response["answer"],
-                "code": response.get("code"),
-                "figure": response.get("figure")
-            })
-            
-            if is_voice:
-                try:
-                    from gtts import gTTS
-                    import base64
-                    tts = gTTS(text=response["answer"], lang='en')
-                    audio_bytes = io.BytesIO()
-                    tts.write_to_fp(audio_bytes)
-                    audio_bytes.seek(0)
-                    st.session_state.pending_audio = base64.b64encode(audio_bytes.read()).decode()
-                except:
-                    pass
-            
-            # Increment key to clear input
-            st.session_state.input_key += 1
-            st.rerun()
-        
-        if 'pending_audio' in st.session_state:
-            st.markdown(f"""
-            <audio autoplay style="display:none;">
-                <source src="data:audio/mp3;base64,{st.session_state.pending_audio}" type="audio/mp3">
-            </audio>
-            """, unsafe_allow_html=True)
-            del st.session_state.pending_audio
-        
-        # Clear button
-        if st.button("🗑️ Clear Chat", use_container_width=True):
-            st.session_state.chat_history = []
-            st.session_state.last_input = ""
-            st.session_state.input_key += 1
-            st.rerun()
-
-
-
-
-
-
-
-
+        chat_panel()
 
+# --- Debug: Traces ---
+if get_tracer().enabled:
+    with st.sidebar:
+        with st.expander("🛠️ Debug: traces", expanded=False):
+            render_trace_panel(get_tracer(), session=browser_session())
@@ -0,0 +1,143 @@
+import weakref
+
+import numpy as np
+import pandas as pd
+
+from cleaning import ColumnStats, RowHashSet, clean_column, row_hashes
+from compaction import int_dtype_for
+from ingest import StreamingCSVLoader, StreamingExcelLoader
+from profiling import infer_datetime_format, sample_column
+from tracing import traced, current_span
+
+
+def read_delta(file, name: str, sheet=None) -> pd.DataFrame:
+    """Raw (uncleaned) rows of a CSV or Excel file to append, read like the loaders read uploads."""
+    if name.endswith(".csv"):
+        return StreamingCSVLoader().read_raw(file)
+    return StreamingExcelLoader().read_raw(file, sheet)
+
+
+def _concat_aligned(base: pd.DataFrame, delta: pd.DataFrame) -> pd.DataFrame:
+    """Appends `delta` to `base` while keeping base's compact dtypes (categories are extended)."""
+    base = base.copy(deep=False)
+    delta = delta.copy(deep=False)
+    for i in range(base.shape[1]):
+        old, new = base.iloc[:, i], delta.iloc[:, i]
+        if isinstance(old.dtype, pd.CategoricalDtype):
+            values = pd.Index(new.dropna().unique())
+            missing = values[~values.isin(old.cat.categories)]
+            if len(missing):
+                old = old.cat.add_categories(missing)
+                base.isetitem(i, old)
+            delta.isetitem(i, pd.Series(pd.Categorical(new, categories=old.cat.categories), index=new.index))
+        elif old.dtype == new.dtype:
+            continue
+        elif pd.api.types.is_integer_dtype(old.dtype) and pd.api.types.is_numeric_dtype(new.dtype):
+            # Whole new values keep the column integer, widened when they don't fit the downcast type
+            if len(new) and new.notna().all() and (new == np.trunc(new)).all():
+                dtype = max(old.dtype, int_dtype_for(new.min(), new.max()), key=lambda d: d.itemsize)
+                if dtype != old.dtype:
+                    base.isetitem(i, old.astype(dtype))
+                delta.isetitem(i, new.astype(dtype))
+        elif pd.api.types.is_datetime64_any_dtype(old.dtype) and pd.api.types.is_datetime64_any_dtype(new.dtype):
+            cast = new.astype(old.dtype)
+            if (cast.isna() | (cast == new)).all():  # Keep the base's unit unless it would truncate
+                delta.isetitem(i, cast)
+        elif pd.api.types.is_string_dtype(old.dtype) and not pd.api.types.is_object_dtype(old.dtype):
+            delta.isetitem(i, new.astype(old.dtype))
+    return pd.concat([base, delta], ignore_index=True)
+
+
+class DatasetAppender:
+    """
+    Appends rows to an already cleaned dataset, cleaning only the new rows
+    with the Data Janitor's rules. The running state (hashes of the raw rows
+    for dedupe, sums and counts for mean fills, frequency tables for mode
+    fills) is the loader's `raw_state`, handed over with `set_state()`, and
+    is only updated afterwards. New rows are hashed and counted raw, before
+    anything is converted or filled, exactly like rows of the original upload.
+    """
+
+    def __init__(self):
+        self.seen = None     # RowHashSet of the raw rows so far
+        self.stats = {}      # column -> ColumnStats of the raw values
+        self.last_report = {}
+        self._frame = None   # Weak reference to the frame the state describes
+
+    def has_state(self, df: pd.DataFrame) -> bool:
+        return self._frame is not None and self._frame() is df
+
+    def set_state(self, df: pd.DataFrame, raw_state):
+        """Uses `raw_state` (a loader's `(RowHashSet, {column: ColumnStats})`) for appends to `df`."""
+        self.seen, self.stats = raw_state
+        self._frame = weakref.ref(df)
+
+    @traced("append.state")
+    def _build_state(self, df: pd.DataFrame):
+        # Without the loader's state, the cleaned rows are the best approximation of the raw ones
+        self.seen = RowHashSet(row_hashes(df))
+        self.stats = {}
+        for i, name in enumerate(df.columns):
+            self.stats[name] = ColumnStats()
+            self.stats[name].update(df.iloc[:, i])
+        self._frame = weakref.ref(df)
+
+    def _conform(self, df: pd.DataFrame, delta: pd.DataFrame) -> pd.DataFrame:
+        """New rows with the dataset's columns, in order."""
+        extra = [str(c) for c in delta.columns if c not in df.columns]
+        missing = [str(c) for c in df.columns if c not in delta.columns]
+        self.last_report.update(extra_columns=extra, missing_columns=missing)
+        return delta.reindex(columns=df.columns)
+
+    @staticmethod
+    def _clean(target, series: pd.Series, stats: ColumnStats):
+        """One raw column converted to the dataset's date / numeric type and filled like the Data Janitor does."""
+        if pd.api.types.is_datetime64_any_dtype(target):
+            if not pd.api.types.is_datetime64_any_dtype(series.dtype):
+                fmt = infer_datetime_format(sample_column(series))
+                series = pd.to_datetime(series, format=fmt, errors="coerce")
+            # Converted date columns are never filled
+            return series, "none"
+        if pd.api.types.is_bool_dtype(target) or stats is None:
+            return series, "none"
+        if pd.api.types.is_numeric_dtype(target):
+            if not pd.api.types.is_numeric_dtype(series.dtype):
+                series = pd.to_numeric(series, errors="coerce")
+            kind = "numeric"
+        else:
+            kind = "categorical"
+        series, report = clean_column(series, {"kind": kind}, stats)
+        return series, report["action"]
+
+    @traced("append.clean")
+    def append(self, df: pd.DataFrame, delta: pd.DataFrame):
+        """
+        Cleans `delta` (raw new rows) against the running state of `df` and
+        returns (combined frame, cleaned new rows). Pass the combined frame as
+        `df` for the next append to reuse the state.
+        """
+        if not self.has_state(df):
+            self._build_state(df)
+        self.last_report = {"rows_read": len(delta)}
+
+        delta = self._conform(df, delta)
+        # Dedupe and stats see the raw rows, as they did while the dataset was loaded
+        keep = self.seen.keep_new(row_hashes(delta))
+        delta = delta[keep]
+
+        fills = {}
+        for i, name in enumerate(df.columns):
+            series, stats = delta.iloc[:, i], self.stats.get(name)
+            if stats is not None:
+                stats.update(series)
+            series, action = self._clean(df.iloc[:, i].dtype, series, stats)
+            delta.isetitem(i, series)
+            if action != "none":
+                fills[str(name)] = action
+
+        combined = _concat_aligned(df, delta)
+        self._frame = weakref.ref(combined)
+
+        self.last_report.update(rows_added=len(delta), duplicates_dropped=int((~keep).sum()), fills=fills)
+        current_span().set(**{k: v for k, v in self.last_report.items() if k != "fills"})
+        return combined, delta
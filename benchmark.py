@@ -0,0 +1,299 @@
+"""
+Offline benchmark for the Talking Rabbitt pipeline.
+
+Generates synthetic datasets (mixed dtypes, dates, nulls, duplicates), runs
+ingest, cleaning, compaction, profiling, the dashboard and chat questions
+against a local fake LLM with configurable latency, and writes per-stage
+wall time and peak memory as JSON. With --baseline, stages that got slower
+or used more memory than the tolerances allow are reported and the exit
+code is 1.
+
+    python benchmark.py --rows 10000 100000 1000000 --output bench.json
+    python benchmark.py --full --baseline bench.json --tolerance 0.25 --memory-tolerance 0.5
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+
+# Keep every on-disk cache (completions, router, datasets) out of the user's cache directory
+os.environ.setdefault("TALKING_RABBITT_CACHE_DIR", tempfile.mkdtemp(prefix="talking-rabbitt-bench-"))
+
+import numpy as np
+import pandas as pd
+
+# --- Configuration ---
+DEFAULT_ROWS = [10_000, 100_000, 1_000_000]
+FULL_ROWS = [10_000, 100_000, 1_000_000, 10_000_000]
+DEFAULT_LATENCY_SECONDS = 0.05   # Simulated LLM latency per call
+STREAM_CHUNK_SECONDS = 0.005     # Simulated delay between streamed chunks
+DUPLICATE_RATE = 0.02
+NULL_RATE = 0.05
+TOLERANCE = 0.25                 # Allowed slowdown vs. the baseline before a stage is a regression
+MIN_REGRESSION_SECONDS = 0.05    # Ignore differences smaller than this (timer noise)
+MEMORY_TOLERANCE = 0.25          # Allowed growth of a stage's peak memory vs. the baseline
+MIN_REGRESSION_MB = 16.0         # Ignore peak memory differences smaller than this (RSS sampling noise)
+SAMPLE_INTERVAL_SECONDS = 0.005
+
+QUESTIONS = [
+    ("text", "What is the total sales by region?"),
+    ("visualization", "Plot total sales by region as a bar chart"),
+    ("text", "What is the total sales by region?"),  # repeat: exercises the caches
+]
+
+
+# --- Synthetic data ---
+def make_dataset(rows: int, seed: int = 0) -> pd.DataFrame:
+    """Raw, uncleaned frame: text dates, nulls in every kind of column, duplicate rows."""
+    rng = np.random.default_rng(seed)
+    unique_rows = max(int(rows * (1 - DUPLICATE_RATE)), 1)
+    dates = np.datetime64("2020-01-01") + rng.integers(0, 4 * 365, unique_rows).astype("timedelta64[D]")
+    df = pd.DataFrame({
+        "order_id": np.arange(unique_rows),
+        "region": rng.choice(["North", "South", "East", "West", "Central"], unique_rows),
+        "product": np.char.add("SKU-", rng.integers(0, 200, unique_rows).astype(str)),
+        "customer": np.char.add("C", rng.integers(0, 10_000, unique_rows).astype(str)),
+        "order_date": np.datetime_as_string(dates, unit="D"),
+        "units": rng.integers(1, 20, unique_rows).astype(float),
+        "sales": rng.gamma(2.0, 150.0, unique_rows).round(2),
+        "discount": rng.uniform(0, 0.3, unique_rows).round(3),
+        "returned": rng.random(unique_rows) < 0.05,
+    })
+    for column in ["region", "customer", "order_date", "units", "sales"]:
+        mask = rng.random(unique_rows) < NULL_RATE
+        df[column] = df[column].mask(mask)
+
+    duplicates = df.sample(rows - unique_rows, replace=True, random_state=seed) if rows > unique_rows else df.iloc[:0]
+    return pd.concat([df, duplicates], ignore_index=True).sample(frac=1.0, random_state=seed, ignore_index=True)
+
+
+# --- Fake LLM ---
+DASHBOARD_REPLY = json.dumps({"charts": [
+    {"story": "Sales by region", "description": "Total sales per region.",
+     "code": "fig1 = px.bar(df.groupby('region', observed=True)['sales'].sum().reset_index(), x='region', y='sales')"},
+    {"story": "Sales over time", "description": "Monthly sales.",
+     "code": "fig2 = px.line(df.set_index('order_date')['sales'].resample('MS').sum().reset_index(), x='order_date', y='sales')"},
+    {"story": "Order size", "description": "Distribution of sales values.",
+     "code": "fig3 = px.histogram(df, x='sales')"},
+    {"story": "Units vs sales", "description": "Each order.",
+     "code": "fig4 = px.scatter(df, x='units', y='sales')"},
+]})
+TEXT_CODE_REPLY = "result = df.groupby('region', observed=True)['sales'].sum()"
+VIZ_CODE_REPLY = "fig = px.bar(df.groupby('region', observed=True)['sales'].sum().reset_index(), x='region', y='sales')"
+ANSWER_REPLY = ("Total sales are highest in the North region. The South and East follow closely. "
+                "Central has the lowest total.")
+
+
+class FakeLLMClient:
+    """
+    Deterministic stand-in for the Groq client: canned replies chosen from the
+    prompt, a fixed latency per call and chunked streaming.
+    """
+
+    def __init__(self, latency: float = DEFAULT_LATENCY_SECONDS):
+        self.latency = latency
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    @staticmethod
+    def reply_for(prompt: str) -> str:
+        if "Data Visualization Architect" in prompt:
+            return DASHBOARD_REPLY
+        if "VISUALIZATION or just a TEXT" in prompt:
+            return "TEXT"
+        if "Pandas query" in prompt:
+            return TEXT_CODE_REPLY
+        if "Plotly Express (`px`) to create the requested" in prompt:
+            return VIZ_CODE_REPLY
+        if "updated summary" in prompt:
+            return "The user asked about sales by region."
+        if "brief 1-sentence description" in prompt:
+            return "Bar chart of total sales per region."
+        return ANSWER_REPLY
+
+    def create(self, messages, model=None, temperature=None, stream=False, **kwargs):
+        self.calls += 1
+        time.sleep(self.latency)
+        text = self.reply_for(messages[-1]["content"])
+        if not stream:
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=text))])
+
+        def chunks():
+            for word in text.split(" "):
+                time.sleep(STREAM_CHUNK_SECONDS)
+                yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=word + " "))])
+        return chunks()
+
+
+# --- Measurement ---
+def _rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        import resource  # ru_maxrss is a high-water mark: only growth beyond it is visible
+        scale = 1 if sys.platform == "darwin" else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+
+class StageTimer:
+    """Wall time and peak resident memory (above the stage's starting point) of one block."""
+
+    def __init__(self, results: list, rows: int, stage: str):
+        self.results, self.rows, self.stage = results, rows, stage
+        self.detail = None  # Optional stage-specific info, e.g. chart statuses
+
+    def _sample(self):
+        while not self._done.wait(SAMPLE_INTERVAL_SECONDS):
+            self.peak = max(self.peak, _rss_bytes())
+
+    def __enter__(self):
+        self.base = self.peak = _rss_bytes()
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        seconds = time.perf_counter() - self.start
+        self._done.set()
+        self._thread.join()
+        self.peak = max(self.peak, _rss_bytes())
+        entry = {
+            "rows": self.rows, "stage": self.stage, "seconds": round(seconds, 4),
+            "peak_mb": round((self.peak - self.base) / 1024 ** 2, 1),
+            "status": "error" if exc_type else "ok",
+        }
+        if self.detail is not None:
+            entry["detail"] = self.detail
+        if exc_type:
+            entry["error"] = f"{exc_type.__name__}: {exc}"
+        self.results.append(entry)
+        print(f"{self.rows:>12,} {self.stage:<22} {seconds:9.3f}s {entry['peak_mb']:9.1f} MB  {entry['status']}")
+        # Record a failing stage and keep benchmarking the others; Ctrl-C and sys.exit still stop the run
+        return isinstance(exc, Exception)
+
+
+# --- Benchmark ---
+def run_size(rows: int, latency: float, results: list):
+    from agents import DataJanitor, VizArchitect, TalkingRabbit
+    from compaction import compact_dataframe
+    from dataset_profile import DatasetProfile, register_profile
+    from ingest import StreamingCSVLoader
+    from router import IntentRouter
+
+    raw = make_dataset(rows)
+    csv_bytes = raw.to_csv(index=False).encode("utf-8")
+    state = {}
+
+    with StageTimer(results, rows, "ingest_csv_streaming"):
+        state["streamed"] = StreamingCSVLoader().load(io.BytesIO(csv_bytes))
+    with StageTimer(results, rows, "clean_data"):
+        state["df"] = DataJanitor().clean_data(raw)
+    if "df" not in state:
+        return
+    with StageTimer(results, rows, "compact"):
+        state["df"], _ = compact_dataframe(state["df"])
+    df = state["df"]
+    with StageTimer(results, rows, "profile"):
+        register_profile(df, DatasetProfile.build(df))
+
+    client = FakeLLMClient(latency)
+    with StageTimer(results, rows, "generate_charts") as timer:
+        architect = VizArchitect(api_key=None, client=client, use_cache=False)
+        architect.generate_charts(df)
+        timer.detail = [t["status"] for t in architect.last_chart_timings]
+
+    router = IntentRouter(directory=tempfile.mkdtemp(prefix="router-"))
+    rabbit = TalkingRabbit(api_key=None, router=router, client=client, use_cache=False)
+    history = []
+    for i, (kind, question) in enumerate(QUESTIONS):
+        history.append({"role": "user", "content": question})
+        answer = ""
+        with StageTimer(results, rows, f"ask_{kind}_{i + 1}") as timer:
+            response = rabbit.ask_question(df, question, history, stream=True)
+            # Streamed answers are consumed inside the stage, as the chat UI would
+            answer = response["answer"] if isinstance(response["answer"], str) else "".join(response["answer"])
+            timer.detail = {"type": response["type"], "prompt_tokens": rabbit.prompt_stats["prompt_tokens"]}
+        history.append({"role": "assistant", "content": answer})
+
+
+def compare(results: list, baseline_path: str, tolerance: float, memory_tolerance: float = MEMORY_TOLERANCE) -> list:
+    """
+    Stages slower than baseline * (1 + tolerance), or whose peak memory
+    exceeds baseline * (1 + memory_tolerance), ignoring sub-noise differences.
+    Each regression names its `metric` ("seconds" or "peak_mb") and `baseline`.
+    """
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = {(r["rows"], r["stage"]): r for r in json.load(f)["results"]}
+    checks = (("seconds", tolerance, MIN_REGRESSION_SECONDS), ("peak_mb", memory_tolerance, MIN_REGRESSION_MB))
+    regressions = []
+    for result in results:
+        before = baseline.get((result["rows"], result["stage"]))
+        if before is None or result["status"] != "ok":
+            continue
+        for metric, allowed, noise in checks:
+            if metric not in before:
+                continue
+            limit = before[metric] * (1 + allowed)
+            if result[metric] > limit and result[metric] - before[metric] > noise:
+                regressions.append({**result, "metric": metric, "baseline": before[metric]})
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Offline Talking Rabbitt benchmark")
+    parser.add_argument("--rows", type=int, nargs="+", default=None, help="Dataset sizes to run")
+    parser.add_argument("--full", action="store_true", help="Run every size up to 10M rows")
+    parser.add_argument("--latency", type=float, default=DEFAULT_LATENCY_SECONDS, help="Fake LLM seconds per call")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", help="Previous results JSON to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE, help="Allowed slowdown per stage")
+    parser.add_argument("--memory-tolerance", type=float, default=MEMORY_TOLERANCE,
+                        help="Allowed peak memory growth per stage")
+    args = parser.parse_args(argv)
+
+    sizes = args.rows or (FULL_ROWS if args.full else DEFAULT_ROWS)
+    results = []
+
+    # Start the sandbox worker pool up front so the first size doesn't pay for process start-up
+    from sandbox import get_sandbox
+    get_sandbox()
+    print(f"{'rows':>12} {'stage':<22} {'time':>10} {'peak':>12}")
+    for rows in sizes:
+        run_size(rows, args.latency, results)
+
+    from sandbox import SANDBOX_ENABLED
+    report = {
+        "meta": {
+            "python": platform.python_version(), "pandas": pd.__version__, "numpy": np.__version__,
+            "platform": platform.platform(), "cpus": os.cpu_count(), "sandbox": SANDBOX_ENABLED,
+            "fake_llm_latency_seconds": args.latency, "timestamp": time.time(),
+        },
+        "results": results,
+    }
+
+    exit_code = 1 if any(r["status"] != "ok" for r in results) else 0
+    if args.baseline:
+        report["regressions"] = compare(results, args.baseline, args.tolerance, args.memory_tolerance)
+        for r in report["regressions"]:
+            fmt = "{:.3f}s" if r["metric"] == "seconds" else "{:.1f} MB"
+            print(f"REGRESSION {r['rows']:,} rows {r['stage']}: "
+                  f"{fmt.format(r['baseline'])} -> {fmt.format(r[r['metric']])}")
+        exit_code = exit_code or int(bool(report["regressions"]))
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
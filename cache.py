@@ -0,0 +1,391 @@
+import ast
+import hashlib
+import json
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+except ImportError:  # pyarrow is optional; without it the dataset cache is disabled
+    pa = None
+
+# --- Configuration ---
+CACHE_ROOT = os.environ.get(
+    "TALKING_RABBITT_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "talking-rabbitt")
+)
+DATASET_CACHE_BYTES = 2 * 1024 ** 3  # Disk budget for cleaned datasets before LRU eviction
+COMPLETION_TTL_SECONDS = 7 * 24 * 3600
+COMPLETION_MEMORY_ENTRIES = 512
+COMPLETION_DISK_ENTRIES = 20_000
+RESULT_CACHE_BYTES = 64 * 1024 ** 2  # Per-session budget for memoized generated-code results
+COPY_ON_WRITE = int(pd.__version__.split(".")[0]) >= 3  # Writes never reach a shallow copy
+
+
+def content_hash(data) -> str:
+    """Hex digest of a bytes-like object (e.g. `uploaded_file.getbuffer()`)."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def snapshot_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    A copy of `df` to check it against later with `frame_unchanged`.
+    Under copy-on-write (the default from pandas 3), writing to `df` copies
+    the written block, so a shallow copy suffices; older pandas gets a deep copy.
+    """
+    return df.copy(deep=not COPY_ON_WRITE)
+
+
+def frame_unchanged(df: pd.DataFrame, snapshot: pd.DataFrame) -> bool:
+    """True while `df` holds the same labels and data as when `snapshot` was taken."""
+    if df.shape != snapshot.shape or not df.columns.equals(snapshot.columns) or not df.index.equals(snapshot.index):
+        return False
+    if COPY_ON_WRITE:
+        try:
+            blocks, snapshot_blocks = df._mgr.blocks, snapshot._mgr.blocks
+            # A block that was written to (or replaced) no longer shares reference tracking with the snapshot
+            return len(blocks) == len(snapshot_blocks) and all(a.refs is b.refs for a, b in zip(blocks, snapshot_blocks))
+        except AttributeError:
+            pass
+    # No usable reference tracking: compare the data itself
+    return df.equals(snapshot)
+
+
+_fingerprints = {}  # id(df) -> (weakref to df, snapshot of df, fingerprint)
+_fingerprints_lock = threading.Lock()
+
+
+def dataset_fingerprint(df: pd.DataFrame) -> str:
+    """
+    Stable content fingerprint of a DataFrame (values, index, column names and
+    dtypes). Memoized per frame object, and recomputed if the frame was
+    changed in place since.
+    """
+    with _fingerprints_lock:
+        entry = _fingerprints.get(id(df))
+        if entry is not None and entry[0]() is df and frame_unchanged(df, entry[1]):
+            return entry[2]
+
+    snapshot = snapshot_frame(df)
+    digest = hashlib.sha256()
+    digest.update(json.dumps([[str(c), str(t)] for c, t in df.dtypes.items()]).encode("utf-8"))
+    digest.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    fingerprint = digest.hexdigest()
+
+    with _fingerprints_lock:
+        key = id(df)
+        _fingerprints[key] = (weakref.ref(df, lambda _, key=key: _fingerprints.pop(key, None)), snapshot, fingerprint)
+    return fingerprint
+
+
+def canonical_code(code: str) -> str:
+    """Normalizes formatting, comments and quoting so equivalent snippets share a key."""
+    try:
+        return ast.unparse(ast.parse(code))
+    except (SyntaxError, ValueError):
+        return code.strip()
+
+
+# --- Cleaned dataset cache ---
+class DatasetCache:
+    """
+    Content-addressed on-disk cache of cleaned DataFrames.
+    Entries are uncompressed Arrow IPC files, memory-mapped on read, so numeric
+    columns without nulls come back as read-only views of the file (write
+    through a copy). The index is stored too. The least recently used entries
+    are evicted once the cache grows past `max_bytes`.
+    """
+
+    SUFFIX = ".arrow"
+    METADATA_KEY = b"talking_rabbitt"  # Schema metadata entry holding caller-supplied JSON
+
+    def __init__(self, directory: str = None, max_bytes: int = DATASET_CACHE_BYTES):
+        self.directory = directory or os.path.join(CACHE_ROOT, "datasets")
+        self.max_bytes = max_bytes
+        self.enabled = pa is not None
+        if self.enabled:
+            os.makedirs(self.directory, exist_ok=True)
+
+    def make_key(self, data, version: str, variant: str = None) -> str:
+        """
+        Cache key for raw upload bytes cleaned by a given janitor version.
+        `variant` tells apart several datasets read from one upload (e.g. workbook sheets).
+        """
+        key = f"{content_hash(data)}-{version}"
+        return f"{key}-{content_hash(variant.encode('utf-8'))[:16]}" if variant is not None else key
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + self.SUFFIX)
+
+    def get(self, key: str):
+        """Returns the cached DataFrame for `key`, or None on a miss."""
+        df, _ = self.get_entry(key)
+        return df
+
+    def get_entry(self, key: str):
+        """Returns (DataFrame, metadata dict) for `key`, or (None, None) on a miss."""
+        if not self.enabled:
+            return None, None
+        path = self._path(key)
+        try:
+            with pa.memory_map(path, "r") as source:
+                table = pa.ipc.open_file(source).read_all()
+            raw = (table.schema.metadata or {}).get(self.METADATA_KEY)
+            metadata = json.loads(raw) if raw else {}
+            # One block per column: null-free numeric columns stay views of the mapped file
+            df = table.to_pandas(split_blocks=True, self_destruct=True)
+            del table
+        except (FileNotFoundError, pa.ArrowInvalid, OSError, ValueError):
+            return None, None
+        # Touch the entry so eviction treats it as recently used
+        os.utime(path, None)
+        return df, metadata
+
+    def put(self, key: str, df: pd.DataFrame, metadata: dict = None) -> bool:
+        """
+        Stores `df` under `key`, with optional JSON-serializable `metadata`
+        (e.g. the dataset profile). Returns False if the frame can't be written as Arrow.
+        """
+        if not self.enabled:
+            return False
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            # A RangeIndex is stored as metadata, any other index as columns
+            table = pa.Table.from_pandas(df, preserve_index=None)
+            if metadata:
+                schema_metadata = dict(table.schema.metadata or {})
+                schema_metadata[self.METADATA_KEY] = json.dumps(metadata).encode("utf-8")
+                table = table.replace_schema_metadata(schema_metadata)
+            with pa.OSFile(tmp_path, "wb") as sink:
+                with pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+            os.replace(tmp_path, path)
+        except (pa.ArrowInvalid, pa.ArrowTypeError, TypeError, OSError) as e:
+            print(f"Dataset cache write skipped: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return False
+        self.evict()
+        return True
+
+    def evict(self):
+        """Removes least recently used entries until the cache fits in `max_bytes`."""
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(self.SUFFIX):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def size_bytes(self) -> int:
+        return sum(
+            os.path.getsize(os.path.join(self.directory, name))
+            for name in os.listdir(self.directory)
+            if name.endswith(self.SUFFIX)
+        ) if self.enabled else 0
+
+
+# --- LLM completion cache ---
+class CompletionCache:
+    """
+    Two-tier cache of LLM completions: an in-process LRU in front of a SQLite
+    store on disk. Keys cover the model, system message, prompt and sampling
+    parameters; entries expire after `ttl` seconds.
+    """
+
+    def __init__(self, path: str = None, ttl: float = COMPLETION_TTL_SECONDS,
+                 max_memory_entries: int = COMPLETION_MEMORY_ENTRIES,
+                 max_disk_entries: int = COMPLETION_DISK_ENTRIES):
+        self.path = path or os.path.join(CACHE_ROOT, "completions.sqlite3")
+        self.ttl = ttl
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "writes": 0}
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS completions ("
+            "key TEXT PRIMARY KEY, value TEXT, created REAL, accessed REAL)"
+        )
+        self._db.commit()
+
+    @staticmethod
+    def make_key(model, system_message, prompt, **params) -> str:
+        payload = json.dumps(
+            {"model": model, "system": system_message, "prompt": prompt, "params": params},
+            sort_keys=True,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str):
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, created = entry
+                if now - created < self.ttl:
+                    self._memory.move_to_end(key)
+                    self.stats["memory_hits"] += 1
+                    return value
+                del self._memory[key]
+
+            row = self._db.execute(
+                "SELECT value, created FROM completions WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and now - row[1] < self.ttl:
+                self._db.execute("UPDATE completions SET accessed = ? WHERE key = ?", (now, key))
+                self._db.commit()
+                self._remember(key, row[0], row[1])
+                self.stats["disk_hits"] += 1
+                return row[0]
+
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, key: str, value: str):
+        now = time.time()
+        with self._lock:
+            self._remember(key, value, now)
+            self._db.execute(
+                "INSERT OR REPLACE INTO completions (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                (key, value, now, now),
+            )
+            # Drop expired rows, then the least recently used ones past the size limit
+            self._db.execute("DELETE FROM completions WHERE created < ?", (now - self.ttl,))
+            self._db.execute(
+                "DELETE FROM completions WHERE key IN ("
+                "SELECT key FROM completions ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                (self.max_disk_entries,),
+            )
+            self._db.commit()
+            self.stats["writes"] += 1
+
+    def delete(self, key: str):
+        """Drops one entry, e.g. a reply whose generated code failed to run."""
+        with self._lock:
+            self._memory.pop(key, None)
+            self._db.execute("DELETE FROM completions WHERE key = ?", (key,))
+            self._db.commit()
+
+    def _remember(self, key, value, created):
+        self._memory[key] = (value, created)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._db.execute("DELETE FROM completions")
+            self._db.commit()
+
+    def hit_rate(self) -> float:
+        hits = self.stats["memory_hits"] + self.stats["disk_hits"]
+        total = hits + self.stats["misses"]
+        return hits / total if total else 0.0
+
+
+# --- Generated-code result cache ---
+def _estimate_bytes(value) -> int:
+    if isinstance(value, tuple):
+        return sum(_estimate_bytes(item) for item in value)
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        usage = value.memory_usage(deep=True)
+        return int(usage.sum()) if isinstance(usage, pd.Series) else int(usage)
+    try:
+        return len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return 1024
+
+
+class ResultCache:
+    """
+    Memory-bounded LRU of generated-code results, keyed by the dataset
+    fingerprint plus the AST-canonical form of the code.
+    """
+
+    def __init__(self, max_bytes: int = RESULT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.stats = {"hits": 0, "misses": 0}
+        self._entries = OrderedDict()  # key -> (value, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(fingerprint: str, code: str, outputs=()) -> str:
+        payload = json.dumps([canonical_code(code), list(outputs)])
+        # The fingerprint prefix lets `forget` drop one dataset's results
+        return f"{fingerprint}:{hashlib.sha256(payload.encode('utf-8')).hexdigest()}"
+
+    def get(self, key: str):
+        """Returns (hit, value); cached results may legitimately be None."""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return True, self._entries[key][0]
+            self.stats["misses"] += 1
+            return False, None
+
+    def put(self, key: str, value):
+        size = _estimate_bytes(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+
+    def forget(self, fingerprint: str):
+        """Drops the results computed on one dataset, e.g. after rows were appended to it."""
+        prefix = f"{fingerprint}:"
+        with self._lock:
+            for key in [k for k in self._entries if k.startswith(prefix)]:
+                self._bytes -= self._entries.pop(key)[1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+
+_default_completion_cache = None
+_default_completion_cache_lock = threading.Lock()
+
+
+def default_completion_cache() -> CompletionCache:
+    """Process-wide completion cache shared by every agent instance."""
+    global _default_completion_cache
+    with _default_completion_cache_lock:
+        if _default_completion_cache is None:
+            _default_completion_cache = CompletionCache()
+        return _default_completion_cache
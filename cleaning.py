@@ -0,0 +1,129 @@
+import numpy as np
+import pandas as pd
+
+_NULL_HASH = np.uint64(0x9E3779B97F4A7C15)  # Every missing cell hashes alike, whatever its dtype
+_HASH_MULTIPLIER = np.uint64(1_000_003)
+
+
+def row_hashes(df: pd.DataFrame) -> np.ndarray:
+    """
+    Per-row uint64 hashes that don't depend on how a reader typed a chunk:
+    numbers hash as float64 (so an int chunk and a float chunk agree),
+    missing values hash alike, and categoricals hash as their values.
+    """
+    combined = np.zeros(len(df), dtype=np.uint64)
+    for i in range(df.shape[1]):
+        series = df.iloc[:, i]
+        if pd.api.types.is_bool_dtype(series.dtype) or isinstance(series.dtype, pd.CategoricalDtype):
+            values = series.astype(object).to_numpy()
+        elif pd.api.types.is_numeric_dtype(series.dtype):
+            values = series.to_numpy(dtype="float64", na_value=np.nan)
+        elif pd.api.types.is_datetime64_any_dtype(series.dtype) and series.dt.tz is None:
+            values = series.to_numpy().astype("datetime64[ns]")
+        else:
+            values = series.to_numpy(dtype=object)
+        hashes = pd.util.hash_array(values)
+        hashes[series.isna().to_numpy()] = _NULL_HASH
+        combined = combined * _HASH_MULTIPLIER ^ hashes
+    return combined
+
+
+class RowHashSet:
+    """Row hashes seen so far, kept as a sorted uint64 array and searched with binary search."""
+
+    def __init__(self, hashes: np.ndarray = None):
+        self.hashes = np.unique(hashes) if hashes is not None else np.empty(0, dtype=np.uint64)
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def contains(self, hashes: np.ndarray) -> np.ndarray:
+        if not len(self.hashes):
+            return np.zeros(len(hashes), dtype=bool)
+        positions = np.minimum(np.searchsorted(self.hashes, hashes), len(self.hashes) - 1)
+        return self.hashes[positions] == hashes
+
+    def add(self, hashes: np.ndarray):
+        new = np.unique(hashes)
+        new = new[~self.contains(new)]
+        self.hashes = np.insert(self.hashes, np.searchsorted(self.hashes, new), new)
+
+    def keep_new(self, hashes: np.ndarray) -> np.ndarray:
+        """Mask of rows not seen before (first occurrence within `hashes` too); remembers them."""
+        keep = ~pd.Series(hashes).duplicated().to_numpy() & ~self.contains(hashes)
+        self.add(hashes[keep])
+        return keep
+
+
+class ColumnStats:
+    """Running fill-value statistics for one column's raw values, updated batch by batch."""
+
+    def __init__(self):
+        self.total = 0.0
+        self.count = 0
+        self.numeric_chunks = 0
+        self.text_chunks = 0
+        self.counts = None  # value -> occurrences (Series)
+
+    def update(self, series: pd.Series):
+        # A batch without values says nothing, whatever type its reader gave the empty column
+        if pd.api.types.is_bool_dtype(series.dtype) or not series.notna().any():
+            return
+        if pd.api.types.is_numeric_dtype(series.dtype):
+            self.numeric_chunks += 1
+            self.total += float(series.sum())
+            self.count += int(series.count())
+        elif (pd.api.types.is_object_dtype(series.dtype) or pd.api.types.is_string_dtype(series.dtype)
+              or isinstance(series.dtype, pd.CategoricalDtype)):
+            self.text_chunks += 1
+            counts = series.value_counts()
+            counts = counts[counts > 0]  # Categoricals also list unused categories
+            counts.index = counts.index.astype(object)
+            self.counts = counts if self.counts is None else self.counts.add(counts, fill_value=0)
+
+    def mean(self):
+        if self.text_chunks or not self.count:
+            return None
+        return self.total / self.count
+
+    def mode(self):
+        if self.numeric_chunks or self.counts is None or not len(self.counts):
+            return None
+        # Same tie-breaking as Series.mode(): smallest of the most frequent values
+        return sorted(self.counts.index[self.counts == self.counts.max()])[0]
+
+
+def clean_column(series: pd.Series, profile: dict, stats: ColumnStats = None):
+    """
+    The Data Janitor's rules for one column, given its profile from
+    `ColumnProfiler`: date text is converted when every value parses,
+    missing text is filled with the mode and missing numbers and datetimes
+    with the mean. Fill values come from `stats` (raw values accumulated
+    elsewhere, e.g. while streaming) when given, else from the column.
+    Returns (series, profile with the "action" taken).
+    """
+    action = "none"
+
+    if profile["kind"] == "date_text":
+        # Full-length conversion only runs for columns whose sample parsed cleanly
+        converted = pd.to_datetime(series, format=profile["format"], errors="coerce")
+        if converted.isna().sum() == series.isna().sum():
+            series = converted
+            action = "to_datetime"
+        else:
+            # Values outside the sample broke the format: keep it as text
+            profile = dict(profile, kind="categorical")
+
+    # Columns with no values at all have nothing to fill from
+    if action == "none" and series.isnull().any() and not series.isnull().all():
+        if profile["kind"] == "categorical":
+            fill = stats.mode() if stats is not None else None
+            series = series.fillna(fill if fill is not None else series.mode()[0])
+            action = "fill_mode"
+        elif profile["kind"] in ("numeric", "datetime"):
+            # Datetime columns get their mean too, as before type inference existed
+            fill = stats.mean() if stats is not None else None
+            series = series.fillna(fill if fill is not None else series.mean())
+            action = "fill_mean"
+
+    return series, dict(profile, action=action)
@@ -0,0 +1,156 @@
+import numpy as np
+import pandas as pd
+
+from tracing import traced, current_span
+
+try:
+    import pyarrow  # noqa: F401  (only needed for Arrow-backed string dtypes)
+    HAS_ARROW = True
+except ImportError:
+    HAS_ARROW = False
+
+# --- Configuration ---
+CATEGORY_MAX_RATIO = 0.5     # Convert text to category when unique/rows is at most this
+CATEGORY_MAX_UNIQUE = 50_000 # ...and there are at most this many distinct values
+ARROW_STRINGS = True         # Store remaining text columns as Arrow-backed strings
+DOWNCAST_FLOATS = False      # float32 storage is exact, but pandas then aggregates in float32
+INT_DTYPES = (np.int8, np.int16, np.int32, np.int64)
+
+
+def _is_text(series: pd.Series) -> bool:
+    if pd.api.types.is_string_dtype(series.dtype) and not pd.api.types.is_object_dtype(series.dtype):
+        return True
+    return pd.api.types.is_object_dtype(series.dtype) and pd.api.types.infer_dtype(series, skipna=True) == "string"
+
+
+def _arrow_string_dtype():
+    try:
+        return pd.StringDtype("pyarrow", na_value=np.nan)  # pandas' default "str" dtype from 3.0
+    except TypeError:
+        return pd.StringDtype("pyarrow")
+
+
+def int_dtype_for(low, high):
+    """
+    Narrowest integer type for values in [low, high] that still holds the
+    product of any two of them, so generated arithmetic such as qty * price
+    can't wrap around silently.
+    """
+    bound = max(abs(int(low)), abs(int(high)))
+    for dtype in INT_DTYPES:
+        if bound * bound <= np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    return np.dtype(np.int64)
+
+
+def _downcast_int(series: pd.Series) -> pd.Series:
+    if series.dtype != np.int64 or not len(series):
+        return series
+    dtype = int_dtype_for(series.min(), series.max())
+    return series.astype(dtype) if dtype != series.dtype else series
+
+
+def _downcast_float(series: pd.Series) -> pd.Series:
+    """float64 -> float32 only when every value survives the round trip exactly."""
+    if series.dtype != np.float64:
+        return series
+    values = series.to_numpy()
+    with np.errstate(over="ignore"):
+        narrow = values.astype(np.float32)
+    same = (narrow.astype(np.float64) == values) | (np.isnan(values) & np.isnan(narrow))
+    return pd.Series(narrow, index=series.index, name=series.name) if same.all() else series
+
+
+@traced("compact")
+def compact_dataframe(df: pd.DataFrame, arrow_strings: bool = ARROW_STRINGS, downcast_floats: bool = DOWNCAST_FLOATS):
+    """
+    Shrinks a cleaned frame in memory:
+    1. Low-cardinality text columns become categoricals; categoricals drop unused categories.
+    2. Integers (and optionally floats) are downcast where it is lossless,
+       keeping room for the product of two values (`int_dtype_for`).
+    3. Optionally, remaining text columns use Arrow-backed strings.
+    Returns (compacted_df, report).
+    """
+    before = df.memory_usage(deep=True)
+    out = df.copy(deep=False)
+    changes = {}
+
+    for i in range(out.shape[1]):
+        series = out.iloc[:, i]
+        new = series
+
+        if pd.api.types.is_bool_dtype(series.dtype):
+            continue
+        elif isinstance(series.dtype, pd.CategoricalDtype):
+            pruned = series.cat.remove_unused_categories()
+            unused = len(series.cat.categories) - len(pruned.cat.categories)
+            if unused:
+                out.isetitem(i, pruned)
+                changes[str(series.name)] = f"{unused:,} unused categories dropped"
+            continue
+        elif pd.api.types.is_integer_dtype(series.dtype):
+            new = _downcast_int(series)
+        elif pd.api.types.is_float_dtype(series.dtype) and downcast_floats:
+            new = _downcast_float(series)
+        elif _is_text(series):
+            n_unique = series.nunique(dropna=True)
+            if n_unique <= CATEGORY_MAX_UNIQUE and n_unique <= CATEGORY_MAX_RATIO * max(len(series), 1):
+                new = series.astype("category")
+            elif arrow_strings and HAS_ARROW and pd.api.types.is_object_dtype(series.dtype):
+                new = series.astype(_arrow_string_dtype())
+
+        if new is not series and new.dtype != series.dtype:
+            out.isetitem(i, new)
+            changes[str(series.name)] = f"{series.dtype} -> {new.dtype}"
+
+    after = out.memory_usage(deep=True)
+    report = {
+        "before_bytes": int(before.sum()),
+        "after_bytes": int(after.sum()),
+        "changes": changes,
+    }
+    current_span().set(before_bytes=report["before_bytes"], after_bytes=report["after_bytes"])
+    return out, report
+
+
+def prune_categories(value):
+    """
+    Drops the categories a generated-code result doesn't use (e.g. after a
+    filter), so they don't come back as zero-count rows of value_counts().
+    """
+    if isinstance(value, pd.Series):
+        if isinstance(value.dtype, pd.CategoricalDtype):
+            value = value.cat.remove_unused_categories()
+        if isinstance(value.index, pd.CategoricalIndex):
+            if value.name in ("count", "proportion"):
+                # A category that occurs at all has a non-zero count
+                value = value[value != 0]
+            value.index = value.index.remove_unused_categories()
+    elif isinstance(value, pd.DataFrame):
+        value = value.copy(deep=False)
+        for i, dtype in enumerate(value.dtypes):
+            if isinstance(dtype, pd.CategoricalDtype):
+                value.isetitem(i, value.iloc[:, i].cat.remove_unused_categories())
+        if isinstance(value.index, pd.CategoricalIndex):
+            value.index = value.index.remove_unused_categories()
+    return value
+
+
+def has_categoricals(df: pd.DataFrame) -> bool:
+    return any(isinstance(dtype, pd.CategoricalDtype) for dtype in df.dtypes)
+
+
+def expand_dataframe(df: pd.DataFrame) -> pd.DataFrame:
+    """Undoes the categorical conversion, for code that can't handle categoricals."""
+    out = df.copy(deep=False)
+    for i, dtype in enumerate(out.dtypes):
+        if isinstance(dtype, pd.CategoricalDtype):
+            out.isetitem(i, out.iloc[:, i].astype(dtype.categories.dtype))
+    return out
+
+
+def format_bytes(n) -> str:
+    for unit in ["B", "KB", "MB", "GB"]:
+        if abs(n) < 1024 or unit == "GB":
+            return f"{n:.1f} {unit}" if unit != "B" else f"{n} B"
+        n /= 1024
@@ -0,0 +1,224 @@
+import threading
+import weakref
+
+import numpy as np
+import pandas as pd
+
+from llm import estimate_tokens
+from tracing import traced
+
+# --- Configuration ---
+PROFILE_VERSION = 1
+PROMPT_TOKEN_BUDGET = 800   # Upper bound for the dataset block embedded in every prompt
+TOP_CATEGORIES = 5
+MAX_TOP_UNIQUE = 1000       # Text columns with more distinct values don't list top values
+SAMPLE_ROWS = 3
+MAX_CELL_CHARS = 40
+
+
+def _scalar(value):
+    """JSON-friendly version of a numpy / pandas scalar."""
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return None
+    if isinstance(value, (pd.Timestamp, np.datetime64)):
+        return pd.Timestamp(value).isoformat()
+    if isinstance(value, np.integer):
+        return int(value)
+    if isinstance(value, np.floating):
+        return float(value)
+    if isinstance(value, np.bool_):
+        return bool(value)
+    return value
+
+
+def _short(value) -> str:
+    text = str(value)
+    return text if len(text) <= MAX_CELL_CHARS else text[:MAX_CELL_CHARS - 1] + "…"
+
+
+def _number(value) -> str:
+    if isinstance(value, float):
+        return f"{value:,.6g}" if abs(value) < 1e6 else f"{value:,.0f}"
+    return f"{value:,}" if isinstance(value, int) else str(value)
+
+
+class DatasetProfile:
+    """
+    Everything the prompts need to know about a dataset, computed once at load
+    time: per-column dtypes, null counts, cardinalities, numeric and date
+    ranges, top categories and a few sample rows. Renders into a prompt block
+    that fits a token budget, and round-trips through a dict so it can be
+    cached alongside the dataset.
+    """
+
+    def __init__(self, n_rows: int, columns: list, sample: list):
+        self.n_rows = n_rows
+        self.columns = columns   # one dict per column
+        self.sample = sample     # list of row dicts with shortened string values
+
+    @classmethod
+    @traced("profile.build")
+    def build(cls, df: pd.DataFrame):
+        columns = []
+        for i, name in enumerate(df.columns):
+            series = df.iloc[:, i]
+            info = {"name": str(name), "dtype": str(series.dtype), "nulls": int(series.isna().sum())}
+
+            if isinstance(series.dtype, pd.CategoricalDtype):
+                counts = series.value_counts(sort=True)
+                info["unique"] = int((counts > 0).sum())
+                if info["unique"] > MAX_TOP_UNIQUE:
+                    counts = None
+            else:
+                counts = None
+                info["unique"] = int(series.nunique(dropna=True))
+
+            if pd.api.types.is_bool_dtype(series.dtype):
+                counts = series.value_counts(sort=True)
+            elif pd.api.types.is_numeric_dtype(series.dtype):
+                info.update(
+                    min=_scalar(series.min()), max=_scalar(series.max()), mean=_scalar(series.mean())
+                )
+            elif pd.api.types.is_datetime64_any_dtype(series.dtype):
+                info.update(min=_scalar(series.min()), max=_scalar(series.max()))
+            elif not isinstance(series.dtype, pd.CategoricalDtype) and info["unique"] <= MAX_TOP_UNIQUE:
+                counts = series.value_counts(sort=True)
+
+            if counts is not None:
+                non_null = max(len(series) - info["nulls"], 1)
+                info["top"] = [
+                    [_short(value), round(int(count) / non_null, 3)]
+                    for value, count in counts.head(TOP_CATEGORIES).items() if count > 0
+                ]
+            columns.append(info)
+
+        sample = [
+            {str(k): _short(_number(v) if isinstance(v, float) else v) for k, v in row.items()}
+            for row in df.head(SAMPLE_ROWS).to_dict(orient="records")
+        ]
+        return cls(len(df), columns, sample)
+
+    @traced("profile.extend")
+    def extend(self, base: pd.DataFrame, delta: pd.DataFrame, combined: pd.DataFrame):
+        """
+        Profile of `combined` (`base` with the `delta` rows appended), derived
+        from this profile of `base`. Counts, ranges and means are merged from
+        the delta alone; only top values and distinct counts look at the base.
+        """
+        if not len(delta):
+            return DatasetProfile(len(combined), self.columns, self.sample)
+        previous = {info["name"]: info for info in self.columns}
+        columns = []
+        for i, name in enumerate(combined.columns):
+            series, new = combined.iloc[:, i], delta.iloc[:, i]
+            old = previous.get(str(name))
+            if old is None or old["dtype"] != str(series.dtype):
+                # The append changed the column's dtype; profile the whole column
+                columns.append(DatasetProfile.build(combined[[name]]).columns[0])
+                continue
+            info = dict(old, nulls=old["nulls"] + int(new.isna().sum()))
+
+            if pd.api.types.is_numeric_dtype(series.dtype) and not pd.api.types.is_bool_dtype(series.dtype):
+                old_count, new_count = self.n_rows - old["nulls"], int(new.count())
+                if new_count:
+                    info["min"] = _scalar(min(v for v in (old["min"], new.min()) if v is not None))
+                    info["max"] = _scalar(max(v for v in (old["max"], new.max()) if v is not None))
+                    info["mean"] = _scalar(
+                        ((old["mean"] or 0.0) * old_count + float(new.sum())) / (old_count + new_count)
+                    )
+            elif pd.api.types.is_datetime64_any_dtype(series.dtype):
+                values = [pd.Timestamp(v) for v in (old["min"], old["max"]) if v is not None]
+                values += [v for v in (new.min(), new.max()) if pd.notna(v)]
+                if values:
+                    info.update(min=_scalar(min(values)), max=_scalar(max(values)))
+
+            if "top" in old or isinstance(series.dtype, pd.CategoricalDtype) or pd.api.types.is_bool_dtype(series.dtype):
+                # Small frequency tables are cheap to recount
+                fresh = DatasetProfile.build(combined[[name]]).columns[0]
+                info["unique"] = fresh["unique"]
+                info.pop("top", None)
+                if "top" in fresh:
+                    info["top"] = fresh["top"]
+            else:
+                # Distinct values of the delta that the base doesn't already have
+                values = new.dropna().unique()
+                overlap = int(pd.Series(values).isin(base.iloc[:, i]).sum())
+                info["unique"] = old["unique"] + len(values) - overlap
+            columns.append(info)
+        return DatasetProfile(len(combined), columns, self.sample)
+
+    @property
+    def column_names(self) -> list:
+        return [c["name"] for c in self.columns]
+
+    @property
+    def dtypes(self) -> dict:
+        return {c["name"]: c["dtype"] for c in self.columns}
+
+    def _column_line(self, info: dict, top_k: int) -> str:
+        parts = [info["dtype"], f"{info['unique']:,} unique"]
+        if info["nulls"]:
+            parts.append(f"{info['nulls']:,} nulls")
+        line = f"- {info['name']} ({', '.join(parts)})"
+        if "mean" in info and info["min"] is not None:
+            line += f": min {_number(info['min'])}, max {_number(info['max'])}, mean {_number(info['mean'])}"
+        elif "min" in info and info["min"] is not None:
+            line += f": {str(info['min'])[:10]} to {str(info['max'])[:10]}"
+        elif info.get("top") and top_k:
+            top = ", ".join(f"{value} ({share:.0%})" for value, share in info["top"][:top_k])
+            line += f": top {top}"
+        return line
+
+    def _render(self, top_k: int, sample_rows: int, max_columns: int) -> str:
+        lines = [f"Rows: {self.n_rows:,} | Columns: {len(self.columns)}", "Columns:"]
+        lines += [self._column_line(info, top_k) for info in self.columns[:max_columns]]
+        if len(self.columns) > max_columns:
+            hidden = [c["name"] for c in self.columns[max_columns:]]
+            lines.append(f"- ... and {len(hidden)} more: {', '.join(hidden)}")
+        if sample_rows and self.sample:
+            lines.append("Sample rows:")
+            lines += [str(row) for row in self.sample[:sample_rows]]
+        return "\n".join(lines)
+
+    def to_prompt(self, max_tokens: int = PROMPT_TOKEN_BUDGET) -> str:
+        """Dataset description for prompts, shedding detail until it fits `max_tokens`."""
+        n = len(self.columns)
+        levels = [(TOP_CATEGORIES, SAMPLE_ROWS, n), (3, 2, n), (1, 1, n), (0, 0, n)]
+        levels += [(0, 0, k) for k in (80, 40, 20, 10)]
+        text = ""
+        for top_k, sample_rows, max_columns in levels:
+            text = self._render(top_k, sample_rows, max_columns)
+            if estimate_tokens(text) <= max_tokens:
+                break
+        return text
+
+    def to_dict(self) -> dict:
+        return {"version": PROFILE_VERSION, "n_rows": self.n_rows, "columns": self.columns, "sample": self.sample}
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        """Rebuilds a cached profile; returns None if it was written by another version."""
+        if not data or data.get("version") != PROFILE_VERSION:
+            return None
+        return cls(data["n_rows"], data["columns"], data["sample"])
+
+
+_profiles = {}  # id(df) -> (weakref to df, DatasetProfile)
+_profiles_lock = threading.Lock()
+
+
+def register_profile(df: pd.DataFrame, profile: DatasetProfile):
+    """Associates a prebuilt (e.g. cached) profile with a frame for `get_profile`."""
+    with _profiles_lock:
+        key = id(df)
+        _profiles[key] = (weakref.ref(df, lambda _, key=key: _profiles.pop(key, None)), profile)
+    return profile
+
+
+def get_profile(df: pd.DataFrame) -> DatasetProfile:
+    """The frame's profile, built on first use and memoized while the frame lives."""
+    with _profiles_lock:
+        entry = _profiles.get(id(df))
+        if entry is not None and entry[0]() is df:
+            return entry[1]
+    return register_profile(df, DatasetProfile.build(df))
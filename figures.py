@@ -0,0 +1,305 @@
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+import plotly.io as pio
+
+try:
+    import orjson  # noqa: F401  Fast encoder for plotly.io; the stdlib json engine is used otherwise
+    JSON_ENGINE = "orjson"
+except ImportError:
+    JSON_ENGINE = "json"
+
+# --- Configuration ---
+MAX_LINE_POINTS = 5_000       # Line traces above this are LTTB-downsampled to it
+MAX_SCATTER_POINTS = 20_000   # Marker-only traces above this are thinned on a grid
+SCATTER_GRID = 200            # Grid cells per axis used for scatter thinning
+MAX_HIST_POINTS = 20_000      # Histograms over more raw values than this are pre-binned into bars
+MAX_HIST_BINS = 200
+MAX_CATEGORY_POINTS = 5_000   # Bar / pie / box traces over more raw rows are aggregated server-side
+WEBGL_THRESHOLD = 2_000       # Scatter traces larger than this switch to scattergl
+
+
+def _as_float(values):
+    """Numeric view of an x/y array for shape computations, or None if it has none."""
+    arr = np.asarray(values)
+    if np.issubdtype(arr.dtype, np.number) or arr.dtype == bool:
+        return arr.astype(np.float64, copy=False)
+    if np.issubdtype(arr.dtype, np.datetime64):
+        return arr.astype("datetime64[ns]").astype(np.int64).astype(np.float64)
+    return None
+
+
+def lttb_indices(x, y, threshold: int) -> np.ndarray:
+    """Largest-Triangle-Three-Buckets: indices of `threshold` points that keep the series' shape."""
+    n = len(y)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, stop = edges[i], edges[i + 1]
+        next_stop = edges[i + 2] if i + 2 < len(edges) else n
+        # Average of the next bucket is the third triangle vertex
+        avg_x = x[stop:next_stop].mean() if next_stop > stop else x[-1]
+        avg_y = y[stop:next_stop].mean() if next_stop > stop else y[-1]
+        bx, by = x[start:stop], y[start:stop]
+        area = np.abs((x[a] - avg_x) * (by - y[a]) - (x[a] - bx) * (avg_y - y[a]))
+        a = start + int(np.nanargmax(area)) if len(area) and not np.all(np.isnan(area)) else start
+        selected[i + 1] = a
+    return selected
+
+
+def grid_thin_indices(x, y, grid: int = SCATTER_GRID) -> np.ndarray:
+    """Keeps one point per occupied cell of a grid x grid binning, preserving the cloud's outline."""
+    def cells(v):
+        lo, hi = np.nanmin(v), np.nanmax(v)
+        scaled = (v - lo) / (hi - lo) if hi > lo else np.zeros_like(v)
+        return np.clip(np.nan_to_num(scaled * (grid - 1)), 0, grid - 1).astype(np.int64)
+
+    keys = cells(x) * grid + cells(y)
+    _, first = np.unique(keys, return_index=True)
+    return np.sort(first)
+
+
+def _take(props: dict, idx: np.ndarray, n: int) -> dict:
+    """Subsets every per-point array (x, y, customdata, marker.color, ...) of a trace dict."""
+    out = {}
+    for key, value in props.items():
+        if isinstance(value, dict):
+            out[key] = _take(value, idx, n)
+        elif isinstance(value, (np.ndarray, list, tuple)) and len(value) == n:
+            out[key] = np.asarray(value)[idx]
+        else:
+            out[key] = value
+    return out
+
+
+def _estimate_bytes(props: dict) -> int:
+    """Approximate JSON size of a trace's arrays without serializing them."""
+    total = 0
+    for value in props.values():
+        if isinstance(value, dict):
+            total += _estimate_bytes(value)
+        elif isinstance(value, (np.ndarray, list, tuple)):
+            arr = np.asarray(value)
+            if np.issubdtype(arr.dtype, np.number):
+                total += int(arr.nbytes * 4 / 3)  # base64 typed arrays
+            else:
+                sample = arr[: min(len(arr), 1000)]
+                avg = np.mean([len(str(v)) for v in sample]) if len(sample) else 0
+                total += int(len(arr) * (avg + 3))
+        else:
+            total += len(str(value))
+    return total
+
+
+def _points(props: dict) -> int:
+    """Number of data points a trace carries (x / y, or labels / values for pies)."""
+    return max((len(props[k]) for k in ("x", "y", "labels", "values") if props.get(k) is not None), default=0)
+
+
+def _without_arrays(props: dict, n: int) -> dict:
+    """Trace properties minus the per-point arrays (length `n`), which don't survive aggregation."""
+    out = {}
+    for key, value in props.items():
+        if isinstance(value, dict):
+            out[key] = _without_arrays(value, n)
+        elif not (isinstance(value, (np.ndarray, list, tuple)) and len(value) == n):
+            out[key] = value
+    return out
+
+
+def _group(keys, values, how: str) -> pd.Series:
+    """Aggregates `values` (or counts rows, for how="count") per key, in order of first appearance."""
+    if values is None:
+        return pd.Series(np.ones(len(keys))).groupby(np.asarray(keys), sort=False).sum()
+    grouped = pd.Series(np.asarray(values, dtype=np.float64)).groupby(np.asarray(keys), sort=False)
+    return grouped.count() if how == "count" else grouped.agg(how)
+
+
+def _histogram_edges(values: np.ndarray, props: dict) -> np.ndarray:
+    """Bin edges for a histogram: its explicit xbins, else at most nbinsx bins, else numpy's "auto"."""
+    xbins = props.get("xbins") or {}
+    if all(isinstance(xbins.get(k), (int, float)) for k in ("start", "end", "size")) and xbins["size"] > 0:
+        return np.arange(xbins["start"], xbins["end"] + xbins["size"], xbins["size"])
+    if props.get("nbinsx"):
+        return np.linspace(values.min(), values.max(), min(int(props["nbinsx"]), MAX_HIST_BINS) + 1)
+    edges = np.histogram_bin_edges(values, bins="auto")
+    if len(edges) - 1 > MAX_HIST_BINS:
+        edges = np.linspace(values.min(), values.max(), MAX_HIST_BINS + 1)
+    return edges
+
+
+def _category_histogram_to_bars(props: dict, n: int) -> dict:
+    """A histogram over categories becomes one bar per category (count, or `histfunc` of y)."""
+    func = {"count": "count", "sum": "sum", "avg": "mean", "min": "min", "max": "max"}[props.get("histfunc") or "count"]
+    totals = _group(props["x"], props.get("y"), func)
+    bar = {k: v for k, v in _without_arrays(props, n).items() if k not in ("bingroup", "nbinsx", "xbins", "histfunc")}
+    bar.update(x=totals.index.to_numpy(), y=totals.to_numpy(), type="bar")
+    return bar
+
+
+def _aggregate_bars(props: dict, n: int) -> dict:
+    """Stacked bars over raw rows draw the sum per category: send one bar per category instead."""
+    horizontal = props.get("orientation") == "h"
+    keys, values = (props["y"], props["x"]) if horizontal else (props["x"], props["y"])
+    totals = _group(keys, values, "sum")
+    bar = _without_arrays(props, n)
+    categories, sums = totals.index.to_numpy(), totals.to_numpy()
+    if horizontal:
+        bar.update(x=sums, y=categories)
+    else:
+        bar.update(x=categories, y=sums)
+    return bar
+
+
+def _aggregate_pie(props: dict, n: int) -> dict:
+    """Pies add up the values of repeated labels (or count them): do it before sending."""
+    totals = _group(props["labels"], props.get("values"), "sum")
+    pie = _without_arrays(props, n)
+    pie.update(labels=totals.index.to_numpy(), values=totals.to_numpy())
+    colors = (props.get("marker") or {}).get("colors")
+    if colors is not None and len(colors) == n:
+        first = pd.Series(np.asarray(colors)).groupby(np.asarray(props["labels"]), sort=False).first()
+        pie["marker"] = dict(pie.get("marker") or {}, colors=first.to_numpy())
+    return pie
+
+
+def _box_statistics(props: dict, n: int) -> dict:
+    """
+    Replaces the raw values of a box trace with its precomputed quartiles,
+    fences and mean per box (quartiles as Plotly's default "linear" method).
+    Individual outlier points are not sent.
+    """
+    horizontal = props.get("orientation") == "h"
+    values = _as_float(props["x"] if horizontal else props["y"])
+    positions = props.get("y" if horizontal else "x")
+    keys = np.asarray(positions) if positions is not None and len(positions) == n else np.zeros(n)
+    stats = {k: [] for k in ("q1", "median", "q3", "lowerfence", "upperfence", "mean", "sd")}
+    groups = pd.Series(values).groupby(keys, sort=False)
+    for _, group in groups:
+        v = group.dropna().to_numpy()
+        if not len(v):
+            v = np.array([np.nan])
+        q1, median, q3 = np.percentile(v, [25, 50, 75])
+        iqr = q3 - q1
+        inside = v[(v >= q1 - 1.5 * iqr) & (v <= q3 + 1.5 * iqr)]
+        for key, value in zip(stats, (q1, median, q3, inside.min() if len(inside) else q1,
+                                      inside.max() if len(inside) else q3, v.mean(), v.std())):
+            stats[key].append(value)
+    box = {k: v for k, v in _without_arrays(props, n).items() if k != "boxpoints"}
+    box.update({k: np.array(v) for k, v in stats.items()}, boxpoints=False)
+    if positions is not None and len(positions) == n:
+        box["y" if horizontal else "x"] = np.array(list(groups.groups))
+    return box
+
+
+def _histogram_to_bars(props: dict, edges: np.ndarray) -> dict:
+    counts, _ = np.histogram(_as_float(props["x"]), bins=edges)
+    bar = {k: v for k, v in props.items() if k not in ("x", "y", "type", "bingroup", "nbinsx", "xbins", "histfunc")}
+    bar.update(x=(edges[:-1] + edges[1:]) / 2, y=counts, width=np.diff(edges), type="bar")
+    if "hovertemplate" in bar:
+        bar["hovertemplate"] = "%{x}<br>count=%{y}<extra></extra>"
+    return bar
+
+
+def optimize_figure(fig):
+    """
+    Shrinks oversized traces before the figure is serialized: LTTB for line
+    series, grid thinning for scatter clouds, pre-binning for histograms,
+    per-category totals for bars and pies over raw rows, precomputed box
+    statistics, and WebGL trace types for large scatters. Returns (figure, report).
+    """
+    traces = [trace.to_plotly_json() for trace in fig.data]
+    report = {"points_before": 0, "points_after": 0, "bytes_before": 0, "bytes_after": 0, "traces_changed": 0}
+    new_traces = []
+    changed = False
+
+    # Histograms sharing an axis get shared bin edges so stacked/overlaid bars line up
+    numeric_hists = [
+        t for t in traces
+        if t.get("type") == "histogram" and t.get("x") is not None and t.get("y") is None
+        and not t.get("histnorm") and _as_float(t["x"]) is not None and len(t["x"]) > MAX_HIST_POINTS
+    ]
+    hist_edges = None
+    if numeric_hists:
+        all_values = np.concatenate([_as_float(t["x"]) for t in numeric_hists])
+        all_values = all_values[~np.isnan(all_values)]
+        if len(all_values):
+            hist_edges = _histogram_edges(all_values, numeric_hists[0])
+    stacked = fig.layout.barmode in ("relative", "stack")
+
+    for props in traces:
+        kind = props.get("type", "scatter")
+        x, y = props.get("x"), props.get("y")
+        n = _points(props)
+        report["points_before"] += n
+        before = _estimate_bytes(props)
+        new = props
+
+        if kind == "histogram" and hist_edges is not None and x is not None and y is None \
+                and not props.get("histnorm") and _as_float(x) is not None and n > MAX_HIST_POINTS:
+            new = _histogram_to_bars(props, hist_edges)
+        elif kind == "histogram" and x is not None and _as_float(x) is None and not props.get("histnorm") \
+                and props.get("orientation", "v") == "v" and (y is None or len(y) == len(x)) \
+                and n > MAX_CATEGORY_POINTS and (y is None or _as_float(y) is not None):
+            new = _category_histogram_to_bars(props, n)
+        elif kind == "bar" and stacked and x is not None and y is not None and len(x) == len(y) \
+                and n > MAX_CATEGORY_POINTS and props.get("base") is None \
+                and _as_float(x if props.get("orientation") == "h" else y) is not None:
+            new = _aggregate_bars(props, n)
+        elif kind == "pie" and props.get("labels") is not None and n > MAX_CATEGORY_POINTS \
+                and (props.get("values") is None or _as_float(props["values"]) is not None):
+            new = _aggregate_pie(props, n)
+        elif kind == "box" and n > MAX_CATEGORY_POINTS and props.get("q1") is None \
+                and (x if props.get("orientation") == "h" else y) is not None \
+                and _as_float(x if props.get("orientation") == "h" else y) is not None:
+            new = _box_statistics(props, n)
+        elif kind in ("scatter", "scattergl") and x is not None and y is not None and len(x) == len(y):
+            mode = props.get("mode") or ("lines" if n > 20 else "markers")
+            fx, fy = _as_float(x), _as_float(y)
+            if fy is not None and "lines" in mode and n > MAX_LINE_POINTS:
+                new = _take(props, lttb_indices(fx if fx is not None else np.arange(n, dtype=float), fy, MAX_LINE_POINTS), n)
+            elif fx is not None and fy is not None and "lines" not in mode and n > MAX_SCATTER_POINTS:
+                new = _take(props, grid_thin_indices(fx, fy), n)
+            if n > WEBGL_THRESHOLD:
+                new = dict(new, type="scattergl")
+
+        if new is not props:
+            changed = True
+            report["traces_changed"] += 1
+        report["points_after"] += _points(new) if new.get("q1") is None else len(new["q1"])
+        report["bytes_before"] += before
+        report["bytes_after"] += _estimate_bytes(new) if new is not props else before
+        new_traces.append(new)
+
+    if not changed:
+        return fig, report
+
+    optimized = go.Figure(layout=fig.layout)
+    for props in new_traces:
+        kind = props.pop("type", "scatter")
+        trace_class = {"scattergl": go.Scattergl, "bar": go.Bar, "pie": go.Pie, "box": go.Box}.get(kind)
+        if trace_class is not None:
+            optimized.add_trace(trace_class(props, skip_invalid=True))
+        else:
+            optimized.add_trace(dict(props, type=kind))
+    if hist_edges is not None:
+        optimized.update_layout(bargap=0)
+    return optimized, report
+
+
+def serialize_figure(fig):
+    """
+    Serializes a figure exactly once with the fastest available JSON engine,
+    repairing it through a dict round trip if needed. The payload doubles as
+    the validation step. Returns (figure, payload, repaired).
+    """
+    try:
+        return fig, pio.to_json(fig, validate=False, engine=JSON_ENGINE), False
+    except (TypeError, ValueError):
+        fig = go.Figure(fig.to_dict())
+        return fig, pio.to_json(fig, validate=False, engine=JSON_ENGINE), True
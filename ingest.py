@@ -0,0 +1,355 @@
+import datetime
+import itertools
+import time
+import zipfile
+from xml.etree import ElementTree
+
+import numpy as np
+import pandas as pd
+
+from cleaning import ColumnStats, RowHashSet, clean_column, row_hashes
+from profiling import ColumnProfiler
+from tracing import traced, current_span
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+except ImportError:  # pyarrow is optional; fall back to the pandas C parser
+    pa = None
+    pa_csv = None
+
+try:
+    from python_calamine import CalamineWorkbook  # Rust Excel reader, much faster than openpyxl
+except ImportError:
+    CalamineWorkbook = None
+
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None
+
+# --- Configuration ---
+CSV_CHUNK_ROWS = 200_000   # Rows parsed and cleaned per chunk; bounds parser memory
+PEEK_BYTES = 64 * 1024     # Bytes read up front to estimate the average row width
+
+
+class StreamingCSVLoader:
+    """
+    Reads a CSV upload in chunks and applies the Data Janitor rules: rows are
+    de-duplicated against everything seen so far as they stream in, then dates
+    are converted and missing values filled once, column by column, with the
+    same rules as `DataJanitor`. Uses the pyarrow streaming reader when it is
+    installed. After a load, `raw_state` holds the row hashes and fill-value
+    statistics of the raw rows, for appending to the dataset later.
+    """
+
+    def __init__(self, chunk_rows: int = CSV_CHUNK_ROWS, profiler: ColumnProfiler = None):
+        self.chunk_rows = chunk_rows
+        self.profiler = profiler or ColumnProfiler()
+        self.last_report = {}
+        self.raw_state = None  # (RowHashSet, {column: ColumnStats}) of the last load
+
+    # --- Readers ---
+    def _estimate_block_bytes(self, file) -> int:
+        start = file.tell()
+        peek = file.read(PEEK_BYTES)
+        file.seek(start)
+        rows = max(peek.count(b"\n"), 1)
+        return max(int(len(peek) / rows * self.chunk_rows), 1 << 20)
+
+    def _arrow_chunks(self, file):
+        read_options = pa_csv.ReadOptions(block_size=self._estimate_block_bytes(file))
+        convert_options = pa_csv.ConvertOptions(strings_can_be_null=True)
+        reader = pa_csv.open_csv(file, read_options=read_options, convert_options=convert_options)
+        dates = [f.name for f in reader.schema if pa.types.is_timestamp(f.type) or pa.types.is_date(f.type)]
+        if dates:
+            # Dates stay text so they are parsed by the same rules as with every other reader
+            file.seek(0)
+            convert_options.column_types = {name: pa.string() for name in dates}
+            reader = pa_csv.open_csv(file, read_options=read_options, convert_options=convert_options)
+        for batch in reader:
+            yield batch.to_pandas()
+
+    def _pandas_chunks(self, file):
+        yield from pd.read_csv(file, chunksize=self.chunk_rows)
+
+    # --- Pipeline ---
+    @traced("ingest.csv")
+    def load(self, file, progress_callback=None) -> pd.DataFrame:
+        """
+        Streams `file` into a cleaned DataFrame.
+        `progress_callback(fraction, rows)` is called after each chunk.
+        """
+        start = time.perf_counter()
+        file.seek(0, 2)
+        total_bytes = file.tell() or 1
+        file.seek(0)
+        position = lambda: file.tell() / total_bytes
+
+        def empty():
+            # Header-only file: no chunks, but the columns are still wanted
+            file.seek(0)
+            return pd.read_csv(file)
+
+        df = None
+        if pa_csv is not None:
+            try:
+                self.last_report = {"backend": "pyarrow"}
+                df = self._stream(self._arrow_chunks(file), position, progress_callback, empty)
+            except pa.ArrowInvalid as e:
+                # Arrow fixes column types on the first block; mixed columns need pandas
+                print(f"Arrow CSV reader failed, falling back to pandas: {e}")
+                file.seek(0)
+        if df is None:
+            self.last_report = {"backend": "pandas"}
+            df = self._stream(self._pandas_chunks(file), position, progress_callback, empty)
+
+        self.last_report.update({"chunk_rows": self.chunk_rows, "seconds": time.perf_counter() - start})
+        current_span().set(backend=self.last_report["backend"], bytes=total_bytes, rows=len(df))
+        return df
+
+    def _concat_column(self, parts: list) -> pd.Series:
+        return pd.concat(parts, ignore_index=True)
+
+    def _join_chunks(self, chunks: list) -> pd.DataFrame:
+        df = pd.DataFrame({i: self._concat_column([chunk.iloc[:, i] for chunk in chunks])
+                           for i in range(chunks[0].shape[1])}, copy=False)
+        df.columns = chunks[0].columns
+        return df
+
+    def read_raw(self, file) -> pd.DataFrame:
+        """
+        The whole file as an uncleaned frame, read like `load` reads it (so
+        date columns stay text), e.g. rows to append to a loaded dataset.
+        """
+        file.seek(0)
+        chunks = None
+        if pa_csv is not None:
+            try:
+                chunks = list(self._arrow_chunks(file))
+            except pa.ArrowInvalid as e:
+                print(f"Arrow CSV reader failed, falling back to pandas: {e}")
+        if chunks is None:
+            file.seek(0)
+            chunks = list(self._pandas_chunks(file))
+        if not chunks:
+            file.seek(0)
+            return pd.read_csv(file)
+        return self._join_chunks(chunks)
+
+    def _stream(self, chunk_iter, position, progress_callback, empty) -> pd.DataFrame:
+        """
+        Shared cleaning pipeline over DataFrame chunks. `position()` returns the
+        fraction of the input consumed; `empty()` builds the frame when there are no rows.
+        """
+        seen = RowHashSet()
+        parts = None  # column position -> list of deduplicated chunk columns
+        chunk_stats = None  # column position -> ColumnStats of the raw values, accumulated per chunk
+        columns = None
+        rows_read = 0
+        duplicates = 0
+
+        for chunk in chunk_iter:
+            rows_read += len(chunk)
+
+            # Dedupe within the chunk and against rows from earlier chunks
+            keep = seen.keep_new(row_hashes(chunk))
+            duplicates += int((~keep).sum())
+            if parts is None:
+                columns = chunk.columns
+                parts = [[] for _ in range(chunk.shape[1])]
+                chunk_stats = [ColumnStats() for _ in range(chunk.shape[1])]
+            for i, part in enumerate(parts):
+                part.append(chunk.iloc[:, i][keep])
+                chunk_stats[i].update(part[-1])
+            del chunk
+
+            if progress_callback:
+                progress_callback(min(position(), 1.0), rows_read)
+
+        self.last_report.update({"rows_read": rows_read, "duplicates_dropped": duplicates})
+
+        if parts is None:
+            return empty()
+
+        # One column at a time, freeing its chunks as it goes, so the rows are never held twice
+        data = {}
+        for i in range(len(parts)):
+            data[i] = self._concat_column(parts[i])
+            parts[i] = None
+        df = pd.DataFrame(data, copy=False)
+        df.columns = columns
+
+        # Same rules as the Data Janitor, with fill values from the raw rows kept for appends
+        stats = {}
+        for i, profile in enumerate(self.profiler.profile(df)):
+            series, report = clean_column(df.iloc[:, i], profile)
+            if report["kind"] in ("numeric", "categorical"):
+                stats[df.columns[i]] = chunk_stats[i]
+            if report["action"] != "none":
+                df.isetitem(i, series)
+        self.raw_state = (seen, stats)
+
+        return df
+
+
+def excel_engine():
+    """Fastest installed Excel reader: "calamine", then openpyxl in read-only mode (None if neither)."""
+    if CalamineWorkbook is not None:
+        return "calamine"
+    if openpyxl is not None:
+        return "openpyxl"
+    return None
+
+
+def _header_names(header) -> list:
+    """Column names from a header row, named and de-duplicated the way pandas does."""
+    names, seen = [], {}
+    for i, value in enumerate(header):
+        name = f"Unnamed: {i}" if value is None or value == "" else value
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        seen.setdefault(name, 0)
+        names.append(name)
+    return names
+
+
+def _excel_dates(chunk: pd.DataFrame) -> pd.DataFrame:
+    """
+    calamine returns midnight datetimes as dates: columns holding only dates
+    become datetimes, like pandas does. A column that mixes dates and text
+    in any chunk stays text once the chunks are joined.
+    """
+    for i in range(chunk.shape[1]):
+        series = chunk.iloc[:, i]
+        if pd.api.types.is_object_dtype(series.dtype):
+            first = series.first_valid_index()
+            if first is not None and isinstance(series[first], datetime.date):
+                converted = pd.to_datetime(series, errors="coerce")
+                if converted.notna().sum() == series.notna().sum():
+                    chunk.isetitem(i, converted)
+    return chunk
+
+
+def _excel_column(parts: list) -> pd.Series:
+    """
+    One column's chunks joined, with its numeric type decided over the whole
+    sheet: chunks with no values take the type of the others, then (as Excel
+    stores every number as a float) whole-number columns become integers,
+    like pandas does.
+    """
+    has_values = [part.notna().any() for part in parts]
+    if any(has_values) and not all(has_values):
+        dtype = parts[has_values.index(True)].dtype
+        if pd.api.types.is_integer_dtype(dtype):
+            dtype = np.float64
+        elif pd.api.types.is_bool_dtype(dtype):
+            dtype = object
+        parts = [part if filled else pd.Series(np.nan, index=part.index, dtype=dtype, name=part.name)
+                 for part, filled in zip(parts, has_values)]
+    series = pd.concat(parts, ignore_index=True)
+
+    if pd.api.types.is_float_dtype(series.dtype):
+        values = series.to_numpy()
+        if len(values) and np.isfinite(values).all() and (values == np.trunc(values)).all():
+            series = pd.Series(values.astype(np.int64), name=series.name)
+    return series
+
+
+class StreamingExcelLoader(StreamingCSVLoader):
+    """
+    Reads one sheet of an .xlsx upload row by row with the fastest installed
+    engine and cleans it chunk by chunk with the same rules as CSV uploads.
+    Other sheets are never parsed; `sheet_names()` only reads the workbook manifest.
+    """
+
+    @staticmethod
+    def sheet_names(file) -> list:
+        """Sheet names in workbook order, from xl/workbook.xml (no cell data is parsed)."""
+        file.seek(0)
+        with zipfile.ZipFile(file) as archive:
+            root = ElementTree.fromstring(archive.read("xl/workbook.xml"))
+        file.seek(0)
+        # Tags are namespaced (transitional or strict OOXML), so match on the local name
+        return [el.get("name") for el in root.iter() if el.tag.rsplit("}", 1)[-1] == "sheet"]
+
+    def _concat_column(self, parts: list) -> pd.Series:
+        return _excel_column(parts)
+
+    # --- Readers ---
+    def _calamine_rows(self, file, sheet):
+        worksheet = CalamineWorkbook.from_filelike(file).get_sheet_by_name(sheet)
+        return worksheet.iter_rows(), getattr(worksheet, "height", None), None
+
+    def _openpyxl_rows(self, file, sheet):
+        workbook = openpyxl.load_workbook(file, read_only=True, data_only=True, keep_links=False)
+        worksheet = workbook[sheet]
+        return worksheet.iter_rows(values_only=True), worksheet.max_row, workbook.close
+
+    def _row_chunks(self, rows, columns):
+        width = len(columns)
+        while True:
+            block = list(itertools.islice(rows, self.chunk_rows))
+            if not block:
+                return
+            self._rows_parsed += len(block)
+            if any(len(row) != width for row in block):
+                block = [tuple(row[:width]) + (None,) * (width - len(row)) for row in block]
+            chunk = pd.DataFrame.from_records(block, columns=columns)
+            # Empty cells come back as "" from calamine; blank rows are skipped like pandas does
+            text = [c for c, dtype in chunk.dtypes.items()
+                    if pd.api.types.is_object_dtype(dtype) or pd.api.types.is_string_dtype(dtype)]
+            if text:
+                chunk[text] = chunk[text].replace("", np.nan)
+            # Numeric types are fixed once the whole sheet is read (`_excel_column`)
+            yield _excel_dates(chunk.dropna(how="all").infer_objects())
+
+    def _open_sheet(self, file, sheet):
+        """Returns (engine, sheet, column names, row iterator, sheet height or None, close callable or None)."""
+        engine = excel_engine()
+        if engine is None:
+            raise ImportError("Reading Excel files requires python-calamine or openpyxl")
+        if sheet is None:
+            sheet = self.sheet_names(file)[0]
+        file.seek(0)
+        reader = self._calamine_rows if engine == "calamine" else self._openpyxl_rows
+        rows, total_rows, close = reader(file, sheet)
+        rows = iter(rows)
+        columns = _header_names(next(rows, ()))
+        self._rows_parsed = 1
+        return engine, sheet, columns, rows, total_rows, close
+
+    def read_raw(self, file, sheet=None) -> pd.DataFrame:
+        """One sheet as an uncleaned frame, e.g. rows to append to a loaded dataset."""
+        _, _, columns, rows, _, close = self._open_sheet(file, sheet)
+        try:
+            chunks = list(self._row_chunks(rows, columns))
+        finally:
+            if close is not None:
+                close()
+        return self._join_chunks(chunks) if chunks else pd.DataFrame(columns=columns)
+
+    # --- Pipeline ---
+    @traced("ingest.excel")
+    def load(self, file, sheet=None, progress_callback=None) -> pd.DataFrame:
+        """
+        Streams one sheet (the first by default) into a cleaned DataFrame.
+        `progress_callback(fraction, rows)` is called after each chunk.
+        """
+        start = time.perf_counter()
+        engine, sheet, columns, rows, total_rows, close = self._open_sheet(file, sheet)
+        try:
+            self.last_report = {"backend": engine, "sheet": sheet}
+            # The sheet height comes from its dimension record and may be missing
+            position = lambda: self._rows_parsed / total_rows if total_rows else 0.0
+            df = self._stream(self._row_chunks(rows, columns), position, progress_callback,
+                              lambda: pd.DataFrame(columns=columns))
+        finally:
+            if close is not None:
+                close()
+
+        self.last_report.update({"chunk_rows": self.chunk_rows, "seconds": time.perf_counter() - start})
+        current_span().set(backend=engine, sheet=sheet, rows=len(df))
+        return df
+
@@ -0,0 +1,260 @@
+import asyncio
+import atexit
+import inspect
+import queue
+import random
+import threading
+import time
+
+import groq
+from groq import AsyncGroq
+
+# --- Configuration ---
+MAX_CONCURRENCY = 8          # In-flight LLM requests per process, across all sessions
+REQUESTS_PER_MINUTE = 30     # Token-bucket refill rate
+BURST = 10                   # Token-bucket capacity
+MAX_RETRIES = 4              # Retries on 429 / 5xx / connection errors
+BASE_BACKOFF_SECONDS = 0.5
+MAX_BACKOFF_SECONDS = 20.0
+REQUEST_TIMEOUT_SECONDS = 60.0
+CHARS_PER_TOKEN = 4          # Rough average for English prose and code; used for budgeting only
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate for prompt budgeting (no tokenizer dependency)."""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+# --- Typed errors ---
+class LLMError(Exception):
+    """Base class for failures talking to the LLM provider."""
+
+    retryable = False
+
+    def __init__(self, message, status_code=None, retry_after=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class RateLimitError(LLMError):
+    retryable = True
+
+
+class LLMServerError(LLMError):
+    retryable = True
+
+
+class LLMConnectionError(LLMError):
+    retryable = True
+
+
+class LLMTimeoutError(LLMError):
+    retryable = True
+
+
+class LLMRequestError(LLMError):
+    """The request itself was rejected (bad key, bad request, ...); retrying won't help."""
+
+
+def classify_error(e: Exception) -> LLMError:
+    """Maps provider/transport exceptions onto the typed LLMError hierarchy."""
+    if isinstance(e, LLMError):
+        return e
+    status = getattr(e, "status_code", None)
+    retry_after = None
+    response = getattr(e, "response", None)
+    if response is not None:
+        try:
+            retry_after = float(response.headers.get("retry-after"))
+        except (TypeError, ValueError, AttributeError):
+            retry_after = None
+
+    if isinstance(e, (groq.APITimeoutError, asyncio.TimeoutError)):
+        return LLMTimeoutError(str(e))
+    if isinstance(e, groq.APIConnectionError):
+        return LLMConnectionError(str(e))
+    if status == 429:
+        return RateLimitError(str(e), status, retry_after)
+    if status is not None and status >= 500:
+        return LLMServerError(str(e), status, retry_after)
+    return LLMRequestError(str(e), status)
+
+
+class TokenBucket:
+    """Async token bucket: `rate` tokens per second, up to `capacity` banked."""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+# --- Shared event loop ---
+_runtime = None  # (event loop, its thread, process-wide concurrency semaphore)
+_runtime_lock = threading.Lock()
+
+
+def _get_runtime():
+    """The one event loop thread every pool runs on, started on first use."""
+    global _runtime
+    with _runtime_lock:
+        if _runtime is None:
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=loop.run_forever, name="llm-pool", daemon=True)
+            thread.start()
+
+            async def _semaphore():
+                return asyncio.Semaphore(MAX_CONCURRENCY)
+            _runtime = (loop, thread, asyncio.run_coroutine_threadsafe(_semaphore(), loop).result())
+        return _runtime
+
+
+def shutdown():
+    """Stops and closes the shared event loop and its thread. Existing pools stop working."""
+    global _runtime
+    with _runtime_lock:
+        if _runtime is None:
+            return
+        loop, thread, _ = _runtime
+        _runtime = None
+    with _pools_lock:
+        _pools.clear()
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(timeout=5)
+    if not thread.is_alive():
+        loop.close()
+
+
+atexit.register(shutdown)
+
+
+class LLMPool:
+    """
+    Asyncio client layer around one client (one per API key, see
+    `get_llm_pool`). Every pool runs on a single shared event loop thread
+    and shares the process-wide concurrency limit (`MAX_CONCURRENCY`);
+    token-bucket rate limiting and jittered exponential retries are per pool.
+    Synchronous callers (Streamlit scripts) use `complete()` and `stream()`.
+    """
+
+    def __init__(self, client, requests_per_minute: float = REQUESTS_PER_MINUTE, burst: int = BURST,
+                 max_retries: int = MAX_RETRIES):
+        # `client` exposes `chat.completions.create`, either async (AsyncGroq) or sync (e.g. a fake)
+        self.client = client
+        self.max_retries = max_retries
+        self.stats = {"requests": 0, "retries": 0, "failures": 0}
+
+        self.loop, _, self._semaphore = _get_runtime()
+
+        async def _init():
+            self._bucket = TokenBucket(requests_per_minute / 60.0, burst)
+        asyncio.run_coroutine_threadsafe(_init(), self.loop).result()
+
+    # --- Async core ---
+    async def _create(self, **request):
+        create = self.client.chat.completions.create
+        if inspect.iscoroutinefunction(create):
+            return await asyncio.wait_for(create(**request), REQUEST_TIMEOUT_SECONDS)
+        return await asyncio.wait_for(asyncio.to_thread(create, **request), REQUEST_TIMEOUT_SECONDS)
+
+    async def _with_retries(self, **request):
+        for attempt in range(self.max_retries + 1):
+            await self._bucket.acquire()
+            try:
+                self.stats["requests"] += 1
+                return await self._create(**request)
+            except Exception as e:
+                error = classify_error(e)
+                if not error.retryable or attempt == self.max_retries:
+                    self.stats["failures"] += 1
+                    raise error from e
+                # Full jitter, but never sooner than the server asked for
+                delay = random.uniform(0, min(MAX_BACKOFF_SECONDS, BASE_BACKOFF_SECONDS * 2 ** attempt))
+                if error.retry_after:
+                    delay = max(delay, error.retry_after)
+                self.stats["retries"] += 1
+                await asyncio.sleep(delay)
+
+    async def acomplete(self, **request) -> str:
+        async with self._semaphore:
+            response = await self._with_retries(**request)
+        return response.choices[0].message.content
+
+    async def astream(self, **request):
+        async with self._semaphore:
+            # Retries only cover opening the stream; a stream that dies midway raises
+            stream = await self._with_retries(stream=True, **request)
+            try:
+                if hasattr(stream, "__aiter__"):
+                    async for chunk in stream:
+                        delta = chunk.choices[0].delta.content if chunk.choices else None
+                        if delta:
+                            yield delta
+                else:
+                    done = object()
+                    iterator = iter(stream)
+                    while True:
+                        chunk = await asyncio.to_thread(next, iterator, done)
+                        if chunk is done:
+                            break
+                        delta = chunk.choices[0].delta.content if chunk.choices else None
+                        if delta:
+                            yield delta
+            except Exception as e:
+                raise classify_error(e) from e
+
+    # --- Sync facade ---
+    def complete(self, **request) -> str:
+        """Blocking completion; raises an LLMError subclass on failure."""
+        return asyncio.run_coroutine_threadsafe(self.acomplete(**request), self.loop).result()
+
+    def stream(self, **request):
+        """Blocking generator over completion chunks; raises an LLMError subclass on failure."""
+        chunks = queue.Queue()
+        done = object()
+
+        async def pump():
+            try:
+                async for delta in self.astream(**request):
+                    chunks.put(delta)
+                chunks.put(done)
+            except BaseException as e:
+                chunks.put(e)
+
+        future = asyncio.run_coroutine_threadsafe(pump(), self.loop)
+        try:
+            while True:
+                item = chunks.get()
+                if item is done:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            future.cancel()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_llm_pool(api_key) -> LLMPool:
+    """Returns the shared pool for `api_key`, creating its AsyncGroq client on first use."""
+    with _pools_lock:
+        if api_key not in _pools:
+            _pools[api_key] = LLMPool(AsyncGroq(api_key=api_key, max_retries=0))
+        return _pools[api_key]
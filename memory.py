@@ -0,0 +1,82 @@
+import re
+
+from llm import estimate_tokens, CHARS_PER_TOKEN
+
+# --- Configuration ---
+MEMORY_TOKEN_BUDGET = 600    # Whole conversation block (summary + recent turns) per prompt
+SUMMARY_TOKEN_BUDGET = 200
+RECENT_MESSAGES = 4          # Messages kept verbatim
+FOLD_BATCH = 4               # Older messages are folded into the summary this many at a time
+MAX_MESSAGE_TOKENS = 150     # Longer verbatim messages are clipped
+
+
+def _clip(text: str, max_tokens: int) -> str:
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    return text if len(text) <= max_chars else text[:max_chars - 1].rstrip() + "…"
+
+
+def _local_summary(summary: str, lines: list, max_tokens: int) -> str:
+    """Extractive fallback: first sentence of each folded message, oldest dropped first."""
+    notes = [summary] if summary else []
+    for line in lines:
+        first = re.split(r"(?<=[.!?])\s", line, maxsplit=1)[0]
+        notes.append(" ".join(first.split()[:25]))
+    text = " | ".join(notes)
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    return text if len(text) <= max_chars else "…" + text[-(max_chars - 1):]
+
+
+class ConversationMemory:
+    """
+    Token-budgeted conversation context. The most recent messages are kept
+    verbatim (clipped to MAX_MESSAGE_TOKENS); older ones are folded, a batch
+    at a time, into a rolling summary. `summarizer(summary, lines, max_tokens)`
+    produces the updated summary (e.g. with the LLM); if it is missing or
+    fails, an extractive summary is used instead.
+    """
+
+    def __init__(self, token_budget: int = MEMORY_TOKEN_BUDGET, summary_budget: int = SUMMARY_TOKEN_BUDGET,
+                 recent_messages: int = RECENT_MESSAGES, summarizer=None):
+        self.token_budget = token_budget
+        self.summary_budget = summary_budget
+        self.recent_messages = recent_messages
+        self.summarizer = summarizer
+        self.last_tokens = 0
+        self.reset()
+
+    def reset(self):
+        self.summary = ""
+        self.folded = 0        # Messages of the current history already in the summary
+        self._anchor = None    # First message of the history the summary belongs to
+
+    def _summarize(self, lines: list) -> str:
+        if self.summarizer is not None:
+            try:
+                return _clip(self.summarizer(self.summary, lines, self.summary_budget).strip(), self.summary_budget)
+            except Exception as e:
+                print(f"Conversation summary failed, using extractive summary: {e}")
+        return _local_summary(self.summary, lines, self.summary_budget)
+
+    def context(self, history: list) -> str:
+        """Conversation block for a prompt, folding messages into the summary as needed."""
+        # A cleared or replaced chat starts a new summary
+        if not history or history[0] is not self._anchor or len(history) < self.folded:
+            self.reset()
+            self._anchor = history[0] if history else None
+
+        lines = [f"{m['role']}: {_clip(str(m['content']), MAX_MESSAGE_TOKENS)}" for m in history[self.folded:]]
+        sizes = [estimate_tokens(l) for l in lines]
+        n_fold = len(lines) - self.recent_messages if len(lines) > self.recent_messages + FOLD_BATCH else 0
+        if sum(sizes) + estimate_tokens(self.summary) > self.token_budget:
+            # Long messages: keep folding the oldest until the rest fits next to a full summary
+            while n_fold < len(lines) - 1 and self.summary_budget + sum(sizes[n_fold:]) > self.token_budget:
+                n_fold += 1
+        if n_fold:
+            self.summary = self._summarize(lines[:n_fold])
+            self.folded += n_fold
+            lines = lines[n_fold:]
+
+        parts = [f"Summary of earlier conversation: {self.summary}"] if self.summary else []
+        text = "\n".join(parts + lines)
+        self.last_tokens = estimate_tokens(text)
+        return text
@@ -0,0 +1,130 @@
+import numbers
+import reprlib
+
+import numpy as np
+import pandas as pd
+
+from llm import estimate_tokens, CHARS_PER_TOKEN
+
+# --- Configuration ---
+RESULT_TOKEN_BUDGET = 500   # Hard cap for the result block in the synthesis prompt
+MAX_COLUMNS = 12            # Widest slice of a frame that is rendered
+MAX_CELL_CHARS = 30
+DETAIL_LEVELS = (5, 3, 1)   # Head/tail/top-k sizes tried, most detailed first
+
+_repr = reprlib.Repr()
+_repr.maxstring = 200
+_repr.maxother = 200
+_repr.maxlist = _repr.maxtuple = _repr.maxset = _repr.maxdict = 10
+
+
+def _fmt(value) -> str:
+    # numpy scalars repr as e.g. np.int64(5), which reads as code rather than a value
+    if isinstance(value, (bool, np.bool_)):
+        return str(bool(value))
+    if isinstance(value, (numbers.Integral, np.integer)):
+        return f"{int(value):,}"
+    if isinstance(value, (float, np.floating)):
+        return f"{value:,.6g}"
+    return _repr.repr(value)
+
+
+def _stats(values: pd.Series) -> str:
+    """One-line aggregate stats for a numeric series, computed vectorially."""
+    values = values.dropna()
+    if values.empty:
+        return "all values missing"
+    return (f"min {_fmt(values.min())}, max {_fmt(values.max())}, mean {_fmt(values.mean())}, "
+            f"sum {_fmt(values.sum())}")
+
+
+def _table(frame, max_columns: int = MAX_COLUMNS) -> str:
+    if isinstance(frame, pd.Series):
+        frame = frame.to_frame()
+    return frame.iloc[:, :max_columns].to_string(max_colwidth=MAX_CELL_CHARS)
+
+
+def _head_tail(obj, k: int) -> str:
+    """First and last `k` rows with a marker for what was left out."""
+    if len(obj) <= 2 * k:
+        return _table(obj)
+    omitted = len(obj) - 2 * k
+    return f"{_table(obj.head(k))}\n… ({omitted:,} rows omitted) …\n{_table(obj.tail(k))}"
+
+
+def _summarize_series(series: pd.Series, k: int) -> str:
+    name = f" '{series.name}'" if series.name is not None else ""
+    lines = [f"Series{name} with {len(series):,} values, dtype {series.dtype}"]
+    if len(series) == 0:
+        return lines[0]
+    numeric = pd.api.types.is_numeric_dtype(series.dtype) and not pd.api.types.is_bool_dtype(series.dtype)
+    if numeric:
+        lines.append(f"Stats: {_stats(series)}")
+        if len(series) > 2 * k:
+            top = series.nlargest(k)
+            lines.append("Largest: " + ", ".join(f"{_fmt(i)}={_fmt(v)}" for i, v in top.items()))
+    elif len(series) > 2 * k:
+        counts = series.value_counts().head(k)
+        lines.append("Most common: " + ", ".join(f"{_fmt(v)} ({c:,})" for v, c in counts.items()))
+    lines.append(_head_tail(series, k))
+    return "\n".join(lines)
+
+
+def _summarize_frame(df: pd.DataFrame, k: int) -> str:
+    lines = [f"DataFrame with {len(df):,} rows x {df.shape[1]} columns"]
+    dtypes = ", ".join(f"{c}: {t}" for c, t in df.dtypes.iloc[:MAX_COLUMNS].astype(str).items())
+    if df.shape[1] > MAX_COLUMNS:
+        dtypes += f", … ({df.shape[1] - MAX_COLUMNS} more columns)"
+    lines.append(f"Columns: {dtypes}")
+    if len(df) > 2 * k:
+        numeric = df.iloc[:, :MAX_COLUMNS].select_dtypes("number")
+        for name in numeric.columns[:k]:
+            lines.append(f"{name}: {_stats(numeric[name])}")
+    if len(df):
+        lines.append(_head_tail(df, k))
+    return "\n".join(lines)
+
+
+def _summarize(value, k: int) -> str:
+    if isinstance(value, pd.DataFrame):
+        return _summarize_frame(value, k)
+    if isinstance(value, pd.Series):
+        return _summarize_series(value, k)
+    if isinstance(value, pd.Index):
+        return _summarize_series(pd.Series(value), k)
+    if isinstance(value, np.ndarray):
+        if value.ndim == 1:
+            return _summarize_series(pd.Series(value), k)
+        if value.ndim == 2:
+            return _summarize_frame(pd.DataFrame(value), k)
+        return f"Array of shape {value.shape}, dtype {value.dtype}: {_repr.repr(value.ravel()[:k].tolist())}"
+    if isinstance(value, dict) and len(value) > 2 * k:
+        items = list(value.items())
+        shown = ", ".join(f"{_fmt(key)}: {_fmt(v)}" for key, v in items[:k])
+        return f"Dict with {len(value):,} entries: {{{shown}, …}}"
+    if isinstance(value, (list, tuple, set)) and len(value) > 2 * k:
+        items = list(value)
+        return f"{type(value).__name__} with {len(value):,} items: {_repr.repr(items[:k])[:-1]}, …]"
+    return _fmt(value)
+
+
+def summarize_result(value, max_tokens: int = RESULT_TOKEN_BUDGET, truncated: bool = False) -> str:
+    """
+    Bounded description of a generated-code result for the synthesis prompt:
+    shape, dtypes, stats, top values and head/tail, with truncation markers.
+    Only the rows that are shown are ever rendered, so large results are cheap.
+    `truncated` marks a result that was cut at a row limit before it got here.
+    """
+    note = ("Truncated: only the first rows of the result were fetched, so the full result is larger "
+            "and totals over these rows are incomplete.\n" if truncated else "")
+    text = ""
+    for k in DETAIL_LEVELS:
+        try:
+            text = note + _summarize(value, k)
+        except Exception:
+            text = note + _repr.repr(value)
+        if estimate_tokens(text) <= max_tokens:
+            return text
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    marker = " … [truncated]"
+    return text[:max_chars - len(marker)] + marker
@@ -0,0 +1,313 @@
+import ast
+import itertools
+import os
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from cache import frame_unchanged, snapshot_frame
+from dataset_profile import get_profile
+from tracing import traced, current_span
+
+# --- Configuration ---
+ROLLUPS_ENABLED = os.environ.get("TALKING_RABBITT_ROLLUPS", "1") != "0"
+ROLLUP_MEMORY_BYTES = 64 * 1024 ** 2  # Budget for every precomputed group-by of one dataset
+ROLLUP_MIN_ROWS = 100_000             # Smaller frames are aggregated directly
+MAX_DIMENSIONS = 6                    # Lowest-cardinality columns used as group keys
+MAX_DIMENSION_CARDINALITY = 200
+MAX_GROUPINGS = 48
+DATE_PARTS = ("year", "quarter", "month", "dayofweek")  # df[c].dt.<part>
+DATE_PERIODS = ("Y", "Q", "M", "D")                      # df[c].dt.to_period(<freq>)
+AGGREGATES = ("sum", "mean", "count", "size")
+SIZE_COLUMN = "__size"
+_PLACEHOLDER = "__rollup__"
+
+
+# --- Matching generated code ---
+def _is_df(node) -> bool:
+    return isinstance(node, ast.Name) and node.id == "df"
+
+
+def _column_name(node):
+    """`df['c']` or `df.c` -> 'c'."""
+    if isinstance(node, ast.Subscript) and _is_df(node.value) \
+            and isinstance(node.slice, ast.Constant) and isinstance(node.slice.value, str):
+        return node.slice.value
+    if isinstance(node, ast.Attribute) and _is_df(node.value):
+        return node.attr
+    return None
+
+
+def _key_spec(node):
+    """Group key spec for a groupby argument: ("col", c), ("dt", c, part) or ("period", c, freq)."""
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        return ("col", node.value)
+    name = _column_name(node)
+    if name is not None:
+        return ("col", name)
+    if isinstance(node, ast.Attribute) and node.attr in DATE_PARTS \
+            and isinstance(node.value, ast.Attribute) and node.value.attr == "dt":
+        name = _column_name(node.value.value)
+        return ("dt", name, node.attr) if name is not None else None
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr == "to_period" \
+            and isinstance(node.func.value, ast.Attribute) and node.func.value.attr == "dt" \
+            and len(node.args) == 1 and not node.keywords \
+            and isinstance(node.args[0], ast.Constant) and node.args[0].value in DATE_PERIODS:
+        name = _column_name(node.func.value.value)
+        return ("period", name, node.args[0].value) if name is not None else None
+    return None
+
+
+def _groupby(node):
+    """`df.groupby(keys, ...)` -> (key specs, as_index), or None if the call can't be served from rollups."""
+    if not (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute)
+            and node.func.attr == "groupby" and _is_df(node.func.value)):
+        return None
+    keys = node.args[0] if len(node.args) == 1 else None
+    as_index = True
+    for keyword in node.keywords:
+        value = keyword.value.value if isinstance(keyword.value, ast.Constant) else None
+        if keyword.arg == "by" and keys is None:
+            keys = keyword.value
+        elif keyword.arg == "as_index" and isinstance(value, bool):
+            as_index = value
+        elif keyword.arg not in ("observed", "sort", "dropna") or value is not True:
+            # Unobserved categories, unsorted groups and NaN keys are not precomputed
+            return None
+    if keys is None:
+        return None
+    nodes = keys.elts if isinstance(keys, (ast.List, ast.Tuple)) else [keys]
+    specs = tuple(_key_spec(n) for n in nodes)
+    if not specs or None in specs or len({s[1] for s in specs}) != len(specs):
+        return None
+    return specs, as_index
+
+
+class _Rewriter(ast.NodeTransformer):
+    """Replaces `df.groupby(...)[cols].<aggregate>()` with a lookup in a precomputed group-by."""
+
+    def __init__(self, measures):
+        self.measures = measures
+        self.groupings = set()
+
+    def visit_Call(self, node):
+        node = self.generic_visit(node)
+        if not isinstance(node.func, ast.Attribute):
+            return node
+        aggregate = node.func.attr
+        if aggregate in ("agg", "aggregate") and len(node.args) == 1 and not node.keywords \
+                and isinstance(node.args[0], ast.Constant):
+            aggregate = node.args[0].value
+        elif node.args or node.keywords:
+            return node
+        if aggregate not in AGGREGATES:
+            return node
+
+        target, columns = node.func.value, None
+        if isinstance(target, ast.Subscript):
+            selection = target.slice
+            if isinstance(selection, ast.Constant) and isinstance(selection.value, str):
+                columns = selection.value
+            elif isinstance(selection, ast.List) and selection.elts and all(
+                    isinstance(e, ast.Constant) and isinstance(e.value, str) for e in selection.elts):
+                columns = [e.value for e in selection.elts]
+            else:
+                return node
+            target = target.value
+        grouped = _groupby(target)
+        if grouped is None:
+            return node
+        specs, as_index = grouped
+        names = [s[1] for s in specs]
+
+        # One row per group; re-grouping the rollup rebuilds the index exactly as the original groupby would
+        frame = f"{_PLACEHOLDER}.groupby({names!r}, observed=True).first()"
+        if columns is None:
+            if aggregate != "size" or not as_index:
+                return node
+            expression = f"{frame}[{SIZE_COLUMN!r}].rename(None)"
+        elif isinstance(columns, str):
+            if aggregate == "size" and not as_index:
+                # pandas names that column "size", next to the keys
+                return node
+            if aggregate != "size" and columns not in self.measures:
+                return node
+            source = SIZE_COLUMN if aggregate == "size" else f"{columns}__{aggregate}"
+            expression = f"{frame}[{source!r}].rename({columns!r})"
+        else:
+            if aggregate == "size" or not set(columns) <= self.measures:
+                return node
+            expression = f"{frame}[{[f'{c}__{aggregate}' for c in columns]!r}].set_axis({columns!r}, axis=1)"
+        if not as_index:
+            expression += ".reset_index()"
+
+        self.groupings.add(frozenset(specs))
+        return ast.parse(expression, mode="eval").body
+
+
+class _Rename(ast.NodeTransformer):
+    def visit_Name(self, node):
+        return ast.copy_location(ast.Name(id="df", ctx=node.ctx), node) if node.id == _PLACEHOLDER else node
+
+
+# --- Rollups ---
+def _key_series(df: pd.DataFrame, spec) -> pd.Series:
+    column = df[spec[1]]
+    if spec[0] == "dt":
+        return getattr(column.dt, spec[2])
+    if spec[0] == "period":
+        return column.dt.to_period(spec[2])
+    return column
+
+
+def _date_cardinality(info: dict, spec) -> int:
+    start, end = pd.Timestamp(info["min"]), pd.Timestamp(info["max"])
+    years = end.year - start.year + 1
+    if spec[0] == "dt":
+        return {"year": years, "quarter": 4, "month": 12, "dayofweek": 7}[spec[2]]
+    return {"Y": years, "Q": years * 4, "M": years * 12, "D": (end - start).days + 1}[spec[2]]
+
+
+class RollupCube:
+    """
+    Precomputed group-by aggregates (sum, mean and count of every numeric
+    column, plus group sizes) over a dataset's low-cardinality columns and
+    date granularities, singly and in pairs, within a memory budget.
+    Generated code that aggregates one of these groupings is rewritten to
+    read the rollup instead of scanning the full frame.
+    """
+
+    def __init__(self, frames: dict = None, measures=()):
+        self.frames = frames if frames is not None else {}  # frozenset of key specs -> flat frame
+        self.measures = set(measures)
+        self.stats = {"hits": 0, "misses": 0}
+
+    @property
+    def nbytes(self) -> int:
+        return sum(int(f.memory_usage(deep=True).sum()) for f in list(self.frames.values()))
+
+    @classmethod
+    def build(cls, df: pd.DataFrame, memory_bytes: int = ROLLUP_MEMORY_BYTES, max_groupings: int = MAX_GROUPINGS):
+        cube = cls()
+        cube.populate(df, memory_bytes, max_groupings)
+        return cube
+
+    @traced("rollup.build")
+    def populate(self, df: pd.DataFrame, memory_bytes: int = ROLLUP_MEMORY_BYTES, max_groupings: int = MAX_GROUPINGS):
+        """
+        Computes the groupings of `df`, smallest first. Each one is usable as
+        soon as it is stored, so lookups can start while larger ones build.
+        """
+        profile = get_profile(df)
+        dimensions, measures, keys = [], [], []
+        for i, info in enumerate(profile.columns):
+            name, series = df.columns[i], df.iloc[:, i]
+            if not isinstance(name, str):
+                continue
+            if pd.api.types.is_numeric_dtype(series.dtype) and not pd.api.types.is_bool_dtype(series.dtype):
+                measures.append(name)
+            if pd.api.types.is_datetime64_any_dtype(series.dtype):
+                if info.get("min") is not None:
+                    keys += [(s, _date_cardinality(info, s)) for s in
+                             [("dt", name, p) for p in DATE_PARTS] + [("period", name, f) for f in DATE_PERIODS]]
+            elif not pd.api.types.is_float_dtype(series.dtype) and 2 <= info["unique"] <= MAX_DIMENSION_CARDINALITY:
+                dimensions.append((("col", name), info["unique"]))
+        keys += sorted(dimensions, key=lambda d: d[1])[:MAX_DIMENSIONS]
+        self.measures = set(measures)
+
+        # Smallest groupings first: every single key, then pairs of keys on different columns
+        candidates = [((spec,), n) for spec, n in keys]
+        candidates += [((a, b), n * m) for (a, n), (b, m) in itertools.combinations(keys, 2) if a[1] != b[1]]
+        candidates.sort(key=lambda c: c[1])
+        row_bytes = 8 * (3 * len(measures) + 3)
+
+        total, cache = 0, {}
+        for specs, estimate in candidates:
+            if len(self.frames) >= max_groupings or total + estimate * row_bytes > memory_bytes:
+                break
+            for spec in specs:
+                if spec not in cache:
+                    cache[spec] = _key_series(df, spec)
+            grouped = df.groupby([cache[s] for s in specs], observed=True, sort=True, dropna=True)
+            sizes = grouped.size()
+            if measures:
+                frame = grouped[measures].agg(["sum", "mean", "count"])
+                frame.columns = [f"{c}__{a}" for c, a in frame.columns]
+                # Same groups in the same order; assigning values keeps the key dtypes intact
+                frame[SIZE_COLUMN] = sizes.to_numpy()
+            else:
+                frame = sizes.to_frame(SIZE_COLUMN)
+            frame = frame.reset_index()
+            size = int(frame.memory_usage(deep=True).sum())
+            if total + size > memory_bytes:
+                break
+            self.frames[frozenset(specs)] = frame
+            total += size
+
+        current_span().set(groupings=len(self.frames), bytes=total, measures=len(measures))
+
+    def rewrite(self, code: str):
+        """
+        Returns (code, rollup frame) when every aggregate in `code` can be read
+        from one precomputed grouping and nothing else touches `df`, else None.
+        The rewritten code expects the rollup frame as `df`.
+        """
+        try:
+            tree = ast.parse(code)
+        except SyntaxError:
+            return None
+        rewriter = _Rewriter(self.measures)
+        tree = rewriter.visit(tree)
+        if len(rewriter.groupings) != 1 or any(_is_df(n) for n in ast.walk(tree)) \
+                or next(iter(rewriter.groupings)) not in self.frames:
+            self.stats["misses"] += 1
+            return None
+        self.stats["hits"] += 1
+        tree = ast.fix_missing_locations(_Rename().visit(tree))
+        return ast.unparse(tree), self.frames[next(iter(rewriter.groupings))]
+
+
+_cubes = {}  # id(df) -> (weakref to df, snapshot of df, RollupCube)
+_cubes_lock = threading.Lock()
+_executor = None
+
+
+def build_rollups(df: pd.DataFrame):
+    """Starts building the frame's rollups in the background (once per frame, large frames only)."""
+    global _executor
+    if not ROLLUPS_ENABLED or len(df) < ROLLUP_MIN_ROWS:
+        return
+    with _cubes_lock:
+        entry = _cubes.get(id(df))
+        if entry is not None and entry[0]() is df and frame_unchanged(df, entry[1]):
+            return
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rollups")
+        key, cube = id(df), RollupCube()
+        _cubes[key] = (weakref.ref(df, lambda _, key=key: _cubes.pop(key, None)), snapshot_frame(df), cube)
+    # The build holds the frame only until it finishes
+    _executor.submit(_populate, cube, df)
+
+
+def _populate(cube, df):
+    try:
+        cube.populate(df)
+    except Exception as e:
+        print(f"Rollup build failed: {e}")
+
+
+def get_rollups(df: pd.DataFrame):
+    """
+    The frame's rollups (possibly still being built), or None if there are
+    none. Rollups of a frame that was changed in place since are dropped.
+    """
+    with _cubes_lock:
+        entry = _cubes.get(id(df))
+        if entry is None or entry[0]() is not df:
+            return None
+        if not frame_unchanged(df, entry[1]):
+            del _cubes[id(df)]
+            return None
+    return entry[2]
@@ -0,0 +1,216 @@
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+
+from cache import CACHE_ROOT
+
+# --- Configuration ---
+ROUTER_DIR = os.path.join(CACHE_ROOT, "router")
+MODEL_CONFIDENCE = 0.9   # Posterior needed before the classifier answers without the LLM
+MIN_TRAINING_EXAMPLES = 20
+AUDIT_RATE = 0.0         # Share of confident decisions still sent to the LLM to measure accuracy
+
+VISUALIZATION = "VISUALIZATION"
+TEXT = "TEXT"
+
+# Chart vocabulary (including the keywords the LLM intent prompt lists): any of these means a figure
+VIZ_PATTERN = re.compile(
+    r"\b(chart|charts|plot|plots|plotting|graph|graphs|visuali[sz]e|visuali[sz]ation|draw|show me|display|"
+    r"histogram|pie|scatter|heatmap|heat map|diagram|boxplot|box plot)\b"
+)
+# Plain lookups with no display verb at all are answered in text
+TEXT_PATTERN = re.compile(
+    r"^(what|how many|how much|which|who|when|is|are|does|do|did|was|were|list|count|give me the|tell me)\b"
+)
+WEAK_VIZ_PATTERN = re.compile(r"\b(show|trend|trends|distribution|compare|over time)\b")
+
+# Seed examples so the classifier is usable before it has learned from the LLM
+SEED_EXAMPLES = [
+    ("sales by region chart", VISUALIZATION),
+    ("revenue over time", VISUALIZATION),
+    ("distribution of prices", VISUALIZATION),
+    ("compare profit across categories", VISUALIZATION),
+    ("trend of orders per month", VISUALIZATION),
+    ("top 10 products by sales as bars", VISUALIZATION),
+    ("how do sales change over time", VISUALIZATION),
+    ("break down revenue by segment visually", VISUALIZATION),
+    ("average order value", TEXT),
+    ("total revenue", TEXT),
+    ("total sales for 2023", TEXT),
+    ("average price of electronics", TEXT),
+    ("top customer by revenue", TEXT),
+    ("number of orders in march", TEXT),
+    ("highest salary", TEXT),
+    ("median age of customers", TEXT),
+]
+
+
+def _tokens(question: str) -> list:
+    words = re.findall(r"[a-z0-9']+", question.lower())
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+class NaiveBayesIntent:
+    """Tiny multinomial Naive Bayes over word unigrams and bigrams, trainable online."""
+
+    def __init__(self):
+        self.class_counts = {}
+        self.token_counts = {}
+        self.token_totals = {}
+        self.vocabulary = set()
+
+    def learn(self, question: str, label: str):
+        self.class_counts[label] = self.class_counts.get(label, 0) + 1
+        counts = self.token_counts.setdefault(label, {})
+        for tok in _tokens(question):
+            counts[tok] = counts.get(tok, 0) + 1
+            self.token_totals[label] = self.token_totals.get(label, 0) + 1
+            self.vocabulary.add(tok)
+
+    def predict(self, question: str):
+        """Returns (label, posterior probability), or (None, 0.0) if untrained."""
+        if not self.class_counts:
+            return None, 0.0
+        total = sum(self.class_counts.values())
+        vocab = len(self.vocabulary) or 1
+        scores = {}
+        for label, n in self.class_counts.items():
+            score = math.log(n / total)
+            counts = self.token_counts.get(label, {})
+            denom = self.token_totals.get(label, 0) + vocab
+            for tok in _tokens(question):
+                score += math.log((counts.get(tok, 0) + 1) / denom)
+            scores[label] = score
+
+        best = max(scores, key=scores.get)
+        norm = sum(math.exp(s - scores[best]) for s in scores.values())
+        return best, 1.0 / norm
+
+    @property
+    def n_examples(self) -> int:
+        return sum(self.class_counts.values())
+
+    def to_dict(self) -> dict:
+        return {"class_counts": self.class_counts, "token_counts": self.token_counts}
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        model = cls()
+        model.class_counts = data.get("class_counts", {})
+        model.token_counts = data.get("token_counts", {})
+        for label, counts in model.token_counts.items():
+            model.token_totals[label] = sum(counts.values())
+            model.vocabulary.update(counts)
+        return model
+
+
+class IntentRouter:
+    """
+    Decides VISUALIZATION vs TEXT locally: keyword rules first, then a small
+    offline classifier, and only asks the LLM when both are unsure. Every LLM
+    answer becomes a training example, and every decision is logged to JSONL.
+    """
+
+    def __init__(self, directory: str = None, confidence: float = MODEL_CONFIDENCE,
+                 min_examples: int = MIN_TRAINING_EXAMPLES, audit_rate: float = AUDIT_RATE):
+        self.directory = directory or ROUTER_DIR
+        self.model_path = os.path.join(self.directory, "intent_model.json")
+        self.log_path = os.path.join(self.directory, "decisions.jsonl")
+        self.confidence = confidence
+        self.min_examples = min_examples
+        self.audit_rate = audit_rate
+        self.stats = {"rules": 0, "model": 0, "llm": 0, "audits": 0, "audit_agreements": 0}
+        self._lock = threading.Lock()
+
+        os.makedirs(self.directory, exist_ok=True)
+        self.model = self._load_model()
+
+    def _load_model(self) -> NaiveBayesIntent:
+        try:
+            with open(self.model_path, "r", encoding="utf-8") as f:
+                return NaiveBayesIntent.from_dict(json.load(f))
+        except (FileNotFoundError, json.JSONDecodeError):
+            model = NaiveBayesIntent()
+            for question, label in SEED_EXAMPLES:
+                model.learn(question, label)
+            return model
+
+    def _save_model(self):
+        tmp_path = f"{self.model_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.model.to_dict(), f)
+        os.replace(tmp_path, self.model_path)
+
+    def _log(self, entry: dict):
+        entry["ts"] = time.time()
+        with open(self.log_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+
+    def classify_locally(self, question: str):
+        """Returns (label or None, source, confidence) without any network call."""
+        q = question.lower().strip()
+        if VIZ_PATTERN.search(q):
+            return VISUALIZATION, "rules", 1.0
+        if TEXT_PATTERN.search(q) and not WEAK_VIZ_PATTERN.search(q):
+            return TEXT, "rules", 1.0
+
+        label, prob = self.model.predict(q)
+        if label and prob >= self.confidence and self.model.n_examples >= self.min_examples:
+            return label, "model", prob
+        return None, "model", prob if label else 0.0
+
+    def route(self, question: str, llm_classify) -> str:
+        """
+        Returns the intent for `question`. `llm_classify()` is only called when
+        the local stages are unsure (or for a random audit sample) and returns
+        a label, or None if the call failed.
+        """
+        with self._lock:
+            label, source, confidence = self.classify_locally(question)
+            guess, _ = self.model.predict(question.lower())
+            if label is not None and random.random() >= self.audit_rate:
+                self.stats[source] += 1
+                self._log({"question": question, "label": label, "source": source, "confidence": confidence})
+                return label
+
+        llm_label = llm_classify()
+        if llm_label is None:
+            # The LLM call failed: don't learn from it, fall back to the best local guess
+            return label or guess or TEXT
+
+        with self._lock:
+            if label is not None:
+                # Audit of a confident local decision
+                self.stats["audits"] += 1
+                self.stats["audit_agreements"] += int(llm_label == label)
+            else:
+                self.stats["llm"] += 1
+            self.model.learn(question, llm_label)
+            self._save_model()
+            self._log({
+                "question": question, "label": llm_label, "source": "llm",
+                "local_label": label or guess, "local_confidence": confidence,
+            })
+        return llm_label
+
+    def avoided_call_rate(self) -> float:
+        local = self.stats["rules"] + self.stats["model"]
+        total = local + self.stats["llm"] + self.stats["audits"]
+        return local / total if total else 0.0
+
+
+_default_router = None
+_default_router_lock = threading.Lock()
+
+
+def default_intent_router() -> IntentRouter:
+    """Process-wide router shared by every TalkingRabbit instance."""
+    global _default_router
+    with _default_router_lock:
+        if _default_router is None:
+            _default_router = IntentRouter()
+        return _default_router
@@ -0,0 +1,321 @@
+import itertools
+import multiprocessing
+import os
+import pickle
+import queue
+import signal
+import tempfile
+import threading
+import time
+import weakref
+
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+import plotly.io as pio
+
+from compaction import has_categoricals, expand_dataframe
+from figures import optimize_figure, serialize_figure
+
+try:
+    import resource
+except ImportError:  # Not available on Windows; limits other than wall-clock are skipped
+    resource = None
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+# --- Configuration ---
+SANDBOX_ENABLED = os.environ.get("TALKING_RABBITT_SANDBOX", "1") != "0"
+SANDBOX_WORKERS = min(4, os.cpu_count() or 1)
+WALL_TIMEOUT_SECONDS = 30.0
+CPU_TIMEOUT_SECONDS = 20
+MEMORY_LIMIT_BYTES = 2 * 1024 ** 3   # Extra address space a single call may allocate
+MAX_RESULT_BYTES = 8 * 1024 ** 2     # Larger non-figure results are truncated before pickling
+SHARED_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+
+
+def exec_generated(code, local_vars):
+    """
+    Runs LLM-generated code and returns its namespace. If the code trips over a
+    categorical column of the compacted frame, it is retried once on plain dtypes.
+    """
+    try:
+        exec(code, {}, local_vars)
+    except (TypeError, ValueError):
+        df = local_vars.get('df')
+        if df is None or not has_categoricals(df):
+            raise
+        local_vars = dict(local_vars, df=expand_dataframe(df))
+        exec(code, {}, local_vars)
+    return local_vars
+
+
+# --- Errors ---
+class SandboxError(Exception):
+    """Generated code could not be run to completion in the sandbox."""
+
+
+class SandboxTimeout(SandboxError):
+    pass
+
+
+class SandboxLimitExceeded(SandboxError):
+    pass
+
+
+class GeneratedCodeError(SandboxError):
+    """The generated code itself raised; the message carries the original exception."""
+
+
+# --- Worker side ---
+class _CPUTimeExceeded(Exception):
+    pass
+
+
+def _on_sigxcpu(signum, frame):
+    raise _CPUTimeExceeded()
+
+
+_datasets = {}  # path -> DataFrame, loaded once per worker and reused across calls
+
+
+def _load_dataset(path, fmt):
+    df = _datasets.get(path)
+    if df is None:
+        if fmt == "arrow":
+            # Memory-mapped: numeric columns become zero-copy views on the shared file
+            with pa.memory_map(path, "r") as source:
+                df = pa.ipc.open_file(source).read_all().to_pandas(split_blocks=True)
+        else:
+            df = pd.read_pickle(path)
+        # Keep only the most recent datasets resident in the worker
+        while len(_datasets) >= 2:
+            _datasets.pop(next(iter(_datasets)))
+        _datasets[path] = df
+    return df
+
+
+def _set_limits(cpu_seconds, memory_bytes):
+    if resource is None:
+        return None
+    previous = (resource.getrlimit(resource.RLIMIT_CPU), resource.getrlimit(resource.RLIMIT_AS))
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    used = int(usage.ru_utime + usage.ru_stime) + 1
+    hard_cpu = previous[0][1]
+    soft_cpu = used + cpu_seconds
+    if hard_cpu != resource.RLIM_INFINITY:
+        soft_cpu = min(soft_cpu, hard_cpu)
+    resource.setrlimit(resource.RLIMIT_CPU, (soft_cpu, hard_cpu))
+    try:
+        with open("/proc/self/statm") as f:
+            vm_bytes = int(f.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+        resource.setrlimit(resource.RLIMIT_AS, (vm_bytes + memory_bytes, previous[1][1]))
+    except (OSError, ValueError):
+        pass
+    return previous
+
+
+def _reset_limits(previous):
+    if resource is None or previous is None:
+        return
+    resource.setrlimit(resource.RLIMIT_CPU, previous[0])
+    resource.setrlimit(resource.RLIMIT_AS, previous[1])
+
+
+def _compact_value(value):
+    """
+    Pickles a result, truncating large frames/series so the reply stays small.
+    Returns (payload, truncated).
+    """
+    payload = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+    if len(payload) > MAX_RESULT_BYTES and isinstance(value, (pd.DataFrame, pd.Series)):
+        rows = max(int(len(value) * MAX_RESULT_BYTES / len(payload)), 1)
+        payload = pickle.dumps(value.head(rows), protocol=pickle.HIGHEST_PROTOCOL)
+        return payload, True
+    return payload, False
+
+
+def _run_job(job):
+    # A shallow copy per job: in-place edits by generated code never reach the cached frame
+    df = _load_dataset(job["path"], job["format"]).copy(deep=False)
+    namespace = {'df': df, 'pd': pd, 'px': px, 'go': go}
+    previous = _set_limits(job["cpu_seconds"], job["memory_bytes"])
+    try:
+        namespace = exec_generated(job["code"], namespace)
+        value = None
+        for name in job["outputs"]:
+            value = namespace.get(name)
+            if value is not None:
+                break
+        if isinstance(value, go.Figure):
+            # Downsample before serializing so only the reduced figure crosses the pipe
+            value, report = optimize_figure(value)
+            start = time.perf_counter()
+            _, payload, report["repaired"] = serialize_figure(value)
+            report["serialize_seconds"] = time.perf_counter() - start
+            report["payload_bytes"] = len(payload)
+            return {"kind": "figure", "payload": payload, "report": report}
+        payload, truncated = _compact_value(value)
+        return {"kind": "value", "payload": payload, "truncated": truncated}
+    finally:
+        _reset_limits(previous)
+
+
+def _worker_main(conn):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if hasattr(signal, "SIGXCPU"):
+        signal.signal(signal.SIGXCPU, _on_sigxcpu)
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            return
+        if job is None:
+            return
+        try:
+            reply = _run_job(job)
+        except _CPUTimeExceeded:
+            reply = {"error": f"CPU time limit of {job['cpu_seconds']}s exceeded", "limit": True}
+        except MemoryError:
+            reply = {"error": "Memory limit exceeded", "limit": True}
+        except Exception as e:
+            reply = {"error": f"{type(e).__name__}: {e}", "limit": False}
+        conn.send(reply)
+
+
+# --- Parent side ---
+class _Worker:
+    def __init__(self, context):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn,), daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def kill(self):
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join(timeout=1)
+        self.conn.close()
+
+
+class SandboxExecutor:
+    """
+    Runs generated code in a warm pool of worker processes. The dataset is
+    written once to a shared-memory Arrow file and memory-mapped by each
+    worker, so frames are never pickled per call. Every call gets a CPU-time,
+    wall-clock and memory budget; results come back as a pickled value or
+    figure JSON.
+    """
+
+    def __init__(self, workers: int = SANDBOX_WORKERS, wall_timeout: float = WALL_TIMEOUT_SECONDS,
+                 cpu_seconds: int = CPU_TIMEOUT_SECONDS, memory_bytes: int = MEMORY_LIMIT_BYTES):
+        self.wall_timeout = wall_timeout
+        self.cpu_seconds = cpu_seconds
+        self.memory_bytes = memory_bytes
+        self._context = multiprocessing.get_context("spawn")
+        self._idle = queue.Queue()
+        for _ in range(workers):
+            self._idle.put(_Worker(self._context))
+        self._datasets = {}  # id(df) -> (weakref to df, path, format)
+        self._lock = threading.Lock()
+        self._counter = itertools.count()
+
+    def _dataset_file(self, df: pd.DataFrame):
+        """Writes `df` to the shared directory once and returns (path, format)."""
+        with self._lock:
+            entry = self._datasets.get(id(df))
+            if entry is not None and entry[0]() is df:
+                return entry[1], entry[2]
+
+            base = os.path.join(SHARED_DIR, f"talking-rabbitt-{os.getpid()}-{next(self._counter)}")
+            path, fmt = base + ".arrow", "arrow"
+            try:
+                if pa is None:
+                    raise TypeError("pyarrow not installed")
+                # The index goes along (a RangeIndex only as metadata), so idxmax() etc. match local runs
+                table = pa.Table.from_pandas(df, preserve_index=None)
+                with pa.OSFile(path, "wb") as sink:
+                    with pa.ipc.new_file(sink, table.schema) as writer:
+                        writer.write_table(table)
+            except (TypeError, ValueError, getattr(pa, "ArrowException", TypeError)):
+                path, fmt = base + ".pkl", "pickle"
+                df.to_pickle(path)
+
+            # Remove the shared file once the frame is gone
+            weakref.finalize(df, _remove_quietly, path)
+            self._datasets[id(df)] = (weakref.ref(df), path, fmt)
+            return path, fmt
+
+    def run(self, code: str, df: pd.DataFrame, outputs, report: dict = None):
+        """
+        Executes `code` against `df` and returns the first non-None variable
+        named in `outputs`: a Plotly figure or a plain Python value. Figures
+        are downsampled and serialized in the worker; pass `report` to receive
+        the size figures and the JSON payload (as "figure_json"), or whether a
+        large frame/series was cut to its first rows (as "truncated").
+        """
+        path, fmt = self._dataset_file(df)
+        job = {
+            "code": code, "path": path, "format": fmt, "outputs": list(outputs),
+            "cpu_seconds": self.cpu_seconds, "memory_bytes": self.memory_bytes,
+        }
+
+        worker = self._idle.get()
+        try:
+            worker.conn.send(job)
+            if not worker.conn.poll(self.wall_timeout):
+                worker.kill()
+                worker = _Worker(self._context)
+                raise SandboxTimeout(f"Generated code exceeded {self.wall_timeout}s")
+            reply = worker.conn.recv()
+        except (EOFError, BrokenPipeError, ConnectionResetError):
+            # The worker died (e.g. killed by the kernel for exceeding a hard limit)
+            worker.kill()
+            worker = _Worker(self._context)
+            raise SandboxLimitExceeded("Sandbox worker crashed while running generated code")
+        finally:
+            self._idle.put(worker)
+
+        if "error" in reply:
+            error_type = SandboxLimitExceeded if reply["limit"] else GeneratedCodeError
+            raise error_type(reply["error"])
+        if reply["kind"] == "figure":
+            if report is not None:
+                report.update(reply["report"], figure_json=reply["payload"])
+            return pio.from_json(reply["payload"], skip_invalid=True)
+        if report is not None:
+            report["truncated"] = reply["truncated"]
+        return pickle.loads(reply["payload"])
+
+    def shutdown(self):
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            worker.kill()
+
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+_sandbox = None
+_sandbox_lock = threading.Lock()
+
+
+def get_sandbox():
+    """Process-wide sandbox executor, or None when sandboxing is disabled."""
+    global _sandbox
+    if not SANDBOX_ENABLED:
+        return None
+    with _sandbox_lock:
+        if _sandbox is None:
+            _sandbox = SandboxExecutor()
+        return _sandbox
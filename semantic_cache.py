@@ -0,0 +1,174 @@
+import math
+import re
+import threading
+
+# --- Configuration ---
+SIMILARITY_THRESHOLD = 0.8   # Cosine similarity needed to reuse a previous question's code
+MAX_QUESTIONS_PER_DATASET = 200
+
+STOPWORDS = {
+    "a", "an", "the", "of", "for", "in", "on", "to", "is", "are", "was", "were", "be", "me", "my",
+    "please", "can", "could", "you", "i", "we", "what", "whats", "which", "tell", "give", "show",
+    "find", "get", "list", "do", "does", "there", "and", "with", "all", "each", "every", "data", "how",
+}
+SYNONYMS = {
+    "per": "by", "across": "by", "grouped": "by", "group": "by",
+    "total": "sum", "sums": "sum", "overall": "sum",
+    "average": "mean", "avg": "mean", "mean": "mean",
+    "number": "count", "many": "count", "counts": "count",
+    "highest": "max", "largest": "max", "biggest": "max", "maximum": "max", "most": "max", "top": "max",
+    "lowest": "min", "smallest": "min", "minimum": "min", "least": "min", "bottom": "min",
+}
+# Words that change which aggregate the code computes; they must agree for a reuse
+AGGREGATES = {"sum", "mean", "count", "max", "min", "median", "std", "unique", "distinct", "percent", "ratio"}
+# Structure words that don't change what the code filters on
+STRUCTURAL = {"by"}
+# Questions that lean on the conversation ("what about that one?") are never reused
+REFERENTIAL = {"it", "its", "that", "those", "them", "this", "these", "same", "previous", "again", "instead"}
+
+
+def _is_referential(question: str) -> bool:
+    return bool(REFERENTIAL & set(re.findall(r"[a-z]+", question.lower())))
+
+
+def normalize_question(question: str) -> list:
+    """Lowercases, strips punctuation and stopwords, folds synonyms and plurals."""
+    tokens = []
+    for word in re.findall(r"[a-z0-9_]+", question.lower()):
+        word = SYNONYMS.get(word, word)
+        if word in STOPWORDS:
+            continue
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        tokens.append(word)
+    return tokens
+
+
+def code_literals(code: str, columns) -> set:
+    """Normalized tokens of the string literals in Python or SQL code, other than column names."""
+    names = {str(c).lower() for c in columns}
+    tokens = set()
+    for single, double in re.findall(r"'((?:[^'\\]|\\.)*)'|\"((?:[^\"\\]|\\.)*)\"", code):
+        literal = single or double
+        if literal.lower() not in names:
+            tokens.update(normalize_question(literal))
+    return tokens
+
+
+def _features(tokens: list) -> dict:
+    counts = {}
+    for feature in tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]:
+        counts[feature] = counts.get(feature, 0) + 1
+    return counts
+
+
+class _DatasetIndex:
+    """TF-IDF index over the normalized questions asked about one dataset."""
+
+    def __init__(self):
+        self.entries = []   # dicts with tokens, features, type, code, literals
+        self.doc_freq = {}
+
+    def _vector(self, features: dict) -> dict:
+        n_docs = len(self.entries) + 1
+        vector = {f: tf * (math.log(n_docs / (1 + self.doc_freq.get(f, 0))) + 1) for f, tf in features.items()}
+        norm = math.sqrt(sum(v * v for v in vector.values())) or 1.0
+        return {f: v / norm for f, v in vector.items()}
+
+    def add(self, tokens, kind, code, literals):
+        features = _features(tokens)
+        for entry in self.entries:
+            if entry["tokens"] == tokens:
+                entry.update(type=kind, code=code, literals=literals)
+                return
+        if len(self.entries) >= MAX_QUESTIONS_PER_DATASET:
+            old = self.entries.pop(0)
+            for f in old["features"]:
+                self.doc_freq[f] -= 1
+        for f in features:
+            self.doc_freq[f] = self.doc_freq.get(f, 0) + 1
+        self.entries.append({"tokens": tokens, "features": features, "type": kind, "code": code,
+                             "literals": literals})
+
+    def best_match(self, tokens):
+        query = self._vector(_features(tokens))
+        best, best_score = None, 0.0
+        for entry in self.entries:
+            vector = self._vector(entry["features"])
+            score = sum(w * vector.get(f, 0.0) for f, w in query.items())
+            if score > best_score:
+                best, best_score = entry, score
+        return best, best_score
+
+
+class SemanticQuestionCache:
+    """
+    Per-dataset cache of validated generated code, looked up by question
+    similarity (TF-IDF cosine over normalized questions, fully offline).
+    A match also has to agree on aggregate words, on the dataset columns it
+    mentions and on every other content word (e.g. a filter value); a
+    question with no aggregate word counts as "sum". String literals of the
+    cached code that came from its question (e.g. 'Europe') must appear in
+    the new question too.
+    """
+
+    def __init__(self, threshold: float = SIMILARITY_THRESHOLD):
+        self.threshold = threshold
+        self.stats = {"hits": 0, "misses": 0, "skipped": 0}
+        self._indexes = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _guard(tokens, columns):
+        column_tokens = {t for c in columns for t in normalize_question(str(c))}
+        aggregates = {t for t in tokens if t in AGGREGATES} or {"sum"}
+        mentioned = {t for t in tokens if t in column_tokens}
+        numbers = {t for t in tokens if t.isdigit()}
+        content = set(tokens) - column_tokens - AGGREGATES - STRUCTURAL
+        return aggregates, mentioned, numbers, content
+
+    def lookup(self, fingerprint, question, columns):
+        """Returns {"type", "code", "similarity"} for a confident match, else None."""
+        tokens = normalize_question(question)
+        with self._lock:
+            if len(tokens) < 2 or _is_referential(question):
+                self.stats["skipped"] += 1
+                return None
+            index = self._indexes.get(fingerprint)
+            entry, score = index.best_match(tokens) if index else (None, 0.0)
+            if entry is None or score < self.threshold or \
+                    self._guard(entry["tokens"], columns) != self._guard(tokens, columns) or \
+                    not entry["literals"] <= set(tokens):
+                self.stats["misses"] += 1
+                return None
+            self.stats["hits"] += 1
+            return {"type": entry["type"], "code": entry["code"], "similarity": score}
+
+    def add(self, fingerprint, question, kind, code, columns=()):
+        """Remembers code that ran successfully for `question` on this dataset (with these `columns`)."""
+        tokens = normalize_question(question)
+        if len(tokens) < 2 or _is_referential(question):
+            return
+        # Literals the question picked (filter values); other literals are code details like 'M' or 'sum'
+        literals = code_literals(code, columns) & set(tokens)
+        with self._lock:
+            self._indexes.setdefault(fingerprint, _DatasetIndex()).add(tokens, kind, code, literals)
+
+    def rekey(self, old_fingerprint, new_fingerprint):
+        """
+        Carries the questions asked about a dataset over to a new version of it
+        with the same columns (e.g. after rows were appended). The stored code
+        is re-run on the new rows, so its answers stay current.
+        """
+        with self._lock:
+            index = self._indexes.pop(old_fingerprint, None)
+            if index is not None:
+                self._indexes[new_fingerprint] = index
+
+    def hit_rate(self) -> float:
+        total = self.stats["hits"] + self.stats["misses"] + self.stats["skipped"]
+        return self.stats["hits"] / total if total else 0.0
+
+    def clear(self):
+        with self._lock:
+            self._indexes.clear()
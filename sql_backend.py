@@ -0,0 +1,135 @@
+import os
+import threading
+import time
+import weakref
+
+import pandas as pd
+
+from cache import CACHE_ROOT
+from sandbox import GeneratedCodeError, SandboxTimeout
+from tracing import traced, current_span
+
+try:
+    import duckdb
+    import pyarrow as pa
+except ImportError:  # duckdb is optional; without it questions are answered with pandas code
+    duckdb = None
+    pa = None
+
+# --- Configuration ---
+QUERY_BACKEND = os.environ.get("TALKING_RABBITT_QUERY_BACKEND", "pandas")  # "pandas" or "sql"
+SQL_THREADS = os.cpu_count() or 1
+SQL_MEMORY_LIMIT = os.environ.get("TALKING_RABBITT_SQL_MEMORY", "2GB")  # Beyond this, operators spill to disk
+SQL_SPILL_DIR = os.path.join(CACHE_ROOT, "sql_spill")
+SQL_TIMEOUT_SECONDS = 30.0
+MAX_RESULT_ROWS = 100_000  # Rows fetched from a query; the rest is never materialized
+FETCH_BATCH_ROWS = 10_000
+TABLE_NAME = "df"
+
+_tables = {}  # id(df) -> (weakref to df, Arrow table)
+_tables_lock = threading.Lock()
+
+
+def arrow_table(df: pd.DataFrame):
+    """
+    Arrow view of a cleaned frame, built once per frame. Numeric and
+    Arrow-backed string columns are shared with pandas rather than copied.
+    """
+    key = id(df)
+    with _tables_lock:
+        entry = _tables.get(key)
+        if entry is not None and entry[0]() is df:
+            return entry[1]
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    with _tables_lock:
+        _tables[key] = (weakref.ref(df, lambda _, key=key: _tables.pop(key, None)), table)
+    return table
+
+
+def clean_sql(response: str) -> str:
+    """Strips markdown fences and a trailing semicolon from an LLM SQL reply."""
+    text = response.replace("```sql", "").replace("```", "").strip()
+    return text.rstrip(";").strip()
+
+
+class SQLBackend:
+    """
+    Embedded DuckDB engine for answering questions with SQL. The dataset is
+    registered per query as the table `df` straight from its Arrow view;
+    queries run multi-threaded, spill to disk past the memory limit and are
+    interrupted after a timeout. Only a single read-only SELECT is accepted,
+    and the engine has no file or network access.
+    """
+
+    def __init__(self, threads: int = SQL_THREADS, memory_limit: str = SQL_MEMORY_LIMIT,
+                 spill_dir: str = SQL_SPILL_DIR, timeout: float = SQL_TIMEOUT_SECONDS):
+        os.makedirs(spill_dir, exist_ok=True)
+        self.timeout = timeout
+        self.conn = duckdb.connect(":memory:", config={
+            "threads": threads,
+            "memory_limit": memory_limit,
+            "temp_directory": spill_dir,
+        })
+        # Applied after the spill directory is set; generated SQL can't undo either
+        self.conn.execute("SET enable_external_access = false")
+        self.conn.execute("SET lock_configuration = true")
+
+    def _validate(self, sql: str):
+        try:
+            statements = duckdb.extract_statements(sql)
+        except duckdb.Error as e:
+            raise GeneratedCodeError(f"Invalid SQL: {e}") from None
+        if len(statements) != 1 or statements[0].type != duckdb.StatementType.SELECT:
+            raise GeneratedCodeError("Only a single SELECT query can be run")
+
+    @traced("sql.query")
+    def run(self, sql: str, df: pd.DataFrame, report: dict = None):
+        """
+        Runs `sql` against `df` and returns the result as a DataFrame, or a
+        scalar for a single-cell result. `report` (a dict) receives the row
+        count, whether the result was truncated and the query time.
+        """
+        self._validate(sql)
+        start = time.perf_counter()
+        # Each query gets its own cursor, so sessions can query concurrently
+        cursor = self.conn.cursor()
+        timer = threading.Timer(self.timeout, cursor.interrupt)
+        timer.start()
+        try:
+            cursor.register(TABLE_NAME, arrow_table(df))
+            reader = cursor.execute(sql).fetch_record_batch(FETCH_BATCH_ROWS)
+            batches, rows = [], 0
+            for batch in reader:
+                batches.append(batch)
+                rows += batch.num_rows
+                if rows > MAX_RESULT_ROWS:
+                    break
+            result = pa.Table.from_batches(batches, schema=reader.schema).slice(0, MAX_RESULT_ROWS).to_pandas()
+        except duckdb.InterruptException:
+            raise SandboxTimeout(f"SQL query exceeded {self.timeout}s") from None
+        except duckdb.Error as e:
+            raise GeneratedCodeError(f"{type(e).__name__}: {e}") from None
+        finally:
+            timer.cancel()
+            cursor.close()
+
+        stats = {"rows": len(result), "truncated": rows > MAX_RESULT_ROWS, "seconds": time.perf_counter() - start}
+        current_span().set(**stats)
+        if report is not None:
+            report.update(stats)
+        return result.iat[0, 0] if result.shape == (1, 1) else result
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_sql_backend():
+    """Process-wide SQL backend, or None when duckdb (or pyarrow) is not installed."""
+    global _backend
+    if duckdb is None:
+        return None
+    with _backend_lock:
+        if _backend is None:
+            _backend = SQLBackend()
+        return _backend
@@ -0,0 +1,38 @@
+import os
+import sys
+import tempfile
+from types import SimpleNamespace
+
+# Modules live at the repository root; caches go to a throwaway directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("TALKING_RABBITT_CACHE_DIR", tempfile.mkdtemp(prefix="talking-rabbitt-tests-"))
+os.environ.setdefault("TALKING_RABBITT_SANDBOX", "0")
+
+import pytest
+
+
+class FakeCompletions:
+    """Stands in for `client.chat.completions`: replies with `reply(prompt)` and records every request."""
+
+    def __init__(self, reply):
+        self.reply = reply
+        self.requests = []
+
+    def create(self, messages, model, temperature, stream=False, **kwargs):
+        self.requests.append(messages)
+        content = self.reply(messages[-1]["content"])
+        if isinstance(content, Exception):
+            raise content
+        if stream:
+            return iter([SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=word))])
+                         for word in content.split(" ")])
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+@pytest.fixture
+def fake_client():
+    """Returns a factory: `fake_client(reply)` -> (client, completions)."""
+    def make(reply):
+        completions = FakeCompletions(reply if callable(reply) else (lambda prompt: reply))
+        return SimpleNamespace(chat=SimpleNamespace(completions=completions)), completions
+    return make
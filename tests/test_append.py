@@ -0,0 +1,94 @@
+import io
+
+import numpy as np
+import pandas as pd
+
+from append import DatasetAppender, read_delta
+from compaction import compact_dataframe
+from ingest import StreamingCSVLoader
+
+RAW = pd.DataFrame({
+    "region": ["north", "south", None, "north", "east", "north"],
+    "qty": [1.0, 2.0, 3.0, None, 5.0, 6.0],
+    "price": [10, 20, 30, 40, 50, 60],
+    "order_date": ["2024-01-01", "2024-01-02", "2024-01-03", "2024-01-04", "2024-01-05", "2024-01-06"],
+})
+
+
+def _csv(frame):
+    return io.BytesIO(frame.to_csv(index=False).encode("utf-8"))
+
+
+def _load():
+    """Loads and compacts RAW like the app does; returns (frame, appender holding the raw state)."""
+    loader = StreamingCSVLoader()
+    df, _ = compact_dataframe(loader.load(_csv(RAW)))
+    appender = DatasetAppender()
+    appender.set_state(df, loader.raw_state)
+    return df, appender
+
+
+def _append(df, appender, delta):
+    return appender.append(df, read_delta(_csv(delta), "new.csv"))
+
+
+def test_duplicates_of_raw_rows_are_dropped():
+    df, appender = _load()
+    # Row 2 had its missing region filled while cleaning; the raw row is still recognised
+    delta = pd.concat([RAW.iloc[[2, 3]], RAW.iloc[[2]].assign(price=99), RAW.iloc[[2]].assign(price=99)])
+    combined, added = _append(df, appender, delta)
+    assert len(added) == 1 and added["price"].tolist() == [99]
+    assert appender.last_report["duplicates_dropped"] == 3
+    assert len(combined) == len(df) + 1
+
+
+def test_fills_use_the_raw_statistics():
+    df, appender = _load()
+    delta = pd.DataFrame({"region": [None, "east"], "qty": [None, 9.0], "price": [70, 80],
+                          "order_date": ["2024-01-07", "2024-01-08"]})
+    _, added = _append(df, appender, delta)
+    raw_qty = pd.concat([RAW["qty"], delta["qty"]])
+    # Over the cleaned rows (which include the filled qty) the mean would be 4.2 instead of 4.33
+    assert np.isclose(added["qty"].iloc[0], raw_qty.mean())
+    assert added["region"].iloc[0] == pd.concat([RAW["region"], delta["region"]]).mode()[0]
+    assert appender.last_report["fills"] == {"region": "fill_mode", "qty": "fill_mean"}
+
+
+def test_dtypes_stay_consistent_after_concatenation():
+    df, appender = _load()
+    delta = pd.DataFrame({"region": ["west"], "qty": [7.0], "price": [70], "order_date": ["2024-01-07"]})
+    combined, _ = _append(df, appender, delta)
+    assert combined.dtypes.astype(str).equals(df.dtypes.astype(str))
+    assert list(combined["region"].cat.categories) == sorted(set(RAW["region"].dropna()) | {"west"})
+
+    # A value too large for the downcast integer type widens the column instead of wrapping
+    big = delta.assign(price=2**40, order_date="2024-01-08")
+    widened, _ = _append(combined, appender, big)
+    assert widened["price"].dtype == np.int64 and widened["price"].iloc[-1] == 2**40
+    assert widened["price"].iloc[:-1].tolist() == combined["price"].tolist()
+
+
+def test_only_the_appended_datasets_caches_are_invalidated(fake_client):
+    from agents import TalkingRabbit
+    from cache import dataset_fingerprint
+
+    df, appender = _load()
+    other = pd.DataFrame({"sales": [1, 2, 3]})
+    rabbit = TalkingRabbit(None, client=fake_client("")[0], backend="pandas")
+    code = "result = len(df)"
+    for frame in (df, other):
+        rabbit._run_memoized(code, frame, ["result"])
+        rabbit.question_cache.add(dataset_fingerprint(frame), "how many rows are there", "text", code, frame.columns)
+
+    old_fingerprint = dataset_fingerprint(df)
+    delta = pd.DataFrame({"region": ["west"], "qty": [7.0], "price": [70], "order_date": ["2024-01-07"]})
+    combined, _ = _append(df, appender, delta)
+    rabbit.rows_appended(old_fingerprint, combined)
+
+    key = rabbit.result_cache.make_key
+    assert rabbit.result_cache.get(key(old_fingerprint, code, ["result"])) == (False, None)
+    assert rabbit.result_cache.get(key(dataset_fingerprint(other), code, ["result"])) == (True, (3, False))
+    assert rabbit._run_memoized(code, combined, ["result"]) == (len(combined), False)
+    assert rabbit.question_cache.lookup(dataset_fingerprint(combined), "how many rows are there", combined.columns)
+    assert rabbit.question_cache.lookup(old_fingerprint, "how many rows are there", df.columns) is None
+    assert rabbit.question_cache.lookup(dataset_fingerprint(other), "how many rows are there", other.columns)
@@ -0,0 +1,156 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+
+import cache
+from cache import CompletionCache, DatasetCache, ResultCache, dataset_fingerprint, frame_unchanged, snapshot_frame
+
+
+def _frame():
+    return pd.DataFrame(
+        {"region": ["north", "south", None], "sales": [1.5, 2.0, np.nan], "qty": [1, 2, 3]},
+        index=[10, 20, 30],
+    )
+
+
+# --- DatasetCache ---
+def test_dataset_cache_round_trip_keeps_index_and_metadata(tmp_path):
+    cache = DatasetCache(str(tmp_path))
+    df = _frame()
+    key = cache.make_key(b"raw upload", "1")
+    assert cache.get_entry(key) == (None, None)
+
+    assert cache.put(key, df, metadata={"profile": {"rows": 3}})
+    cached, metadata = cache.get_entry(key)
+    pd.testing.assert_frame_equal(cached, df)
+    assert metadata == {"profile": {"rows": 3}}
+
+
+def test_dataset_cache_keys_differ_by_version_and_variant(tmp_path):
+    cache = DatasetCache(str(tmp_path))
+    keys = {cache.make_key(b"x", "1"), cache.make_key(b"x", "2"), cache.make_key(b"x", "1", variant="Sheet2")}
+    assert len(keys) == 3
+
+
+def test_dataset_cache_evicts_least_recently_used(tmp_path):
+    cache = DatasetCache(str(tmp_path), max_bytes=1)
+    cache.put("old", _frame())
+    cache.put("new", _frame())
+    assert cache.get("old") is None
+
+
+# --- CompletionCache ---
+def test_completion_cache_memory_and_disk_tiers(tmp_path):
+    path = str(tmp_path / "completions.sqlite3")
+    cache = CompletionCache(path)
+    key = cache.make_key("model", "system", "prompt", temperature=0.1)
+    assert cache.get(key) is None
+    cache.put(key, "reply")
+    assert cache.get(key) == "reply"
+    assert cache.stats["memory_hits"] == 1
+
+    reopened = CompletionCache(path)
+    assert reopened.get(key) == "reply"
+    assert reopened.stats["disk_hits"] == 1
+
+
+def test_completion_cache_entries_expire(tmp_path):
+    cache = CompletionCache(str(tmp_path / "completions.sqlite3"), ttl=0)
+    cache.put("key", "reply")
+    assert cache.get("key") is None
+
+
+def test_completion_cache_delete_drops_both_tiers(tmp_path):
+    path = str(tmp_path / "completions.sqlite3")
+    cache = CompletionCache(path)
+    cache.put("key", "reply")
+    cache.delete("key")
+    assert cache.get("key") is None
+    assert CompletionCache(path).get("key") is None
+
+
+def test_failing_generated_code_is_not_replayed_from_cache(tmp_path, fake_client):
+    from agents import TalkingRabbit
+    from router import TEXT
+
+    client, completions = fake_client(lambda prompt: "result = df['missing'].sum()")
+    rabbit = TalkingRabbit(None, client=client, cache=CompletionCache(str(tmp_path / "c.sqlite3")),
+                           router=SimpleNamespace(route=lambda question, llm_classify: TEXT), backend="pandas")
+    df = pd.DataFrame({"sales": [1, 2, 3]})
+
+    for _ in range(2):
+        answer = rabbit.ask_question(df, "What are the total sales?", [])
+        assert "Error" in answer["answer"]
+    # Both turns reached the model: the failed reply was evicted
+    assert len(completions.requests) == 2
+
+
+def test_working_generated_code_is_cached(tmp_path, fake_client):
+    from agents import TalkingRabbit
+    from router import TEXT
+
+    client, completions = fake_client(
+        lambda prompt: "result = df['sales'].sum()" if "Pandas" in prompt else "The total is 6."
+    )
+    rabbit = TalkingRabbit(None, client=client, cache=CompletionCache(str(tmp_path / "c.sqlite3")),
+                           router=SimpleNamespace(route=lambda question, llm_classify: TEXT), backend="pandas")
+    df = pd.DataFrame({"sales": [1, 2, 3]})
+
+    assert rabbit.ask_question(df, "What are the total sales?", [])["answer"] == "The total is 6."
+    rabbit.question_cache.clear()
+    rabbit.ask_question(df, "What are the total sales?", [])
+    assert len(completions.requests) == 2  # Code and synthesis, each asked once
+
+
+# --- ResultCache ---
+def test_result_cache_is_bounded_by_bytes():
+    cache = ResultCache(max_bytes=3000)
+    for i in range(5):
+        cache.put(f"fp:{i}", np.zeros(100))  # ~800 bytes pickled
+    assert cache.get("fp:0") == (False, None)
+    assert cache.get("fp:4")[0]
+
+
+def test_result_cache_keys_ignore_formatting_and_forget_by_fingerprint():
+    cache = ResultCache()
+    key = ResultCache.make_key("fp", "result = df['a'].sum()  # total", ["result"])
+    assert key == ResultCache.make_key("fp", 'result = df["a"].sum()', ["result"])
+    cache.put(key, None)
+    assert cache.get(key) == (True, None)
+    cache.forget("fp")
+    assert cache.get(key) == (False, None)
+
+
+def test_dataset_fingerprint_tracks_content():
+    df = _frame()
+    assert dataset_fingerprint(df) == dataset_fingerprint(_frame())
+    assert dataset_fingerprint(df) != dataset_fingerprint(_frame().assign(qty=[1, 2, 4]))
+
+
+def test_dataset_fingerprint_follows_in_place_changes():
+    df = _frame()
+    before = dataset_fingerprint(df)
+    assert dataset_fingerprint(df) == before
+    df.loc[10, "qty"] = 100
+    changed = dataset_fingerprint(df)
+    assert changed != before
+    df["extra"] = 1
+    assert dataset_fingerprint(df) not in (before, changed)
+
+
+def test_frame_unchanged_without_copy_on_write(monkeypatch):
+    monkeypatch.setattr(cache, "COPY_ON_WRITE", False)
+    df = _frame()
+    snapshot = snapshot_frame(df)
+    assert frame_unchanged(df, snapshot)
+    df.loc[10, "qty"] = 100
+    assert not frame_unchanged(df, snapshot)
+
+
+def test_result_cache_misses_after_in_place_change():
+    cache = ResultCache()
+    df = _frame()
+    cache.put(ResultCache.make_key(dataset_fingerprint(df), "result = df['qty'].sum()"), 6)
+    df.loc[10, "qty"] = 100
+    assert cache.get(ResultCache.make_key(dataset_fingerprint(df), "result = df['qty'].sum()")) == (False, None)
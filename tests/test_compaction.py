@@ -0,0 +1,36 @@
+import numpy as np
+import pandas as pd
+
+from compaction import compact_dataframe, int_dtype_for, prune_categories
+
+
+def _frame(n=1000):
+    rng = np.random.default_rng(0)
+    return pd.DataFrame({
+        "region": rng.choice(["north", "south", "east"], n),
+        "qty": rng.integers(1, 100, n),
+        "price": rng.integers(1_000, 50_000, n),
+    })
+
+
+def test_low_cardinality_text_becomes_category_and_ints_shrink():
+    df = _frame()
+    out, report = compact_dataframe(df)
+    assert isinstance(out["region"].dtype, pd.CategoricalDtype)
+    assert out["qty"].dtype == np.int16
+    assert report["after_bytes"] < report["before_bytes"]
+    pd.testing.assert_frame_equal(out.astype(df.dtypes.to_dict()), df)
+
+
+def test_downcast_keeps_room_for_products():
+    df = _frame()
+    out, _ = compact_dataframe(df)
+    assert (out["price"] * out["price"]).max() == (df["price"] * df["price"]).max()
+    assert int_dtype_for(-100, 11) == np.int16
+    assert int_dtype_for(0, 2**40) == np.int64
+
+
+def test_filtered_value_counts_drop_unused_categories():
+    out, _ = compact_dataframe(_frame())
+    counts = prune_categories(out[out["region"] == "north"]["region"].value_counts())
+    assert list(counts.index) == ["north"]
@@ -0,0 +1,48 @@
+import numpy as np
+import pandas as pd
+import plotly.express as px
+
+from figures import MAX_CATEGORY_POINTS, MAX_HIST_POINTS, optimize_figure
+
+N = max(MAX_CATEGORY_POINTS, MAX_HIST_POINTS) + 1000
+
+
+def _frame():
+    rng = np.random.default_rng(0)
+    return pd.DataFrame({"region": rng.choice(["north", "south", "east"], N), "sales": rng.random(N) * 100})
+
+
+def test_bars_over_raw_rows_become_totals():
+    df = _frame()
+    fig, report = optimize_figure(px.bar(df, x="region", y="sales"))
+    totals = dict(zip(fig.data[0].x, fig.data[0].y))
+    expected = df.groupby("region")["sales"].sum()
+    assert totals == {k: expected[k] for k in totals} and len(totals) == 3
+    assert report["points_before"] == N and report["points_after"] == 3
+
+
+def test_pies_over_raw_rows_become_totals():
+    df = _frame()
+    fig, report = optimize_figure(px.pie(df, names="region"))
+    counts = dict(zip(fig.data[0].labels, fig.data[0].values))
+    assert counts == df["region"].value_counts().to_dict()
+    assert report["points_before"] == N
+
+
+def test_boxes_carry_precomputed_statistics():
+    df = _frame()
+    fig, _ = optimize_figure(px.box(df, x="region", y="sales"))
+    trace = fig.data[0]
+    assert trace.y is None and len(trace.q1) == 3
+    north = df.loc[df["region"] == trace.x[list(trace.x).index("north")], "sales"]
+    assert np.isclose(trace.median[list(trace.x).index("north")], north.median())
+
+
+def test_histograms_keep_requested_bin_count():
+    fig, _ = optimize_figure(px.histogram(_frame(), x="sales", nbins=7))
+    assert fig.data[0].type == "bar" and len(fig.data[0].x) == 7
+
+
+def test_small_figures_are_untouched():
+    fig = px.bar(_frame().head(100), x="region", y="sales")
+    assert optimize_figure(fig)[0] is fig
@@ -0,0 +1,86 @@
+import pytest
+
+from llm import LLMPool, LLMRequestError, RateLimitError, classify_error, estimate_tokens
+
+
+class _StatusError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+def _request():
+    return {"messages": [{"role": "user", "content": "hi"}], "model": "m", "temperature": 0.1}
+
+
+def test_complete_and_stream(fake_client):
+    client, completions = fake_client("hello there world")
+    pool = LLMPool(client)
+    assert pool.complete(**_request()) == "hello there world"
+    assert list(pool.stream(**_request())) == ["hello", "there", "world"]
+    assert len(completions.requests) == 2
+
+
+def test_retryable_errors_are_retried(fake_client, monkeypatch):
+    monkeypatch.setattr("llm.BASE_BACKOFF_SECONDS", 0.001)
+    replies = iter([_StatusError(429), _StatusError(503), "ok"])
+    client, completions = fake_client(lambda prompt: next(replies))
+    pool = LLMPool(client)
+    assert pool.complete(**_request()) == "ok"
+    assert pool.stats["retries"] == 2
+
+
+def test_request_errors_are_not_retried(fake_client):
+    client, completions = fake_client(lambda prompt: _StatusError(400))
+    pool = LLMPool(client)
+    with pytest.raises(LLMRequestError):
+        pool.complete(**_request())
+    assert len(completions.requests) == 1
+
+
+def test_classify_error():
+    error = classify_error(_StatusError(429))
+    assert isinstance(error, RateLimitError) and error.retryable
+    assert not classify_error(_StatusError(401)).retryable
+
+
+def test_estimate_tokens():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("abcde") == 2
+
+
+def test_concurrency_limit_is_shared_by_every_pool():
+    import asyncio
+    from concurrent.futures import ThreadPoolExecutor
+    from types import SimpleNamespace
+
+    import llm
+
+    state = {"active": 0, "peak": 0}
+
+    async def create(**request):
+        # Async like AsyncGroq, so the only limit on overlapping calls is the pool's semaphore
+        state["active"] += 1
+        state["peak"] = max(state["peak"], state["active"])
+        await asyncio.sleep(0.2)
+        state["active"] -= 1
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="ok"))])
+
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    pools = [LLMPool(client) for _ in range(2)]
+    with ThreadPoolExecutor(max_workers=2 * llm.MAX_CONCURRENCY) as executor:
+        list(executor.map(lambda i: pools[i % 2].complete(**_request()), range(2 * llm.MAX_CONCURRENCY)))
+    assert state["peak"] == llm.MAX_CONCURRENCY
+
+
+def test_pools_share_one_loop_thread_and_shutdown_stops_it(fake_client):
+    import llm
+
+    pools = [LLMPool(fake_client("ok")[0]) for _ in range(5)]
+    assert len({pool.loop for pool in pools}) == 1
+    thread = llm._get_runtime()[1]
+
+    llm.shutdown()
+    assert not thread.is_alive() and pools[0].loop.is_closed()
+    # The next pool starts a fresh loop
+    assert LLMPool(fake_client("ok")[0]).complete(**_request()) == "ok"
@@ -0,0 +1,15 @@
+import numpy as np
+import pandas as pd
+
+from result_summary import summarize_result
+
+
+def test_numpy_scalars_read_as_plain_values():
+    assert summarize_result(np.int64(2935933)) == "2,935,933"
+    assert summarize_result(np.bool_(True)) == "True"
+    assert summarize_result(np.float64(0.25)) == "0.25"
+
+
+def test_series_stats_use_plain_values():
+    text = summarize_result(pd.Series([1, 2, 3], dtype="int32"))
+    assert "sum 6" in text and "np." not in text
@@ -0,0 +1,79 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from compaction import compact_dataframe
+from dataset_profile import DatasetProfile, register_profile
+from rollups import RollupCube
+from sandbox import exec_generated
+
+N = 5_000
+
+
+@pytest.fixture(scope="module")
+def df():
+    rng = np.random.default_rng(0)
+    frame = pd.DataFrame({
+        "region": rng.choice(["north", "south", "east", "west"], N),
+        "channel": rng.choice(["web", "store"], N),
+        "qty": rng.integers(1, 50, N),
+        "sales": rng.random(N) * 100,
+        "date": pd.Timestamp("2022-01-01") + pd.to_timedelta(rng.integers(0, 3 * 365, N), unit="D"),
+    })
+    frame.loc[::7, "sales"] = np.nan  # count differs from size
+    frame, _ = compact_dataframe(frame)
+    register_profile(frame, DatasetProfile.build(frame))
+    return frame
+
+
+@pytest.fixture(scope="module")
+def cube(df):
+    return RollupCube.build(df)
+
+
+def _run(code, frame):
+    return exec_generated(code, {"df": frame, "pd": pd})["result"]
+
+
+@pytest.mark.parametrize("code", [
+    "result = df.groupby('region')['sales'].sum()",
+    "result = df.groupby('region')['sales'].mean()",
+    "result = df.groupby('region')['sales'].count()",
+    "result = df.groupby('region').size()",
+    "result = df.groupby('region')['qty'].size()",
+    "result = df.groupby('region')[['sales', 'qty']].sum()",
+    "result = df.groupby(df['region'])['sales'].agg('mean')",
+    "result = df.groupby(df['date'].dt.year)['sales'].sum()",
+    "result = df.groupby(df['date'].dt.month)['qty'].mean()",
+    "result = df.groupby(df['date'].dt.to_period('Q'))['sales'].count()",
+    "result = df.groupby(['region', 'channel'])['sales'].sum()",
+    "result = df.groupby(['channel', df['date'].dt.year])['qty'].sum().unstack()",
+    "result = df.groupby('region', as_index=False)['sales'].sum()",
+    "result = df.groupby(['region', 'channel'], as_index=False)[['sales', 'qty']].mean()",
+    "result = df.groupby('region')['sales'].sum().sort_values(ascending=False).head(2)",
+])
+def test_rewritten_code_matches_the_full_frame(df, cube, code):
+    match = cube.rewrite(code)
+    assert match is not None
+    rewritten, rollup = match
+    assert len(rollup) < len(df)
+    expected, actual = _run(code, df), _run(rewritten, rollup)
+    if isinstance(expected, pd.DataFrame):
+        pd.testing.assert_frame_equal(actual, expected)
+    else:
+        pd.testing.assert_series_equal(actual, expected)
+
+
+@pytest.mark.parametrize("code", [
+    "result = df['sales'].sum()",                                        # no grouping
+    "result = df[df['qty'] > 3].groupby('region')['sales'].sum()",       # filtered first
+    "result = df.groupby('region')['sales'].median()",                   # not precomputed
+    "result = df.groupby('region')['sales'].sum() / df['sales'].sum()",  # also reads the full frame
+    "result = df.groupby('region', as_index=False).size()",              # pandas adds a "size" column
+    "result = df.groupby('region', observed=False)['sales'].sum()",      # unobserved categories
+    "result = df.groupby('region', dropna=False)['sales'].sum()",        # NaN keys
+    "result = df.groupby('sales')['qty'].sum()",                         # floats are not group keys
+    "result = (df.groupby('region')['sales'].sum(), df.groupby('channel')['sales'].sum())",
+])
+def test_other_code_is_not_rewritten(cube, code):
+    assert cube.rewrite(code) is None
@@ -0,0 +1,63 @@
+import pandas as pd
+import plotly.graph_objects as go
+import pytest
+
+from sandbox import GeneratedCodeError, SandboxExecutor, SandboxTimeout
+
+
+@pytest.fixture(scope="module")
+def sandbox():
+    executor = SandboxExecutor(workers=1, wall_timeout=5.0)
+    yield executor
+    executor.shutdown()
+
+
+@pytest.fixture(scope="module")
+def df():
+    return pd.DataFrame({"region": ["north", "south", "north"], "sales": [1.0, 2.0, 4.0]})
+
+
+def test_returns_values(sandbox, df):
+    result = sandbox.run("result = df.groupby('region')['sales'].sum()", df, ["result"])
+    pd.testing.assert_series_equal(result, df.groupby("region")["sales"].sum())
+
+
+def test_returns_serialized_figures(sandbox, df):
+    report = {}
+    fig = sandbox.run("fig = px.bar(df, x='region', y='sales')", df, ["fig"], report)
+    assert isinstance(fig, go.Figure)
+    assert report["figure_json"] and report["payload_bytes"] == len(report["figure_json"])
+
+
+def test_errors_in_generated_code(sandbox, df):
+    with pytest.raises(GeneratedCodeError, match="KeyError"):
+        sandbox.run("result = df['missing']", df, ["result"])
+
+
+def test_wall_clock_timeout_replaces_the_worker(df):
+    executor = SandboxExecutor(workers=1, wall_timeout=3.0)
+    try:
+        with pytest.raises(SandboxTimeout):
+            executor.run("import time\ntime.sleep(30)", df, ["result"])
+        assert executor.run("result = len(df)", df, ["result"]) == 3
+    finally:
+        executor.shutdown()
+
+
+def test_keeps_the_index(sandbox):
+    df = pd.DataFrame({"sales": [5.0, 1.0, 9.0]}, index=[7, 3, 1])
+    assert sandbox.run("result = df['sales'].idxmax()", df, ["result"]) == 1
+
+
+def test_jobs_do_not_see_earlier_mutations(sandbox, df):
+    sandbox.run("df['sales'] = 0\ndf.drop(index=0, inplace=True)\nresult = 1", df, ["result"])
+    assert sandbox.run("result = df['sales'].sum()", df, ["result"]) == 7.0
+
+
+def test_large_results_are_cut_and_flagged(sandbox, df):
+    report = {}
+    result = sandbox.run("result = pd.DataFrame({'x': range(2_000_000)})", df, ["result"], report)
+    assert report["truncated"] and 0 < len(result) < 2_000_000
+    report = {}
+    sandbox.run("result = df['sales'].sum()", df, ["result"], report)
+    assert report["truncated"] is False
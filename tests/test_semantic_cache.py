@@ -0,0 +1,36 @@
+from semantic_cache import SemanticQuestionCache, code_literals
+
+COLUMNS = ["region", "sales", "date"]
+EUROPE_CODE = "result = df[df['region'] == 'Europe']['sales'].sum()"
+
+
+def _cache():
+    cache = SemanticQuestionCache()
+    cache.add("fp", "What were total sales in Europe?", "text", EUROPE_CODE, COLUMNS)
+    return cache
+
+
+def test_rephrased_question_reuses_code():
+    match = _cache().lookup("fp", "total sales for europe?", COLUMNS)
+    assert match and match["code"] == EUROPE_CODE
+
+
+def test_different_filter_value_is_not_reused():
+    assert _cache().lookup("fp", "What were total sales in Asia?", COLUMNS) is None
+
+
+def test_different_aggregate_or_dataset_is_not_reused():
+    cache = _cache()
+    assert cache.lookup("fp", "What were average sales in Europe?", COLUMNS) is None
+    assert cache.lookup("other", "What were total sales in Europe?", COLUMNS) is None
+
+
+def test_code_literals_skip_column_names():
+    assert code_literals(EUROPE_CODE, COLUMNS) == {"europe"}
+    assert code_literals('SELECT SUM("sales") FROM df WHERE "region" = \'North America\'', COLUMNS) == {"north", "america"}
+
+
+def test_rekey_carries_questions_to_the_new_dataset():
+    cache = _cache()
+    cache.rekey("fp", "fp2")
+    assert cache.lookup("fp2", "total sales for europe?", COLUMNS)
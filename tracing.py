@@ -0,0 +1,178 @@
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+
+from cache import CACHE_ROOT
+
+# --- Configuration ---
+TRACING_ENABLED = os.environ.get("TALKING_RABBITT_TRACING", "1") != "0"
+TRACE_FILE = os.environ.get("TALKING_RABBITT_TRACE_FILE", os.path.join(CACHE_ROOT, "traces", "spans.jsonl"))
+MAX_SPANS_IN_MEMORY = 2000
+TRACE_FILE_BYTES = 50 * 1024 ** 2   # The JSONL file is rotated to "<file>.1" beyond this size
+FLUSH_EVERY = 50                    # Finished spans buffered before they are appended to the file
+
+_current = contextvars.ContextVar("talking_rabbitt_span", default=None)
+
+
+class Span:
+    """One timed unit of work. Attributes can be added while it runs with `set()`."""
+
+    def __init__(self, name: str, trace_id: str, parent_id: str, attrs: dict, session: str = None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.session = session
+        self.attrs = attrs
+        self.error = None
+        self.start = time.time()
+        self._t0 = time.perf_counter()
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def fail(self, error):
+        """Marks the span as failed without raising (for errors that are handled)."""
+        self.error = str(error)
+
+
+class Tracer:
+    """
+    Lightweight in-process tracer. Spans nest through a context variable
+    (copy the context when handing work to a thread pool), are kept in a
+    bounded in-memory buffer for the debug panel and appended to a JSONL
+    file. Every trace is tagged with the session that started it (see
+    `session_of`), so one user's panel only shows their own spans.
+    Disabled tracing costs one branch per span.
+    """
+
+    def __init__(self, path: str = TRACE_FILE, enabled: bool = TRACING_ENABLED,
+                 max_spans: int = MAX_SPANS_IN_MEMORY):
+        self.path = path
+        self.enabled = enabled
+        self.spans = deque(maxlen=max_spans)
+        self.session_of = None  # Callable returning the current session id, asked when a trace starts
+        self._pending = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name: str, **attrs):
+        if not self.enabled:
+            yield Span(name, "", None, attrs)
+            return
+        span = self._new_span(name, attrs)
+        parent = _current.get()
+        token = _current.set(span)
+        status, error = "ok", None
+        try:
+            yield span
+        except BaseException as e:
+            status, error = "error", f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            _current.reset(token)
+            if span.error and status == "ok":
+                status, error = "error", span.error
+            self._finish(span, time.perf_counter() - span._t0, status, error, root=parent is None)
+
+    def record(self, name: str, seconds: float, error: str = None, **attrs):
+        """Adds an already-measured span (e.g. a stream consumed elsewhere) under the current span."""
+        if not self.enabled:
+            return
+        span = self._new_span(name, attrs)
+        parent = _current.get()
+        span.start -= seconds
+        self._finish(span, seconds, "error" if error else "ok", error, root=parent is None)
+
+    def _new_span(self, name, attrs):
+        parent = _current.get()
+        if parent is not None:
+            return Span(name, parent.trace_id, parent.span_id, attrs, parent.session)
+        return Span(name, uuid.uuid4().hex[:16], None, attrs, self.session_of() if self.session_of else None)
+
+    def _finish(self, span, seconds, status, error, root):
+        entry = {
+            "trace_id": span.trace_id, "span_id": span.span_id, "parent_id": span.parent_id,
+            "name": span.name, "start": span.start, "duration_ms": round(seconds * 1000, 3),
+            "status": status, "session": span.session, "attrs": span.attrs,
+        }
+        if error:
+            entry["error"] = error
+        with self._lock:
+            self.spans.append(entry)
+            self._pending.append(entry)
+            if root or len(self._pending) >= FLUSH_EVERY:
+                self._flush_locked()
+
+    def _flush_locked(self):
+        if not self._pending or not self.path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            if os.path.exists(self.path) and os.path.getsize(self.path) > TRACE_FILE_BYTES:
+                os.replace(self.path, self.path + ".1")
+            with open(self.path, "a", encoding="utf-8") as f:
+                for entry in self._pending:
+                    f.write(json.dumps(entry, default=str) + "\n")
+        except OSError as e:
+            print(f"Trace export failed: {e}")
+        self._pending = []
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def _session_spans(self, session):
+        with self._lock:
+            return [entry for entry in self.spans if session is None or entry["session"] == session]
+
+    def recent_traces(self, limit: int = 10, session: str = None) -> list:
+        """
+        The most recent traces (of one session, if given) as lists of spans
+        (oldest span first), newest trace first.
+        """
+        spans = self._session_spans(session)
+        traces = {}
+        for entry in spans:
+            traces.setdefault(entry["trace_id"], []).append(entry)
+        ordered = sorted(traces.values(), key=lambda t: max(s["start"] for s in t), reverse=True)
+        return [sorted(t, key=lambda s: s["start"]) for t in ordered[:limit]]
+
+    def export_jsonl(self, session: str = None) -> str:
+        """Every span still in memory (of one session, if given), one JSON object per line."""
+        return "".join(json.dumps(entry, default=str) + "\n" for entry in self._session_spans(session))
+
+
+_tracer = Tracer()
+
+
+def get_tracer() -> Tracer:
+    """Process-wide tracer."""
+    return _tracer
+
+
+def span(name: str, **attrs):
+    """Shorthand for `get_tracer().span(...)`."""
+    return _tracer.span(name, **attrs)
+
+
+def traced(name: str, **attrs):
+    """Decorator that runs every call of the function inside a span."""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with _tracer.span(name, **attrs):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def current_span() -> Span:
+    """The innermost open span (a detached one when there is none), e.g. to add attributes."""
+    return _current.get() or Span("detached", "", None, {})
@@ -0,0 +1,297 @@
+import contextvars
+import hashlib
+import io
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout
+
+try:
+    from gtts import gTTS
+except ImportError:
+    gTTS = None
+
+try:
+    import pyttsx3  # Offline engine (SAPI5 / NSSpeechSynthesizer / eSpeak)
+except ImportError:
+    pyttsx3 = None
+
+from tracing import traced, current_span
+
+# --- Configuration ---
+TTS_ENGINE = os.environ.get("TALKING_RABBITT_TTS", "gtts")  # Preferred engine; others are fallbacks
+TTS_WORKERS = 2                 # Sentences synthesized in parallel
+AUDIO_CACHE_BYTES = 64 * 1024 ** 2
+MIN_SENTENCE_CHARS = 20         # Shorter fragments are merged with the next sentence
+SENTENCE_TIMEOUT_SECONDS = 15.0
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+# --- Engines ---
+class TTSEngine:
+    """Interface for speech engines: `synthesize(text, lang)` returns encoded audio bytes."""
+
+    name = ""
+    mime = ""
+
+    def synthesize(self, text: str, lang: str) -> bytes:
+        raise NotImplementedError
+
+
+class GTTSEngine(TTSEngine):
+    """Google Translate TTS (network, MP3)."""
+
+    name = "gtts"
+    mime = "audio/mp3"
+
+    def synthesize(self, text, lang):
+        buffer = io.BytesIO()
+        gTTS(text=text, lang=lang).write_to_fp(buffer)
+        return buffer.getvalue()
+
+
+class Pyttsx3Engine(TTSEngine):
+    """Local system voices through pyttsx3 (offline, WAV), using an installed voice for the language."""
+
+    name = "pyttsx3"
+    mime = "audio/wav"
+    _lock = threading.Lock()  # The underlying drivers are not thread-safe
+    _voices = {}              # lang -> voice id
+
+    @staticmethod
+    def _voice_for(engine, lang):
+        # Voices list tags like "en_US" or b"\x05en-us" (eSpeak); SAPI5 only names them, e.g. "..._EN-US_ZIRA"
+        pattern = re.compile(rf"(^|[^a-z]){re.escape(lang.lower())}([^a-z]|$)")
+        for voice in engine.getProperty("voices"):
+            tags = [t.decode(errors="ignore") if isinstance(t, bytes) else str(t) for t in voice.languages or []]
+            if any(pattern.search(t.lower()) for t in tags + [voice.id]):
+                return voice.id
+        raise ValueError(f"No installed voice speaks '{lang}'")
+
+    def synthesize(self, text, lang):
+        fd, path = tempfile.mkstemp(suffix=".wav")
+        os.close(fd)
+        try:
+            with self._lock:
+                engine = pyttsx3.init()
+                if lang not in self._voices:
+                    self._voices[lang] = self._voice_for(engine, lang)
+                engine.setProperty("voice", self._voices[lang])
+                engine.save_to_file(text, path)
+                engine.runAndWait()
+            with open(path, "rb") as f:
+                return f.read()
+        finally:
+            os.remove(path)
+
+
+def available_engines(preferred: str = TTS_ENGINE) -> list:
+    """Installed engines, the preferred one first."""
+    engines = []
+    if gTTS is not None:
+        engines.append(GTTSEngine())
+    if pyttsx3 is not None:
+        engines.append(Pyttsx3Engine())
+    engines.sort(key=lambda engine: engine.name != preferred)
+    return engines
+
+
+def split_sentences(text: str) -> list:
+    """Splits text into speakable sentences, merging fragments that are too short."""
+    sentences = []
+    for part in _SENTENCE_END.split(text.strip()):
+        if sentences and len(sentences[-1]) < MIN_SENTENCE_CHARS:
+            sentences[-1] = f"{sentences[-1]} {part}"
+        elif part:
+            sentences.append(part)
+    return sentences
+
+
+# --- Cache ---
+class AudioCache:
+    """In-memory LRU of synthesized audio keyed by (text, language, engine), bounded in bytes."""
+
+    def __init__(self, max_bytes: int = AUDIO_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(text: str, lang: str, engine: str) -> str:
+        return hashlib.sha256(f"{engine}\0{lang}\0{text}".encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return value
+
+    def put(self, key, audio: bytes, mime: str):
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = (audio, mime)
+            self._bytes += len(audio)
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                _, (old, _) = self._entries.popitem(last=False)
+                self._bytes -= len(old)
+                self.stats["evictions"] += 1
+
+
+# --- Pipeline ---
+class SpeechJob:
+    """
+    One spoken answer. Text is fed in as it streams; every completed sentence
+    is queued for background synthesis right away. Audio is handed out in
+    sentence order: `ready()` gives what has finished so far without
+    blocking, `chunks()` waits for the rest.
+    """
+
+    def __init__(self, pipeline, lang: str):
+        self.pipeline = pipeline
+        self.lang = lang
+        self.start = time.perf_counter()
+        # first_audio_seconds: from the question to the first audio handed to the player
+        self.stats = {"sentences": 0, "first_audio_seconds": None, "failed": 0}
+        self._buffer = ""
+        self._futures = []
+        self._emitted = 0  # Sentences already handed out
+
+    def _submit(self, sentence: str):
+        # Synthesis spans are traced under whatever span was open when the sentence was queued
+        future = self.pipeline.executor.submit(contextvars.copy_context().run,
+                                               self.pipeline.synthesize, sentence, self.lang)
+        self._futures.append(future)
+        self.stats["sentences"] += 1
+
+    def feed(self, delta: str):
+        """Adds streamed text; complete sentences start synthesizing immediately."""
+        self._buffer += delta
+        ends = [m.end() for m in _SENTENCE_END.finditer(self._buffer)]
+        if not ends:
+            return
+        sentences = split_sentences(self._buffer[:ends[-1]])
+        rest = self._buffer[ends[-1]:]
+        # A short trailing sentence waits to be merged with the next one
+        if sentences and len(sentences[-1]) < MIN_SENTENCE_CHARS:
+            rest = f"{sentences.pop()} {rest}"
+        for sentence in sentences:
+            self._submit(sentence)
+        self._buffer = rest
+
+    def finish(self):
+        """Queues whatever text is left once the answer is complete."""
+        if self._buffer.strip():
+            self._submit(self._buffer.strip())
+        self._buffer = ""
+
+    def tee(self, chunks, on_audio=None):
+        """
+        Passes text chunks (or a plain string) through while feeding them to
+        the job. After each chunk, `on_audio(audio, mime)` is called for every
+        sentence whose audio is ready, so playback starts mid-stream.
+        """
+        if isinstance(chunks, str):
+            chunks = [chunks]
+        for chunk in chunks:
+            self.feed(chunk)
+            yield chunk
+            if on_audio is not None:
+                for audio, mime in self.ready():
+                    on_audio(audio, mime)
+        self.finish()
+
+    def _next(self, timeout):
+        future = self._futures[self._emitted]
+        self._emitted += 1
+        try:
+            audio = future.result(timeout=timeout)
+        except FuturesTimeout:
+            self.stats["failed"] += 1
+            print(f"Speech synthesis exceeded {timeout}s, skipping sentence")
+            return None
+        except Exception as e:
+            self.stats["failed"] += 1
+            print(f"Speech synthesis failed: {e}")
+            return None
+        if self.stats["first_audio_seconds"] is None:
+            self.stats["first_audio_seconds"] = time.perf_counter() - self.start
+        return audio
+
+    def ready(self):
+        """Yields (audio bytes, mime) for the next sentences that are already synthesized."""
+        while self._emitted < len(self._futures) and self._futures[self._emitted].done():
+            audio = self._next(0)
+            if audio is not None:
+                yield audio
+
+    def chunks(self, timeout: float = SENTENCE_TIMEOUT_SECONDS):
+        """Yields (audio bytes, mime) for every sentence not handed out yet, in order; failed sentences are skipped."""
+        while self._emitted < len(self._futures):
+            audio = self._next(timeout)
+            if audio is not None:
+                yield audio
+
+
+class TTSPipeline:
+    """
+    Sentence-by-sentence speech synthesis on a background thread pool, with a
+    shared audio cache and engine fallback (e.g. gTTS, then an offline voice).
+    """
+
+    def __init__(self, engines: list = None, cache: AudioCache = None, workers: int = TTS_WORKERS):
+        self.engines = engines if engines is not None else available_engines()
+        self.cache = cache if cache is not None else AudioCache()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tts")
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.engines)
+
+    @traced("tts.synthesize")
+    def synthesize(self, text: str, lang: str):
+        """Returns (audio bytes, mime) for one sentence, from the cache when possible."""
+        span = current_span()
+        span.set(chars=len(text))
+        for engine in self.engines:
+            cached = self.cache.get(AudioCache.make_key(text, lang, engine.name))
+            if cached is not None:
+                span.set(engine=engine.name, cached=True, audio_bytes=len(cached[0]))
+                return cached
+        error = None
+        for engine in self.engines:
+            try:
+                audio = engine.synthesize(text, lang)
+            except Exception as e:
+                error = e
+                continue
+            self.cache.put(AudioCache.make_key(text, lang, engine.name), audio, engine.mime)
+            span.set(engine=engine.name, cached=False, audio_bytes=len(audio))
+            return audio, engine.mime
+        raise RuntimeError(f"No speech engine could synthesize the text ({error})")
+
+    def start(self, lang: str = "en") -> SpeechJob:
+        return SpeechJob(self, lang)
+
+
+_pipeline = None
+_pipeline_lock = threading.Lock()
+
+
+def default_tts_pipeline() -> TTSPipeline:
+    """Process-wide pipeline, so the audio cache is shared across sessions."""
+    global _pipeline
+    with _pipeline_lock:
+        if _pipeline is None:
+            _pipeline = TTSPipeline()
+        return _pipeline
@@ -1,4 +1,9 @@
+import json
+
 import streamlit as st
+import streamlit.components.v1 as components
+
+from tracing import span, traced, current_span
 
 def inject_custom_css():
     st.markdown("""
@@ -156,12 +161,16 @@ def render_header():
     </div>
     """, unsafe_allow_html=True)
 
-def render_chat_message(message, key_prefix=""):
-    """Render a single chat message with text, code, and optional visualization."""
+def render_chat_message(message, key_prefix="", show_figure=False):
+    """
+    Render a single chat message with text, code, and optional visualization.
+    Charts stay collapsed behind a toggle unless `show_figure` is set.
+    """
     role = message.get("role", "user")
     content = message.get("content", "")
     code = message.get("code")
     figure = message.get("figure")
+    language = message.get("language", "python")
     
     # Determine message class
     msg_class = "user-message" if role == "user" else "assistant-message"
@@ -172,12 +181,96 @@ def render_chat_message(message, key_prefix=""):
     # Render code if present (only for assistant)
     if role == "assistant" and code:
         with st.expander("📝 View Code", expanded=False):
-            st.code(code, language="python")
+            st.code(code, language=language)
     
     # Render figure if present (only for assistant)
     if role == "assistant" and figure:
-        try:
-            st.plotly_chart(figure, use_container_width=True, key=f"{key_prefix}_chart")
-        except Exception as e:
-            st.error(f"Could not render chart: {str(e)[:100]}")
+        # A collapsed chart isn't sent to the browser at all until it is opened
+        if st.toggle("📊 Show chart", value=show_figure, key=f"{key_prefix}_show_chart"):
+            try:
+                render_figure(figure, key=f"{key_prefix}_chart")
+            except Exception as e:
+                st.error(f"Could not render chart: {str(e)[:100]}")
+
+@traced("render.figure")
+def render_figure(figure, key=None):
+    """
+    Render a Plotly figure. The Figure object is passed as is: Streamlit
+    serializes it without validation, whereas a dict spec would be rebuilt and
+    re-validated on every rerun.
+    """
+    current_span().set(key=key)
+    st.plotly_chart(figure, use_container_width=True, key=key)
+
+def render_audio_queue(chunks):
+    """
+    Queue base64 audio chunks for autoplay, e.g. one per sentence as it is
+    synthesized. `chunks` is a list of (base64 data, mime type) pairs. Every
+    call feeds one player on the app page, so chunks from separate calls
+    (and reruns) play back to back instead of over each other.
+    """
+    sources = json.dumps([f"data:{mime};base64,{data}" for data, mime in chunks])
+    components.html(f"""
+    <script>
+        const doc = window.parent.document;
+        let player = doc.getElementById("rabbitt-audio");
+        if (!player) {{
+            player = doc.createElement("audio");
+            player.id = "rabbitt-audio";
+            player.queue = new window.parent.Array();
+            // Handler compiled in the app page, so it outlives this frame
+            player.setAttribute("onended", "if (this.queue.length) {{ this.src = this.queue.shift(); this.play(); }}");
+            doc.body.appendChild(player);
+        }}
+        player.queue.push(...{sources});
+        if (player.paused && player.queue.length) {{ player.src = player.queue.shift(); player.play(); }}
+    </script>
+    """, height=0)
+
+def stream_chat_message(chunks):
+    """
+    Render an assistant bubble that fills in as text chunks arrive.
+    Accepts a plain string too. Returns the full text.
+    """
+    if isinstance(chunks, str):
+        chunks = [chunks]
+    placeholder = st.empty()
+    text = ""
+    with span("render.answer") as answer_span:
+        for chunk in chunks:
+            text += chunk
+            placeholder.markdown(f'<div class="chat-message assistant-message">{text}▌</div>', unsafe_allow_html=True)
+        placeholder.markdown(f'<div class="chat-message assistant-message">{text}</div>', unsafe_allow_html=True)
+        answer_span.set(chars=len(text))
+    return text
 
+def render_trace_panel(tracer, limit=5, session=None):
+    """
+    Render the most recent traces as one table of spans each (nested names,
+    durations, status and attributes), plus a JSONL download of every span
+    still held in memory. With `session`, only that session's traces are shown.
+    """
+    traces = tracer.recent_traces(limit, session=session)
+    if not traces:
+        st.caption("No traces recorded yet.")
+        return
+    for spans in traces:
+        by_id = {s["span_id"]: s for s in spans}
+        def depth(s):
+            return depth(by_id[s["parent_id"]]) + 1 if s["parent_id"] in by_id else 0
+        roots = [s for s in spans if s["parent_id"] not in by_id]
+        errors = sum(s["status"] == "error" for s in spans)
+        label = f"**{roots[0]['name']}** · {sum(r['duration_ms'] for r in roots):,.0f} ms · {len(spans)} spans"
+        st.markdown(label + (f" · ⚠️ {errors} failed" if errors else ""))
+        st.dataframe([
+            {
+                "span": "  " * depth(s) + s["name"],
+                "ms": round(s["duration_ms"], 1),
+                "status": s.get("error") or s["status"],
+                "attributes": json.dumps(s["attrs"], default=str),
+            }
+            for s in spans
+        ], hide_index=True, use_container_width=True)
+    st.download_button("⬇ Export traces (JSONL)", tracer.export_jsonl(session), file_name="traces.jsonl",
+                       mime="application/jsonl", use_container_width=True)
+    st.caption(f"Also appended to `{tracer.path}`")